@@ -1,33 +1,29 @@
-import requests
+import sys
 
-def recognize_entities_with_hanlp_api(text, api_token):
-    try:
-        url = "http://comdo.hanlp.com/hanlp/v21/ner/ner"
-        headers = {
-            "token": api_token  # 直接使用 token 而不是 Bearer 方案
-        }
-        data = {
-            "text": text
-        }
-
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()
-
-        result = response.json()
-        return result
-    except Exception as e:
-        return {"error": str(e)}
+from remote_ner import RemoteNerClient
 
+# 用法：python api_test.py [接口地址]，不指定时调用HanLP在线接口；
+# 可以先运行 python ner_stub_server.py，再用 http://127.0.0.1:8765/ner 在本地测试
 
 # 您的API token
 api_token = "2f41e8c978a0452291b8a12e10ecee101701132175415token"
+url = sys.argv[1] if len(sys.argv) > 1 else "http://comdo.hanlp.com/hanlp/v21/ner/ner"
 
 # 要进行实体命名识别的文本
-input_text = "这是一段需要进行实体命名识别的文本，例如识别人名、地名等实体。孙中山是开国元勋吗？"
-
-# 调用API进行实体命名识别
-api_result = recognize_entities_with_hanlp_api(input_text, api_token)
+input_texts = [
+    "这是一段需要进行实体命名识别的文本，例如识别人名、地名等实体。",
+    "孙中山是开国元勋吗？",
+]
+
+# 调用API进行实体命名识别，多个段落合并为一个请求
+client = RemoteNerClient(url, api_token)
+try:
+    api_result = client.recognize(input_texts)
+finally:
+    client.close()
 
 # 打印识别结果
 print("实体命名识别结果：")
-print(api_result)
+for text, entities in zip(input_texts, api_result):
+    print(text, entities)
+print(f"请求次数：{client.requests_sent}")
@@ -0,0 +1,138 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from desensitize_core import batch_ner, DEFAULT_BATCH_SIZE
+
+# 按长度分桶的动态批处理：数据块从几个字到126个字不等，混在一批里时短的要补齐到最长的长度，
+# 大部分计算浪费在补齐上。调度器把待识别的数据块按长度分桶，桶满一批立即送入模型，
+# 不满的在等待max_wait秒后与其他到期的数据块按长度排序凑批，结果按提交顺序返回给各自的调用方。
+# 调度器实现了recognize(chunks)，可以直接作为ner_model传给desensitize_core中的函数；
+# 多个线程同时提交时（如网页版的多个请求）共用批次，模型只在调度线程中调用
+
+# 等待凑批的最长时间（秒），越大批次越满、单个请求的延迟越高；单线程批量处理时可设为0
+DEFAULT_MAX_WAIT = 0.02
+# 长度相差在此范围内的数据块放在同一个桶里
+DEFAULT_BUCKET_WIDTH = 16
+# 单线程批量处理时每次提交的批数，提交的数据块越多，分桶后每批的长度越接近
+WINDOW_BATCHES = 4
+
+
+class _Request:
+    def __init__(self, count):
+        self.future = Future()
+        self.results = [None] * count
+        self.remaining = count
+
+
+class BatchScheduler:
+    def __init__(self, ner_model, batch_size=DEFAULT_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 bucket_width=DEFAULT_BUCKET_WIDTH):
+        self.ner_model = ner_model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.bucket_width = bucket_width
+        # 桶序号 -> [(到期时间, 请求, 序号, 数据块)]，同一个桶内按提交顺序排列
+        self._buckets = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.batches = 0
+        self.chunks = 0
+        self.padding_chars = 0
+        self.full_batches = 0
+
+    # 提交一组数据块，返回Future，结果为与chunks一一对应的实体列表
+    def submit(self, chunks):
+        chunks = list(chunks)
+        request = _Request(len(chunks))
+        if not chunks:
+            request.future.set_result([])
+            return request.future
+        deadline = time.monotonic() + self.max_wait
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('批处理调度器已关闭')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+                self._thread.start()
+            for index, chunk in enumerate(chunks):
+                key = max(len(chunk) - 1, 0) // self.bucket_width
+                self._buckets.setdefault(key, []).append((deadline, request, index, chunk))
+            self._condition.notify()
+        return request.future
+
+    def recognize(self, chunks):
+        return self.submit(chunks).result()
+
+    # 取出下一批：优先取已满的桶，其次把所有到期的数据块按长度排序后取一批；都没有时等待
+    def _next_batch(self):
+        while True:
+            for key, items in self._buckets.items():
+                if len(items) >= self.batch_size:
+                    self._buckets[key] = items[self.batch_size:]
+                    if not self._buckets[key]:
+                        del self._buckets[key]
+                    self.full_batches += 1
+                    return items[:self.batch_size]
+            if not self._buckets:
+                if self._closed:
+                    return None
+                self._condition.wait()
+                continue
+            now = time.monotonic()
+            oldest = min(items[0][0] for items in self._buckets.values())
+            if oldest > now and not self._closed:
+                self._condition.wait(oldest - now)
+                continue
+            expired = sorted((item for items in self._buckets.values() for item in items
+                              if item[0] <= now or self._closed), key=lambda item: len(item[3]))
+            batch = expired[:self.batch_size]
+            taken = {id(item) for item in batch}
+            for key in list(self._buckets):
+                items = [item for item in self._buckets[key] if id(item) not in taken]
+                if items:
+                    self._buckets[key] = items
+                else:
+                    del self._buckets[key]
+            return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._next_batch()
+            if batch is None:
+                return
+            # 已经失败的请求剩下的数据块不再识别
+            batch = [item for item in batch if not item[1].future.done()]
+            if not batch:
+                continue
+            chunks = [item[3] for item in batch]
+            try:
+                entities_list = batch_ner(self.ner_model, chunks, self.batch_size)
+            except Exception as e:
+                for item in batch:
+                    if not item[1].future.done():
+                        item[1].future.set_exception(e)
+                continue
+            self.batches += 1
+            self.chunks += len(chunks)
+            self.padding_chars += max(len(chunk) for chunk in chunks) * len(chunks) - sum(len(chunk) for chunk in chunks)
+            for (deadline, request, index, chunk), entities in zip(batch, entities_list):
+                request.results[index] = entities
+                request.remaining -= 1
+                if request.remaining == 0:
+                    request.future.set_result(request.results)
+
+    def summary(self):
+        average = self.chunks / self.batches if self.batches else 0
+        return (f"批处理调度：{self.batches}批，平均每批{average:.1f}个数据块，"
+                f"满批{self.full_batches}次，补齐{self.padding_chars}字")
+
+    # 处理完已提交的数据块后停止调度线程
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
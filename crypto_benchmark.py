@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from cryptography.fernet import Fernet
+
+from stream_crypto import encrypt_chunks_to_file, decrypt_file, generate_key, DEFAULT_SEGMENT_SIZE
+
+# 比较分段加密格式与旧版整体Fernet加密的加解密吞吐量和内存峰值（tracemalloc统计的Python内存）
+# 用法：python crypto_benchmark.py --size-mb 64 [--segment-size 65536] [--json]
+
+TEXT_CHARS = '张三李四北京市审计局有限公司的了是在，。0123456789abcdef\n'
+
+
+def synthetic_chunks(size_mb, seed=0):
+    rng = random.Random(seed)
+    # 每个数据块约126个字，与脱敏输出相同
+    chunk_count = size_mb * 1024 * 1024 // (126 * 3)
+    return [''.join(rng.choices(TEXT_CHARS, k=126)) for _ in range(chunk_count)]
+
+
+# tracemalloc会拖慢内存分配，耗时和内存峰值分两次运行统计
+def measure(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def fernet_encrypt(file_path, chunks, key):
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(Fernet(key).encrypt(''.join(chunks).encode()).decode())
+
+
+def fernet_decrypt(input_path, output_path, key):
+    with open(input_path, 'rb') as file:
+        data = Fernet(key).decrypt(file.read())
+    with open(output_path, 'wb') as file:
+        file.write(data)
+
+
+def run_benchmark(size_mb, segment_size=DEFAULT_SEGMENT_SIZE, directory=None):
+    chunks = synthetic_chunks(size_mb)
+    plain_bytes = sum(len(chunk.encode('utf-8')) for chunk in chunks)
+    key = generate_key()
+    rows = []
+    with tempfile.TemporaryDirectory(dir=directory) as work_dir:
+        encrypted_path = os.path.join(work_dir, 'bench.enc')
+        decrypted_path = os.path.join(work_dir, 'bench.txt')
+        for name, encrypt, decrypt in [
+            ('stream', lambda: encrypt_chunks_to_file(encrypted_path, chunks, key, segment_size=segment_size),
+             lambda: decrypt_file(encrypted_path, decrypted_path, key)),
+            ('fernet', lambda: fernet_encrypt(encrypted_path, chunks, key),
+             lambda: fernet_decrypt(encrypted_path, decrypted_path, key)),
+        ]:
+            encrypt_seconds, encrypt_peak = measure(encrypt)
+            encrypted_size = os.path.getsize(encrypted_path)
+            decrypt_seconds, decrypt_peak = measure(decrypt)
+            rows.append({
+                'format': name,
+                'encrypt_mb_per_second': round(plain_bytes / 1024 / 1024 / encrypt_seconds, 1),
+                'decrypt_mb_per_second': round(plain_bytes / 1024 / 1024 / decrypt_seconds, 1),
+                'encrypt_peak_mb': round(encrypt_peak / 1024 / 1024, 1),
+                'decrypt_peak_mb': round(decrypt_peak / 1024 / 1024, 1),
+                'size_ratio': round(encrypted_size / plain_bytes, 3),
+            })
+    return {'plain_mb': round(plain_bytes / 1024 / 1024, 1), 'segment_size': segment_size, 'results': rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='crypto_benchmark', description='比较分段加密与整体Fernet加密的吞吐量和内存')
+    parser.add_argument('--size-mb', type=int, default=64, help='明文大小（MB）')
+    parser.add_argument('--segment-size', type=int, default=DEFAULT_SEGMENT_SIZE, help='分段大小（字节）')
+    parser.add_argument('--dir', help='临时文件所在目录，默认为系统临时目录')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.size_mb, args.segment_size, args.dir)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    print(f'明文 {report["plain_mb"]}MB，分段大小 {report["segment_size"]}字节')
+    print(f'{"格式":<8}{"加密MB/s":>10}{"解密MB/s":>10}{"加密峰值MB":>12}{"解密峰值MB":>12}{"体积比":>8}')
+    for row in report['results']:
+        print(f'{row["format"]:<8}{row["encrypt_mb_per_second"]:>10.1f}{row["decrypt_mb_per_second"]:>10.1f}'
+              f'{row["encrypt_peak_mb"]:>12.1f}{row["decrypt_peak_mb"]:>12.1f}{row["size_ratio"]:>8.3f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
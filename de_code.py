@@ -1,7 +1,45 @@
 import sys
 import os
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit, QFileDialog, QMessageBox
-from cryptography.fernet import Fernet
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLineEdit, QFileDialog, QMessageBox, QProgressBar, QCheckBox
+from PyQt5.QtCore import QThread, pyqtSignal
+from stream_crypto import Decryptor, load_key, find_encrypted_files, decrypted_path, iter_decrypt_files, DEFAULT_DECRYPT_WORKERS
+
+
+# 在后台线程中多线程流式解密，界面不会卡住；单个文件失败不影响其他文件，结束时列出失败的文件。
+# 不需要界面时可用decrypt_cli
+class DecryptThread(QThread):
+    finished = pyqtSignal(str, str)
+    progress_updated = pyqtSignal(int)
+
+    def __init__(self, folder_path, key, recursive=True, workers=DEFAULT_DECRYPT_WORKERS):
+        super().__init__()
+        self.folder_path = folder_path
+        self.key = key
+        self.recursive = recursive
+        self.workers = workers
+
+    def run(self):
+        try:
+            decryptor = Decryptor(self.key)
+            file_paths = find_encrypted_files(self.folder_path, self.recursive)
+            if not file_paths:
+                self.finished.emit('文件夹中没有.enc文件', '')
+                return
+            failures = []
+            results = iter_decrypt_files(file_paths, decryptor,
+                                         lambda file_path: decrypted_path(file_path, self.folder_path), self.workers)
+            for file_index, (file_path, output_path, written, error) in enumerate(results):
+                if error:
+                    failures.append(f'{file_path}：{error}')
+                self.progress_updated.emit(int((file_index + 1) / len(file_paths) * 100))
+            message = f'共{len(file_paths)}个文件，成功{len(file_paths) - len(failures)}个，失败{len(failures)}个'
+            if failures:
+                self.finished.emit(message + '\n' + '\n'.join(failures), '')
+            else:
+                self.finished.emit('', message)
+        except Exception as e:
+            self.finished.emit('解密过程中发生错误。\n' + str(e), '')
+
 
 class DecryptApp(QWidget):
     def __init__(self):
@@ -29,9 +67,16 @@ class DecryptApp(QWidget):
         folder_upload_button.clicked.connect(self.upload_folder)
         layout.addWidget(folder_upload_button)
 
-        decrypt_button = QPushButton('开始解密', self)
-        decrypt_button.clicked.connect(self.decrypt_folder)
-        layout.addWidget(decrypt_button)
+        self.recursive_checkbox = QCheckBox('包括子文件夹', self)
+        self.recursive_checkbox.setChecked(True)
+        layout.addWidget(self.recursive_checkbox)
+
+        self.decrypt_button = QPushButton('开始解密', self)
+        self.decrypt_button.clicked.connect(self.decrypt_folder)
+        layout.addWidget(self.decrypt_button)
+
+        self.progress = QProgressBar(self)
+        layout.addWidget(self.progress)
 
         self.setLayout(layout)
 
@@ -51,28 +96,26 @@ class DecryptApp(QWidget):
 
         if folder_path and key_file_path:
             try:
-                with open(key_file_path, 'rb') as key_file:
-                    key = key_file.read()
-                fernet = Fernet(key)
-
-                for file_name in os.listdir(folder_path):
-                    if file_name.endswith('.enc'):
-                        file_path = os.path.join(folder_path, file_name)
-                        with open(file_path, 'rb') as file:
-                            encrypted_data = file.read()
-
-                        decrypted_data = fernet.decrypt(encrypted_data)
-
-                        decrypted_file_path = os.path.splitext(file_path)[0] + '_decrypted.txt'
-                        with open(decrypted_file_path, 'wb') as file:
-                            file.write(decrypted_data)
-
-                QMessageBox.information(self, '解密成功', '文件夹中的所有文件已解密')
-            except Exception as e:
-                QMessageBox.warning(self, '解密失败', '解密过程中发生错误。\n' + str(e))
+                key = load_key(key_file_path)
+            except OSError as e:
+                QMessageBox.warning(self, '解密失败', '读取密钥文件失败。\n' + str(e))
+                return
+            self.decrypt_button.setEnabled(False)
+            self.progress.setValue(0)
+            self.decrypt_thread = DecryptThread(folder_path, key, self.recursive_checkbox.isChecked())
+            self.decrypt_thread.progress_updated.connect(self.progress.setValue)
+            self.decrypt_thread.finished.connect(self.decrypt_finished)
+            self.decrypt_thread.start()
         else:
             QMessageBox.warning(self, '错误', '请上传密钥文件和选择需要解密的文件夹')
 
+    def decrypt_finished(self, error, message):
+        self.decrypt_button.setEnabled(True)
+        if error:
+            QMessageBox.warning(self, '解密失败', error)
+        else:
+            QMessageBox.information(self, '解密成功', message)
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = DecryptApp()
@@ -0,0 +1,85 @@
+import argparse
+import json
+import sys
+import time
+
+from stream_crypto import Decryptor, load_key, find_encrypted_files, decrypted_path, iter_decrypt_files, DEFAULT_DECRYPT_WORKERS
+
+# 命令行解密：不依赖Qt，适合在脚本中批量解密，逐文件报告成功或失败
+# 用法：python -m decrypt_cli 加密文件夹 --key 密钥.key [--output 输出文件夹] [--workers 8]
+
+EXIT_OK = 0
+EXIT_PARTIAL_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='decrypt_cli', description='批量解密.enc文件')
+    parser.add_argument('input', help='要解密的.enc文件或文件夹')
+    parser.add_argument('--key', required=True, help='密钥文件')
+    parser.add_argument('--output', help='解密结果输出文件夹（保留子文件夹结构），默认写在加密文件旁边')
+    parser.add_argument('--workers', type=int, default=DEFAULT_DECRYPT_WORKERS, help='并行解密的线程数')
+    parser.add_argument('--no-recursive', action='store_true', help='不解密子文件夹中的文件')
+    parser.add_argument('--json', action='store_true', help='在标准输出中逐行输出每个文件的结果（JSON）')
+    parser.add_argument('--quiet', action='store_true', help='不输出逐文件进度')
+    return parser.parse_args(argv)
+
+
+def _report(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def run(args):
+    try:
+        decryptor = Decryptor(load_key(args.key))
+    except (OSError, ValueError) as e:
+        _report('读取密钥失败：' + str(e))
+        return EXIT_USAGE
+    try:
+        file_paths = find_encrypted_files(args.input, recursive=not args.no_recursive)
+    except OSError as e:
+        _report('读取输入失败：' + str(e))
+        return EXIT_USAGE
+    if not file_paths:
+        _report('没有找到.enc文件：' + args.input)
+        return EXIT_USAGE
+
+    start_time = time.perf_counter()
+    total_bytes = 0
+    failures = []
+    results = iter_decrypt_files(file_paths, decryptor,
+                                 lambda file_path: decrypted_path(file_path, args.input, args.output), args.workers)
+    for file_index, (file_path, output_path, written, error) in enumerate(results):
+        if error:
+            failures.append((file_path, error))
+        else:
+            total_bytes += written
+        if args.json:
+            print(json.dumps({'file': file_path, 'output': output_path, 'bytes': written,
+                              'status': 'error' if error else 'ok', 'error': error}, ensure_ascii=False), flush=True)
+        if not args.quiet:
+            elapsed = max(time.perf_counter() - start_time, 1e-9)
+            status = '失败：' + error if error else '完成'
+            _report(f'[{file_index + 1}/{len(file_paths)}] {status} {file_path} '
+                    f'{(file_index + 1) / elapsed:.2f} files/s {total_bytes / elapsed / 1024 / 1024:.1f} MB/s')
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    _report(f'解密完成：共{len(file_paths)}个文件，失败{len(failures)}个，用时{elapsed:.1f}s，'
+            f'{len(file_paths) / elapsed:.2f} files/s，{total_bytes / elapsed / 1024 / 1024:.1f} MB/s')
+    for file_path, error in failures:
+        _report(f'失败：{file_path}：{error}')
+    return EXIT_PARTIAL_FAILURE if failures else EXIT_OK
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        _report('任务已停止。')
+        return EXIT_INTERRUPTED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
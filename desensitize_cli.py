@@ -0,0 +1,301 @@
+import argparse
+import os
+import random
+import string
+import sys
+import time
+from itertools import chain
+
+from desensitize_core import DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH, DEFAULT_OVERLAP, LENGTH_UNITS
+from doc_readers import iter_file_context, deal_path, EmptyDocumentError
+from file_discovery import FileDiscovery, DEDUPE_MODES, DEFAULT_DISCOVERY_WORKERS
+from mask_rules import load_rules
+from model_loader import get_ner_model, is_model_loaded, default_model_path, startup_report
+from ner_backends import create_backend, BACKEND_NAMES
+from result_cache import ResultCache, file_digest
+from run_metrics import RunMetrics
+from job_manifest import JobManifest, MANIFEST_FILE_NAME, STATUS_DONE, STATUS_SKIPPED, STATUS_ERROR
+from staged_pipeline import desensitize_pipeline, FileTask, DEFAULT_QUEUE_SIZE, DEFAULT_READ_WORKERS, DEFAULT_NER_WORKERS, DEFAULT_WRITE_WORKERS
+from batch_scheduler import BatchScheduler
+
+# 命令行版本：不依赖Qt，适合在服务器、容器和定时任务中批量脱敏
+# 用法：python -m desensitize_cli 输入文件夹 输出文件夹 [--workers 4]
+
+EXIT_OK = 0
+EXIT_PARTIAL_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='desensitize_cli', description='批量脱敏docx/doc/pdf文件，结果写为txt')
+    parser.add_argument('input', help='要脱敏的文件或文件夹（递归查找）')
+    parser.add_argument('output', help='脱敏结果输出文件夹')
+    parser.add_argument('--backend', choices=BACKEND_NAMES, default='local',
+                        help='实体识别引擎：本地模型、HanLP接口、讯飞LTP接口或只用词典')
+    parser.add_argument('--model', default=default_model_path(), help='HanLP模型路径或预训练模型标识，远程引擎失败时也用它识别')
+    parser.add_argument('--api-url', help='hanlp-rest/ltp-rest引擎的接口地址')
+    parser.add_argument('--api-token', help='hanlp-rest引擎的token')
+    parser.add_argument('--ltp-appid', help='ltp-rest引擎的应用ID')
+    parser.add_argument('--ltp-key', help='ltp-rest引擎的接口密钥')
+    parser.add_argument('--dictionary', help='rules引擎的词典文件，格式为{"类型": ["词条", ...]}')
+    parser.add_argument('--include', action='append', help='只脱敏匹配的文件，通配符，与相对路径或文件名匹配，可指定多次')
+    parser.add_argument('--exclude', action='append', help='跳过匹配的文件或文件夹，通配符，可指定多次')
+    parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='inode',
+                        help='同一文件出现多次（硬链接、符号链接）时只处理一次；content按内容哈希去重')
+    parser.add_argument('--scan-workers', type=int, default=DEFAULT_DISCOVERY_WORKERS, help='并行扫描文件夹的线程数')
+    parser.add_argument('--workers', type=int, default=1, help='并行进程数，1为单进程')
+    parser.add_argument('--read-workers', type=int, default=DEFAULT_READ_WORKERS, help='单进程时读取文件的线程数')
+    parser.add_argument('--ner-workers', type=int, default=DEFAULT_NER_WORKERS,
+                        help='单进程时识别的线程数，大于1时各线程的数据块合并成批送入模型')
+    parser.add_argument('--write-workers', type=int, default=DEFAULT_WRITE_WORKERS, help='单进程时写出结果的线程数')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='流水线各阶段之间最多排队的文件数')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每批送入模型的chunk数')
+    parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH, help='每次送入模型的最大字符数（含上下文）')
+    parser.add_argument('--length-unit', choices=sorted(LENGTH_UNITS), default='chars',
+                        help='--max-length的计算方式：按字数，或按模型token数（空白不计）')
+    parser.add_argument('--overlap', type=int, default=DEFAULT_OVERLAP, help='每个chunk两侧带上的上下文字数，0为不带')
+    parser.add_argument('--passes', type=int, default=2, help='最多脱敏遍数，只有上一遍有变化的数据块才会再次识别')
+    parser.add_argument('--rules', help='脱敏规则文件，默认使用mask_rules.json')
+    parser.add_argument('--mask', help='替换敏感实体的字符，覆盖规则文件中的设置；不指定时使用规则文件中的mask')
+    parser.add_argument('--cache-dir', help='脱敏结果缓存目录，未改动的文件直接复用缓存结果；不指定则不使用缓存')
+    parser.add_argument('--cache-max-mb', type=int, default=1024, help='结果缓存大小上限（MB）')
+    parser.add_argument('--metrics', help='运行结束时把逐文件和分阶段指标追加写入此JSON lines文件')
+    parser.add_argument('--prometheus', help='运行结束时把指标写成Prometheus文本格式（供node_exporter textfile采集）')
+    parser.add_argument('--manifest', help=f'任务清单文件，默认为输出文件夹中的{MANIFEST_FILE_NAME}；'
+                                           '再次运行时跳过已完成且未改动的文件')
+    parser.add_argument('--restart', action='store_true', help='不跳过任务清单中已完成的文件，全部重新脱敏')
+    parser.add_argument('--quiet', action='store_true', help='不输出逐文件进度')
+    return parser.parse_args(argv)
+
+
+def _backend_options(args):
+    return {
+        'url': args.api_url,
+        'token': args.api_token,
+        'appid': args.ltp_appid,
+        'api_key': args.ltp_key,
+        'dictionary_file': args.dictionary,
+    }
+
+
+# 结果缓存中区分引擎：本地模型用模型路径，词典引擎用词典内容
+def _cache_model(args):
+    if args.backend == 'local':
+        return args.model
+    if args.backend == 'rules' and args.dictionary:
+        return 'rules-' + file_digest(args.dictionary)[:12]
+    return args.backend
+
+
+def _new_output_file(output_path, original_file_path):
+    new_file_name = ''.join(random.choices(string.ascii_letters + string.digits, k=8)) + '_' + os.path.basename(original_file_path) + '.txt'
+    return os.path.join(output_path, new_file_name)
+
+
+# 单进程：读取、切块、识别、写出分阶段流水执行，返回(文件路径, 输出文件, 写入字符数, 错误信息)，空文件的字符数为None
+def _iter_single_process(args, file_paths):
+    ner_model = args.ner_backend
+    if args.ner_workers > 1:
+        ner_model = args.scheduler = BatchScheduler(ner_model, args.batch_size)
+    metrics = args.run_metrics
+    pipeline = args.pipeline = desensitize_pipeline(
+        ner_model, args.max_length, args.batch_size, rules=args.rules, passes=args.passes, overlap=args.overlap,
+        reader=lambda file_path: iter_file_context(deal_path(file_path)), read_workers=args.read_workers, ner_workers=args.ner_workers, write_workers=args.write_workers,
+        queue_size=args.queue_size, length=LENGTH_UNITS[args.length_unit])
+    tasks = (FileTask(file_path, _new_output_file(args.output, file_path)) for file_path in file_paths)
+    for task, error, seconds in pipeline.run(tasks):
+        metrics.merge(task.metrics.stats())
+        record = {'file': task.file_path, 'status': 'ok'}
+        if isinstance(error, EmptyDocumentError):
+            record['status'] = 'skipped'
+        elif error is not None:
+            record.update(status='error', error=str(error))
+        else:
+            record['chars'] = task.chars
+        metrics.record_file(record, sum(seconds.values()), task.metrics.stage_seconds)
+        if record['status'] == 'ok':
+            yield task.file_path, task.output_file, task.chars, None
+        else:
+            yield task.file_path, None, None, record.get('error')
+
+
+# 多进程：工作进程返回脱敏文本，由主进程写出
+def _iter_pool(args, file_paths):
+    from process_pool import DocumentPool
+    pool = DocumentPool(args.model, args.workers, passes=args.passes, batch_size=args.batch_size,
+                        max_length=args.max_length, rules=args.rules, backend=args.backend,
+                        backend_options=_backend_options(args), overlap=args.overlap,
+                        length=LENGTH_UNITS[args.length_unit])
+    metrics = args.run_metrics
+    output_files = {}
+
+    def tasks():
+        for file_path in file_paths:
+            output_files[file_path] = _new_output_file(args.output, file_path)
+            yield file_path, output_files[file_path]
+
+    for file_path, chars, error, stats in pool.imap(tasks()):
+        output_file = output_files.pop(file_path)
+        metrics.merge(stats)
+        record = {'file': file_path, 'status': 'error' if error else 'ok'}
+        if error:
+            record['error'] = error
+        elif chars is None:
+            record['status'] = 'skipped'
+        else:
+            record['chars'] = chars
+        metrics.record_file(record, sum(stats['stages'].values()), stats['stages'])
+        if record['status'] == 'ok':
+            yield file_path, output_file, chars, None
+        else:
+            yield file_path, None, None, error
+
+
+# 边查找边把命中缓存的文件直接复制到输出文件夹，其余的交给流水线或进程池（在它们取文件的线程中调用）。
+# 每个文件只计算一次内容哈希，缓存键和任务清单记录共用，存在digests中
+def _restore_cached(args, file_paths, manifest, cache, cache_keys, digests):
+    for file_path in file_paths:
+        output_file = _new_output_file(args.output, file_path)
+        try:
+            digests[file_path] = file_digest(file_path)
+            cache_keys[file_path] = cache.key_for(file_path, digests[file_path])
+            restored = cache.restore(cache_keys[file_path], output_file)
+        except OSError:
+            restored = False  # 读取失败的文件交给流水线或进程池，由其报告错误
+        if restored:
+            manifest.record(file_path, STATUS_DONE, output_file, sha256=digests[file_path])
+        else:
+            yield file_path
+
+
+def _report(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def run(args):
+    if not os.path.exists(args.input):
+        _report(f'输入路径不存在：{args.input}')
+        return EXIT_USAGE
+    try:
+        args.rules = load_rules(args.rules, mask=args.mask)
+    except (OSError, ValueError) as e:
+        _report(f'脱敏规则文件无效：{e}')
+        return EXIT_USAGE
+    # 边查找边处理：找到第一个文件就开始脱敏，不等整个文件夹遍历完，文件夹只遍历一次
+    discovery = FileDiscovery(args.input, include=args.include, exclude=args.exclude,
+                              workers=args.scan_workers, dedupe=args.dedupe)
+    scan = iter(discovery)
+    first = next(scan, None)
+    if first is None:
+        _report('没有检测到可以于脱敏的文件！')
+        return EXIT_USAGE
+    file_paths = chain([first], scan)
+    try:
+        args.ner_backend = create_backend(args.backend, model=args.model, batch_size=args.batch_size,
+                                          **_backend_options(args))
+    except (OSError, ValueError) as e:
+        scan.close()
+        _report(f'NER引擎参数无效：{e}')
+        return EXIT_USAGE
+    os.makedirs(args.output, exist_ok=True)
+
+    start_time = time.perf_counter()
+    args.run_metrics = metrics = RunMetrics()
+    manifest = JobManifest(args.manifest) if args.manifest else JobManifest.for_output(args.output)
+    manifest.clean_temp_files()
+    pending = file_paths if args.restart else manifest.pending(file_paths)
+    cache = None
+    cache_keys = {}
+    digests = {}
+    if args.cache_dir:
+        cache = ResultCache(args.cache_dir, _cache_model(args), variant=f'{args.rules.fingerprint}|{args.passes}|{args.max_length}|{args.overlap}|{args.length_unit}',
+                            max_bytes=args.cache_max_mb * 1024 * 1024)
+        pending = _restore_cached(args, pending, manifest, cache, cache_keys, digests)
+
+    # 全部已完成或命中缓存时不启动流水线或进程池
+    first = next(pending, None)
+    if first is None:
+        results = iter(())
+    elif args.workers > 1:
+        results = _iter_pool(args, chain([first], pending))
+    else:
+        results = _iter_single_process(args, chain([first], pending))
+
+    total_chars = 0
+    failed = 0
+    skipped = 0
+    processed = 0
+    for file_path, output_file, written, error in results:
+        processed += 1
+        if output_file and file_path in cache_keys:
+            cache.store(cache_keys[file_path], output_file)
+        if error:
+            failed += 1
+            status = '失败：' + error
+            manifest.record(file_path, STATUS_ERROR, error=error)
+        elif written is None:
+            skipped += 1
+            status = '跳过'
+            manifest.record(file_path, STATUS_SKIPPED, sha256=digests.get(file_path))
+        else:
+            total_chars += written
+            status = '完成'
+            manifest.record(file_path, STATUS_DONE, output_file, sha256=digests.get(file_path))
+        if not args.quiet:
+            # 查找还没结束时总数后面带+，随找到的文件增加
+            done = processed + manifest.resumed + (cache.hits if cache else 0)
+            total = f'{discovery.found}' if discovery.done else f'{discovery.found}+'
+            elapsed = max(time.perf_counter() - start_time, 1e-9)
+            _report(f'[{done}/{total}] {status} {file_path} '
+                    f'{done / elapsed:.2f} files/s {total_chars / elapsed:.0f} chars/s')
+
+    total_files = discovery.found
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    if discovery.duplicates or discovery.errors:
+        _report(f'跳过重复文件{discovery.duplicates}个，无法读取的文件夹或文件{discovery.errors}个')
+    if manifest.resumed:
+        _report(f'跳过任务清单中已完成的{manifest.resumed}个文件')
+        metrics.count('files_resumed', manifest.resumed)
+    _report(f'脱敏完成：共{total_files}个文件，失败{failed}个，跳过{skipped}个，'
+            f'用时{elapsed:.1f}s，{total_files / elapsed:.2f} files/s，{total_chars / elapsed:.0f} chars/s')
+    if cache:
+        _report(cache.summary())
+        metrics.add_counters('result_cache_', cache, ['hits', 'misses', 'evictions'])
+    if args.workers <= 1 and args.backend not in ('local', 'rules'):
+        _report(args.ner_backend.summary())
+        metrics.add_counters('remote_', args.ner_backend,
+                             ['requests_sent', 'retries_done', 'timeouts', 'failures', 'fallbacks'])
+    if getattr(args, 'pipeline', None):
+        _report(args.pipeline.summary())
+        args.pipeline.add_counters(metrics)
+    if getattr(args, 'scheduler', None):
+        _report(args.scheduler.summary())
+        metrics.add_counters('scheduler_', args.scheduler, ['batches', 'chunks', 'padding_chars', 'full_batches'])
+        args.scheduler.close()
+    if args.workers <= 1 and is_model_loaded(args.model):
+        _report(get_ner_model(args.model).summary())
+        metrics.add_counters('ner_cache_', get_ner_model(args.model), ['hits', 'misses'])
+    if startup_report():
+        _report(startup_report())
+    if args.metrics:
+        metrics.write_jsonl(args.metrics)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
+    if hasattr(args.ner_backend, 'close'):
+        args.ner_backend.close()
+    manifest.close()
+    return EXIT_PARTIAL_FAILURE if failed else EXIT_OK
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        _report('任务已停止。')
+        return EXIT_INTERRUPTED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import re
+
+from model_loader import mark_startup
+from mask_rules import default_rules
+from run_metrics import NULL_METRICS
+
+# 模型一次最多输入126个字（BERT的128个位置去掉[CLS]和[SEP]），包括两侧的上下文
+DEFAULT_MAX_LENGTH = 126
+DEFAULT_BATCH_SIZE = 32
+# 每个数据块两侧各带上相邻数据块的几个字一起识别，避免切块处的实体被截断
+DEFAULT_OVERLAP = 6
+
+# 实体识别失败：未经识别的数据块不能写出，整个文件记为失败
+class NerError(Exception):
+    pass
+
+
+# 在这些标点之后断句
+SENTENCE_PATTERN = re.compile(r'(?<=[。，！？!?；;“”《》（）])')
+
+
+# 模型输入按字切分（见batch_ner），空白字符不产生token，只统计非空白字符
+def token_length(text):
+    return len(text) - sum(1 for char in text if char.isspace())
+
+
+# 数据块长度的计算方式：按字数，或按模型的token数（空白不计，同样长度的数据块能装下更多内容）
+LENGTH_UNITS = {'chars': len, 'tokens': token_length}
+
+
+# 超长句子按长度硬切
+def _hard_cut(sentence, max_length, length):
+    if length is len:
+        return [sentence[i:i + max_length] for i in range(0, len(sentence), max_length)]
+    pieces = []
+    start = 0
+    size = 0
+    for index, char in enumerate(sentence):
+        char_size = length(char)
+        if size + char_size > max_length and index > start:
+            pieces.append(sentence[start:index])
+            start = index
+            size = 0
+        size += char_size
+    pieces.append(sentence[start:])
+    return pieces
+
+
+# 按标点断句后把句子依次装进数据块，每块的长度（length计算，默认按字数）不超过max_length。
+# 所有数据块拼接起来与原文完全相同
+def split_text(text, max_length=DEFAULT_MAX_LENGTH, length=len):
+    chunks = []
+    parts = []
+    size = 0
+    for sentence in SENTENCE_PATTERN.split(text):
+        if not sentence:
+            continue
+        sentence_size = length(sentence)
+        if size + sentence_size <= max_length:
+            parts.append(sentence)
+            size += sentence_size
+            continue
+        if parts:
+            chunks.append(''.join(parts))
+        if sentence_size <= max_length:
+            parts = [sentence]
+            size = sentence_size
+            continue
+        # 硬切后的最后一段作为下一个数据块的开头，后面的句子可以继续装入
+        pieces = _hard_cut(sentence, max_length, length)
+        chunks.extend(pieces[:-1])
+        parts = [pieces[-1]]
+        size = length(pieces[-1])
+    if parts:
+        chunks.append(''.join(parts))
+    return chunks
+
+
+# 两侧带上下文时，数据块本身的最大长度
+def _chunk_length(max_length, overlap):
+    return max(max_length - 2 * overlap, 1)
+
+
+# 把带上下文识别出的实体换算到数据块本身的坐标。跨越数据块边界的实体只处理落在本块内的部分：
+# 属于掩码的部分输出一个掩码，属于单位后缀的部分原样保留，相邻数据块各自处理自己的部分
+def _core_entities(rules, chunk, entities, offset):
+    core_length = len(chunk)
+    results = []
+    for entity_text, label, start, end in entities:
+        start -= offset
+        end -= offset
+        if end <= 0 or start >= core_length:
+            continue
+        if start >= 0 and end <= core_length:
+            results.append((entity_text, label, start, end))
+            continue
+        if label not in rules.sensitive_labels:
+            continue
+        suffix_start = end - len(rules.unit_suffix(entity_text))
+        piece_start = max(start, 0)
+        piece_end = min(end, core_length)
+        replacement = rules.mask if piece_start < min(suffix_start, core_length) else ''
+        replacement += chunk[max(suffix_start, piece_start):piece_end]
+        results.append((chunk[piece_start:piece_end], label, piece_start, piece_end, replacement))
+    return results
+
+
+# 批量NER：按batch_size把多个chunk一次送入模型，返回与chunks一一对应的实体列表
+# 模型按字切分，单条字符串会被当作一个样本，所以批量时需传入字符列表。
+# ner_model也可以是ner_backends中的引擎，由引擎的recognize(chunks)自行分批
+def batch_ner(ner_model, chunks, batch_size=DEFAULT_BATCH_SIZE):
+    if hasattr(ner_model, 'recognize'):
+        return ner_model.recognize(chunks)
+    results = []
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i+batch_size]
+        results.extend(ner_model([list(chunk) for chunk in batch], batch_size=batch_size))
+    return results
+
+
+# rules为None时使用mask_rules.json中的默认规则；metrics为run_metrics.RunMetrics时记录各阶段耗时和实体数。
+# contexts为每个数据块的(左侧上下文, 右侧上下文)，与数据块一起送入模型，但只替换数据块本身
+def desensitize_chunks(ner_model, chunks, batch_size=DEFAULT_BATCH_SIZE, rules=None, metrics=None, contexts=None):
+    rules = rules or default_rules()
+    metrics = metrics or NULL_METRICS
+    with metrics.timer('pre_mask'):
+        chunks = [rules.pre_mask(chunk) for chunk in chunks]
+    if not chunks:
+        return []
+    metrics.count('ner_chunks', len(chunks))
+    inputs = chunks
+    if contexts:
+        inputs = [left + chunk + right for chunk, (left, right) in zip(chunks, contexts)]
+    try:
+        with metrics.timer('ner'):
+            entities_list = batch_ner(ner_model, inputs, batch_size)
+    except Exception:
+        metrics.count('ner_batch_errors')
+        # 整批失败时逐条重试；单条仍然失败时抛出NerError，只做了正则初步脱敏的数据块可能含有人名地名，不能写出
+        entities_list = []
+        for chunk in inputs:
+            try:
+                if hasattr(ner_model, 'recognize'):
+                    entities_list.append(ner_model.recognize([chunk])[0])
+                else:
+                    entities_list.append(ner_model(chunk))
+            except Exception as e:
+                metrics.count('ner_chunk_errors')
+                raise NerError(f'实体识别失败：{e}') from e
+    mark_startup('first_chunk')
+    if contexts:
+        entities_list = [_core_entities(rules, chunk, entities, len(left))
+                         for chunk, entities, (left, right) in zip(chunks, entities_list, contexts)]
+    metrics.count_entities(entities_list)
+    with metrics.timer('mask'):
+        return [rules.mask_entities(chunk, entities) for chunk, entities in zip(chunks, entities_list)]
+
+
+# 单遍收敛脱敏：第一遍处理全部chunk，之后只对上一遍内容有变化的chunk重新识别，
+# 直到没有变化或达到max_passes。内容没变的chunk再跑一遍模型结果也不会变，
+# 因此输出与对全部chunk跑max_passes遍相同，但省去了大部分重复的模型调用。
+# 与旧代码不同，第二遍之前不再把结果拼接后重新切块，各遍沿用第一遍的数据块边界（见test_desensitize_core.py）；
+# 掩码改变了长度时，旧代码的切块位置会随之移动，结果可能与这里略有差异。
+# 正则初步脱敏的结果再做一遍不会变化，只有模型识别出的实体被替换时，数据块下一遍送入模型的内容才会变，
+# 因此只有这样的数据块需要重新识别。
+# overlap>0时每块两侧带上相邻块的overlap个字作为上下文，首尾两块的上下文取left_context/right_context；
+# 数据块靠近边界的overlap个字有变化时，相邻块的上下文也变了，相邻块一并重新识别
+def desensitize_until_stable(ner_model, chunks, max_passes=2, batch_size=DEFAULT_BATCH_SIZE, rules=None,
+                             metrics=None, overlap=0, left_context='', right_context=''):
+    rules = rules or default_rules()
+    chunks = list(chunks)
+    pending = list(range(len(chunks)))
+    for _ in range(max_passes):
+        if not pending:
+            break
+        contexts = None
+        if overlap:
+            contexts = [((chunks[i - 1] if i else left_context)[-overlap:],
+                         (chunks[i + 1] if i + 1 < len(chunks) else right_context)[:overlap])
+                        for i in pending]
+        results = desensitize_chunks(ner_model, [chunks[i] for i in pending], batch_size, rules, metrics, contexts)
+        changed = set()
+        for i, result in zip(pending, results):
+            if result == chunks[i]:
+                continue
+            if result != rules.pre_mask(chunks[i]):
+                changed.add(i)
+            if overlap and i > 0 and result[:overlap] != chunks[i][:overlap]:
+                changed.add(i - 1)
+            if overlap and i + 1 < len(chunks) and result[-overlap:] != chunks[i][-overlap:]:
+                changed.add(i + 1)
+            chunks[i] = result
+        pending = sorted(changed)
+    return chunks
+
+
+# 把段落切成数据块，每块留出两侧上下文的长度
+def split_paragraphs(paragraphs, max_length=DEFAULT_MAX_LENGTH, overlap=DEFAULT_OVERLAP, length=len):
+    chunk_length = _chunk_length(max_length, overlap)
+    chunks = []
+    for paragraph in paragraphs:
+        chunks.extend(split_text(paragraph, max_length=chunk_length, length=length))
+    return chunks
+
+
+# 把一个文档的所有段落切块后整体批量脱敏
+def desensitize_paragraphs(ner_model, paragraphs, max_length=DEFAULT_MAX_LENGTH, batch_size=DEFAULT_BATCH_SIZE,
+                           rules=None, passes=1, metrics=None, overlap=DEFAULT_OVERLAP, length=len):
+    metrics = metrics or NULL_METRICS
+    with metrics.timer('split'):
+        chunks = split_paragraphs(paragraphs, max_length, overlap, length)
+    metrics.count('chunks', len(chunks))
+    return desensitize_until_stable(ner_model, chunks, passes, batch_size, rules, metrics, overlap)
+
+
+# 跨文档批量脱敏：多个文档的chunk合并成批送入模型，再按文档拆回。
+# 文档交界处的上下文来自相邻文档，只影响识别，不影响替换范围
+def desensitize_documents(ner_model, documents, max_length=DEFAULT_MAX_LENGTH, batch_size=DEFAULT_BATCH_SIZE,
+                          rules=None, passes=1, overlap=DEFAULT_OVERLAP, length=len):
+    chunks = []
+    counts = []
+    for paragraphs in documents:
+        doc_chunks = split_paragraphs(paragraphs, max_length, overlap, length)
+        chunks.extend(doc_chunks)
+        counts.append(len(doc_chunks))
+
+    desensitized_chunks = desensitize_until_stable(ner_model, chunks, passes, batch_size, rules, overlap=overlap)
+    results = []
+    offset = 0
+    for count in counts:
+        results.append(desensitized_chunks[offset:offset+count])
+        offset += count
+    return results
+
+
+# 流式脱敏：逐段读取，攒够一批chunk就送入模型并立即返回结果，内存占用与文档大小无关
+def iter_desensitized_chunks(ner_model, paragraphs, max_length=DEFAULT_MAX_LENGTH, batch_size=DEFAULT_BATCH_SIZE,
+                             rules=None, passes=1, metrics=None, overlap=DEFAULT_OVERLAP, length=len):
+    metrics = metrics or NULL_METRICS
+    chunk_length = _chunk_length(max_length, overlap)
+
+    def iter_chunks():
+        for paragraph in metrics.timed_iter('read', paragraphs):
+            with metrics.timer('split'):
+                chunks = split_text(paragraph, max_length=chunk_length, length=length)
+            yield from chunks
+
+    return iter_desensitized_split_chunks(ner_model, iter_chunks(), batch_size, rules, passes, metrics, overlap)
+
+
+# 对已经切好的数据块（split_paragraphs的结果）按批流式脱敏。
+# 每批多留一块作为本批最后一块的右侧上下文，上一批的最后一块作为本批第一块的左侧上下文。
+# 上下文取脱敏前的原文：若取上一批的脱敏结果，跨批次边界的实体只剩掩码，本批的那一半就识别不出来了
+def iter_desensitized_split_chunks(ner_model, chunks, batch_size=DEFAULT_BATCH_SIZE, rules=None, passes=1,
+                                   metrics=None, overlap=DEFAULT_OVERLAP):
+    metrics = metrics or NULL_METRICS
+    pending = []
+    left_context = ''
+    for chunk in chunks:
+        pending.append(chunk)
+        if len(pending) > batch_size:
+            batch = pending[:batch_size]
+            pending = pending[batch_size:]
+            metrics.count('chunks', len(batch))
+            results = desensitize_until_stable(ner_model, batch, passes, batch_size, rules, metrics, overlap,
+                                               left_context, pending[0])
+            left_context = batch[-1]
+            yield from results
+    if pending:
+        metrics.count('chunks', len(pending))
+        yield from desensitize_until_stable(ner_model, pending, passes, batch_size, rules, metrics, overlap,
+                                            left_context)
@@ -0,0 +1,401 @@
+import atexit
+import multiprocessing
+import os
+import re
+import struct
+import sys
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import olefile
+from PyPDF2 import PdfReader
+from file_discovery import FileDiscovery
+from lxml import etree
+
+
+class EmptyDocumentError(Exception):
+    pass
+
+
+# Word 97之前的.doc格式，纯Python解析不了，只有这种情况在Windows上改用Word读取
+class LegacyDocFormatError(ValueError):
+    pass
+
+
+W_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_P = W_NAMESPACE + 'p'
+W_R = W_NAMESPACE + 'r'
+W_T = W_NAMESPACE + 't'
+# 文本框同时存在新旧两种写法，只读取mc:Choice中的一份
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+# 行内的制表符、换行等（pPr中的同名元素是格式定义，不是文字）
+DOCX_RUN_CHARS = {W_NAMESPACE + 'tab': '\t', W_NAMESPACE + 'br': '\n', W_NAMESPACE + 'cr': '\n',
+                  W_NAMESPACE + 'noBreakHyphen': '-'}
+DOCX_TAGS = [W_P, W_T, MC_FALLBACK] + list(DOCX_RUN_CHARS)
+DOCX_RELATIONSHIP = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+DOCX_MAIN_DOCUMENT = 'word/document.xml'
+DOCX_HEADER_FOOTER_PATTERN = re.compile(r'(header|footer)\d*\.xml$')
+
+
+def read_word_document(file_path, line_end='\n'):
+    return list(iter_word_paragraphs(file_path, line_end))
+
+
+# 流式解析一个XML部件，按文档顺序返回段落文本；表格单元格、文本框中的段落各自作为一段。
+# 处理完的最外层段落立即清空并从树上删除，内存占用与文档大小无关
+def _iter_docx_part(source, line_end):
+    paragraphs = []
+    fallback = 0
+    for event, elem in etree.iterparse(source, events=('start', 'end'), tag=DOCX_TAGS):
+        tag = elem.tag
+        if event == 'start':
+            if tag == W_P:
+                paragraphs.append([])
+            elif tag == MC_FALLBACK:
+                fallback += 1
+            continue
+        if tag == W_T:
+            if paragraphs and elem.text:
+                paragraphs[-1].append(elem.text)
+        elif tag == W_P:
+            text = ''.join(paragraphs.pop())
+            if not fallback:
+                yield text + line_end
+            if not paragraphs:
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        elif tag == MC_FALLBACK:
+            fallback -= 1
+        elif paragraphs and elem.getparent().tag == W_R:
+            paragraphs[-1].append(DOCX_RUN_CHARS[tag])
+
+
+def _docx_main_part(archive):
+    try:
+        relationships = etree.fromstring(archive.read('_rels/.rels'))
+    except KeyError:
+        return DOCX_MAIN_DOCUMENT
+    for relationship in relationships.iter(DOCX_RELATIONSHIP):
+        if relationship.get('Type', '').endswith('/officeDocument'):
+            return relationship.get('Target', DOCX_MAIN_DOCUMENT).lstrip('/')
+    return DOCX_MAIN_DOCUMENT
+
+
+# 逐段返回Word段落文本：直接从压缩包中流式解析正文XML，不建立python-docx对象树。
+# 包括表格单元格、文本框中的段落，正文之后是页眉和页脚。file_path也可以是文件对象
+def iter_word_paragraphs(file_path, line_end='\n'):
+    with zipfile.ZipFile(file_path) as archive:
+        main_part = _docx_main_part(archive)
+        directory = main_part.rpartition('/')[0]
+        names = [name.rpartition('/')[2] for name in archive.namelist() if name.rpartition('/')[0] == directory]
+        # 页眉在前，页脚在后
+        parts = [main_part] + [directory + '/' + name for name in
+                               sorted(filter(DOCX_HEADER_FOOTER_PATTERN.match, names), key=lambda name: (name[0] == 'f', name))]
+        for part in parts:
+            with archive.open(part) as source:
+                yield from _iter_docx_part(source, line_end)
+
+# PDF逐页提取比较慢，页数较多时分给多个进程并行提取
+PDF_PARALLEL_MIN_PAGES = 8
+PDF_PAGES_PER_TASK = 4
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+
+_pdf_executor = None
+
+
+def read_pdf_document(file_path):
+    try:
+        return list(iter_pdf_pages(file_path))
+    except EmptyDocumentError:
+        return 'PDF文件为空'
+
+
+def _resolve(value):
+    return value.get_object() if hasattr(value, 'get_object') else value
+
+
+# 页面上可能有文字时返回True。内容流中没有BT（文本对象）且没有引用表单XObject的页面
+# 是空白页或纯图片页，不用调用extract_text；判断不了时按有文字处理
+def _page_may_have_text(page):
+    resources = _resolve(page.get('/Resources')) or {}
+    for xobject in (_resolve(resources.get('/XObject')) or {}).values():
+        if _resolve(xobject).get('/Subtype') == '/Form':
+            return True
+    contents = _resolve(page.get('/Contents'))
+    if contents is None:
+        return False
+    streams = contents if isinstance(contents, list) else [contents]
+    try:
+        return any(b'BT' in _resolve(stream).get_data() for stream in streams)
+    except Exception:
+        return True
+
+
+def _extract_page(page):
+    if not _page_may_have_text(page):
+        return '\n'
+    return page.extract_text() + '\n'
+
+
+# 在工作进程中提取[start, stop)范围内的页面
+def _extract_pdf_pages(file_path, start, stop):
+    with open(file_path, 'rb') as file:
+        reader = PdfReader(file)
+        return [_extract_page(reader.pages[index]) for index in range(start, stop)]
+
+
+def _get_pdf_executor():
+    global _pdf_executor
+    if _pdf_executor is None:
+        # 与process_pool一样使用spawn，不把父进程的模型和Qt状态带入子进程
+        _pdf_executor = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(_pdf_executor.shutdown, cancel_futures=True)
+    return _pdf_executor
+
+
+# 按页码顺序并行提取，前面的页面一提取完就返回，不等全部页面
+def _iter_pdf_pages_parallel(file_path, num_pages):
+    executor = _get_pdf_executor()
+    futures = [executor.submit(_extract_pdf_pages, file_path, start, min(start + PDF_PAGES_PER_TASK, num_pages))
+               for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+# 逐页返回PDF文本，空白页和纯图片页只返回换行；全部页面为空时在结束时抛出EmptyDocumentError。
+# 页数不少于PDF_PARALLEL_MIN_PAGES时多进程并行提取，workers为1或已在进程池的工作进程中时逐页提取
+def iter_pdf_pages(file_path, workers=None):
+    workers = PDF_WORKERS if workers is None else workers
+    with open(file_path, 'rb') as file:
+        reader = PdfReader(file)
+        num_pages = len(reader.pages)
+        is_empty = True
+        if workers > 1 and num_pages >= PDF_PARALLEL_MIN_PAGES and not _in_daemon_process():
+            pages = _iter_pdf_pages_parallel(file_path, num_pages)
+        else:
+            pages = (_extract_page(page) for page in reader.pages)
+        for text in pages:
+            if not text.isspace():
+                is_empty = False
+            yield text
+        if is_empty:
+            raise EmptyDocumentError('PDF文件为空')
+
+
+# multiprocessing.Pool的工作进程不能再创建子进程
+def _in_daemon_process():
+    return multiprocessing.current_process().daemon
+
+def deal_path(path):
+    path = path.replace('\\', '/')
+    return path 
+
+# Word 97-2003二进制格式（[MS-DOC]）：WordDocument流开头是FIB，其中记录正文字数和片段表（Clx）
+# 在表格流（0Table或1Table）中的位置；片段表把正文按字符位置分成若干片段，每段是UTF-16或单字节的cp1252
+WORD_FIB_IDENT = 0xA5EC
+WORD97_MIN_NFIB = 0x00C1
+FIB_FLAGS_OFFSET = 0x0A
+FIB_CCP_TEXT_OFFSET = 0x4C
+FIB_CLX_OFFSET = 0x01A2
+FIB_ENCRYPTED = 0x0100
+FIB_WHICH_TABLE_STREAM = 0x0200
+PCD_COMPRESSED = 0x40000000
+
+# 段落、单元格、换行、分页、分栏结束符都作为段落分隔
+DOC_PARAGRAPH_PATTERN = re.compile('[\r\x07\x0b\x0c\x0e]')
+# 域：\x13域代码\x14域结果\x15，只保留域结果
+DOC_FIELD_PATTERN = re.compile('([\x13\x14\x15])')
+# 不间断连字符换成连字符，其余控制字符（图片、脚注引用等占位符）去掉
+DOC_CHAR_TABLE = {code: None for code in range(0x20) if chr(code) not in '\t\r\x07\x0b\x0c\x0e'}
+DOC_CHAR_TABLE[0x1E] = '-'
+
+
+def _doc_piece_table(clx):
+    position = 0
+    # 跳过Prc（格式修改记录），之后是Pcdt
+    while position < len(clx) and clx[position] == 0x01:
+        size, = struct.unpack_from('<h', clx, position + 1)
+        position += 3 + size
+    if position >= len(clx) or clx[position] != 0x02:
+        raise ValueError('.doc文件片段表损坏')
+    size, = struct.unpack_from('<I', clx, position + 1)
+    plc = clx[position + 5:position + 5 + size]
+    count = (len(plc) - 4) // 12
+    positions = struct.unpack_from(f'<{count + 1}I', plc, 0)
+    pieces = []
+    for index in range(count):
+        fc, = struct.unpack_from('<I', plc, 4 * (count + 1) + 8 * index + 2)
+        pieces.append((positions[index], positions[index + 1], fc))
+    return pieces
+
+
+# 读取正文（不含脚注、页眉等其他部分，与Word中Document.Paragraphs的范围相同）
+def _read_doc_text(file_path):
+    with olefile.OleFileIO(file_path) as ole:
+        if not ole.exists('WordDocument'):
+            raise ValueError('不是Word文档：' + file_path)
+        word = ole.openstream('WordDocument').read()
+        ident, nfib = struct.unpack_from('<HH', word, 0)
+        if ident != WORD_FIB_IDENT:
+            raise ValueError('不是Word文档：' + file_path)
+        if nfib < WORD97_MIN_NFIB:
+            raise LegacyDocFormatError('不支持Word 97之前的.doc格式：' + file_path)
+        flags, = struct.unpack_from('<H', word, FIB_FLAGS_OFFSET)
+        if flags & FIB_ENCRYPTED:
+            raise ValueError('.doc文件已加密：' + file_path)
+        ccp_text, = struct.unpack_from('<i', word, FIB_CCP_TEXT_OFFSET)
+        fc_clx, lcb_clx = struct.unpack_from('<II', word, FIB_CLX_OFFSET)
+        table_name = '1Table' if flags & FIB_WHICH_TABLE_STREAM else '0Table'
+        table = ole.openstream(table_name).read()
+
+    parts = []
+    for cp_start, cp_end, fc in _doc_piece_table(table[fc_clx:fc_clx + lcb_clx]):
+        if cp_start >= ccp_text:
+            break
+        length = min(cp_end, ccp_text) - cp_start
+        if fc & PCD_COMPRESSED:
+            offset = (fc & ~PCD_COMPRESSED) // 2
+            parts.append(word[offset:offset + length].decode('cp1252', errors='replace'))
+        else:
+            parts.append(word[fc:fc + 2 * length].decode('utf-16-le', errors='replace'))
+    return ''.join(parts)
+
+
+def _strip_doc_fields(text):
+    if '\x13' not in text:
+        return text
+    parts = []
+    # 栈中每层域记录当前是否在域代码部分，任一层在域代码中时不输出
+    stack = []
+    for part in DOC_FIELD_PATTERN.split(text):
+        if part == '\x13':
+            stack.append(True)
+        elif part == '\x14':
+            if stack:
+                stack[-1] = False
+        elif part == '\x15':
+            if stack:
+                stack.pop()
+        elif not any(stack):
+            parts.append(part)
+    return ''.join(parts)
+
+
+# 逐段返回.doc段落文本，纯Python解析，不依赖Word，各平台都可用。
+# 扩展名为.doc的docx文件按docx读取；Word 97之前的格式在Windows上改用Word读取。
+# 加密、损坏的文件直接报错，不交给Word：加密文件会弹出密码对话框，阻塞后台进程
+def iter_doc_paragraphs(file_path, line_end='\n'):
+    if zipfile.is_zipfile(file_path):
+        yield from iter_word_paragraphs(file_path, line_end)
+        return
+    if not olefile.isOleFile(file_path):
+        raise ValueError('不是Word文档：' + file_path)
+    try:
+        text = _read_doc_text(file_path)
+    except LegacyDocFormatError:
+        if sys.platform != 'win32':
+            raise
+        yield from read_doc_document_with_word(file_path)
+        return
+    text = _strip_doc_fields(text).translate(DOC_CHAR_TABLE)
+    paragraphs = DOC_PARAGRAPH_PATTERN.split(text)
+    # 正文以段落结束符结尾，最后一段为空
+    if paragraphs and not paragraphs[-1]:
+        paragraphs.pop()
+    for paragraph in paragraphs:
+        yield paragraph + line_end
+
+
+def read_doc_document(file_path):
+    return list(iter_doc_paragraphs(file_path))
+
+
+def read_doc_document_with_word(file_path):
+    # 依赖Word COM组件，仅Windows可用
+    from win32com import client
+    word = client.Dispatch("Word.Application")
+    word.Visible = False  # Word应用程序在后台运行，不显示界面
+    file_path = file_path.replace('/', '\\')
+    doc = word.Documents.Open(file_path)
+    paragraphs = []
+    temp_para = ''
+    for para in doc.Paragraphs:
+        if para.Range.Text.strip().isspace():
+            continue
+        temp_para += para.Range.Text.strip() + '\n'  # 使用'\n'来分隔每个段落
+        if len(temp_para) > 126:
+            paragraphs.append(temp_para)
+            temp_para = ''
+    if temp_para:  # 如果最后还有剩余的段落，也添加到列表中
+        paragraphs.append(temp_para)
+    doc.Close(False)
+    word.Quit()
+    return paragraphs
+
+
+# 递归查找可脱敏的文件，跳过Word临时文件和隐藏文件；options见file_discovery.FileDiscovery。
+# 需要边查找边处理时直接迭代FileDiscovery
+def get_file_paths(input_path, **options):
+    return sorted(FileDiscovery(input_path, **options))
+
+
+#检查文件格式并且返回段落文本
+def read_file_context(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.docx':
+        return read_word_document(file_path)
+    elif extension == '.pdf':
+        return read_pdf_document(file_path)
+    elif extension == '.doc':
+        return read_doc_document(file_path)
+    raise ValueError('不支持的文件类型：' + file_path)
+
+# 流式版本的read_file_context；扩展名不区分大小写，与文件查找一致
+def iter_file_context(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.docx':
+        return iter_word_paragraphs(file_path)
+    elif extension == '.pdf':
+        return iter_pdf_pages(file_path)
+    elif extension == '.doc':
+        return iter_doc_paragraphs(file_path)
+    raise ValueError('不支持的文件类型：' + file_path)
+
+# 输出文件先写成同一文件夹下的临时文件，写完再改名，中断时不会留下不完整的输出文件
+OUTPUT_TEMP_PREFIX = '.tuomin-'
+
+
+@contextmanager
+def _atomic_text_file(file_path):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), prefix=OUTPUT_TEMP_PREFIX,
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            yield file
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_to_text_file(file_path, content):
+    with _atomic_text_file(file_path) as file:
+        file.write(content)
+
+# 边脱敏边写入，返回写入的字符数
+def write_chunks_to_text_file(file_path, chunks, separator=''):
+    written = 0
+    with _atomic_text_file(file_path) as file:
+        for index, chunk in enumerate(chunks):
+            if index and separator:
+                file.write(separator)
+            file.write(chunk)
+            written += len(chunk)
+    return written
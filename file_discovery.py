@@ -0,0 +1,121 @@
+import fnmatch
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from result_cache import file_digest
+
+# 并行、增量地查找要脱敏的文件：每个子文件夹作为一个任务用os.scandir扫描，扫到的文件立即返回，
+# 不等整棵目录树遍历完。网络共享上列目录的耗时主要是往返延迟，多个线程同时扫描不同的子文件夹可以重叠这些等待。
+# 同一个文件通过硬链接、符号链接或重复挂载出现多次时只返回一次（按inode，或按内容哈希）
+
+SUPPORTED_SUFFIXES = ('.doc', '.docx', '.pdf')
+DEFAULT_DISCOVERY_WORKERS = 8
+DEDUPE_MODES = ['inode', 'content', 'none']
+
+
+class FileDiscovery:
+    # include/exclude为通配符列表，与相对于input_path的路径（用/分隔）或文件名匹配；
+    # 排除的文件夹不再进入。迭代时按发现顺序返回文件路径，found、duplicates、directories、errors为实时计数
+    def __init__(self, input_path, include=None, exclude=None, suffixes=SUPPORTED_SUFFIXES,
+                 workers=DEFAULT_DISCOVERY_WORKERS, dedupe='inode'):
+        if dedupe not in DEDUPE_MODES:
+            raise ValueError(f'未知的去重方式：{dedupe}，可选：{", ".join(DEDUPE_MODES)}')
+        self.input_path = input_path
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.suffixes = tuple(suffix.lower() for suffix in suffixes)
+        self.workers = max(1, workers)
+        self.dedupe = dedupe
+        self.found = 0
+        self.duplicates = 0
+        self.directories = 0
+        self.errors = 0
+        self.done = False
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.input_path).replace(os.sep, '/')
+
+    def _matches(self, patterns, path, name):
+        relative = self._relative(path)
+        return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+    # 跳过Word临时文件和隐藏文件
+    def _wanted(self, path, name):
+        if name.startswith(('~$', '.')) or not name.lower().endswith(self.suffixes):
+            return False
+        if self.include and not self._matches(self.include, path, name):
+            return False
+        return not (self.exclude and self._matches(self.exclude, path, name))
+
+    def _identity(self, entry):
+        if self.dedupe == 'content':
+            return file_digest(entry.path)
+        if self.dedupe == 'inode':
+            # stat()跟随符号链接取目标文件的inode；Windows上scandir的stat不含inode，改用entry.inode()。
+            # 部分网络文件系统不提供inode，此时不去重
+            stat = entry.stat()
+            inode = stat.st_ino or (0 if entry.is_symlink() else entry.inode())
+            return (stat.st_dev, inode) if inode else None
+        return None
+
+    # 扫描一个文件夹，返回其中的文件和要继续扫描的子文件夹
+    def _scan(self, directory):
+        files = []
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not (self.exclude and self._matches(self.exclude, entry.path, entry.name)):
+                                subdirectories.append(entry.path)
+                        elif entry.is_file() and self._wanted(entry.path, entry.name):
+                            files.append((entry.path, self._identity(entry)))
+                    except OSError:
+                        with self._lock:
+                            self.errors += 1
+        except OSError:
+            with self._lock:
+                self.errors += 1
+        return files, subdirectories
+
+    def _accept(self, identity):
+        if identity is None:
+            return True
+        if identity in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(identity)
+        return True
+
+    def __iter__(self):
+        if os.path.isfile(self.input_path):
+            self.found = 1
+            self.done = True
+            yield self.input_path
+            return
+        results = queue.Queue()
+        pending = 1
+        executor = ThreadPoolExecutor(self.workers)
+        try:
+            executor.submit(self._scan, self.input_path).add_done_callback(results.put)
+            while pending:
+                future = results.get()
+                pending -= 1
+                self.directories += 1
+                files, subdirectories = future.result()
+                for subdirectory in subdirectories:
+                    pending += 1
+                    executor.submit(self._scan, subdirectory).add_done_callback(results.put)
+                for file_path, identity in files:
+                    if self._accept(identity):
+                        self.found += 1
+                        yield file_path
+            self.done = True
+        finally:
+            # 提前停止时不再扫描新的文件夹
+            executor.shutdown(wait=False, cancel_futures=True)
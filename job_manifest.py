@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+
+from doc_readers import OUTPUT_TEMP_PREFIX
+from result_cache import file_digest
+
+# 批量任务清单：在输出文件夹中追加写入每个输入文件的处理结果（路径、大小、修改时间、内容哈希、状态、输出文件），
+# 中断或崩溃后再次运行时跳过已完成且未改动的文件，只处理新增、改动或失败的文件。
+# 每条记录写入后立即落盘，最后一行不完整（写到一半时断电）时忽略该行
+
+MANIFEST_FILE_NAME = '.tuomin_manifest.jsonl'
+STATUS_DONE = 'done'
+STATUS_SKIPPED = 'skipped'  # 空文档，没有输出
+STATUS_ERROR = 'error'
+
+
+def _file_key(file_path):
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+class JobManifest:
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.entries = {}
+        self.resumed = 0
+        self._lock = threading.Lock()
+        complete = True
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    complete = line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['file']] = entry
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        if not complete:
+            self._file.write('\n')  # 不完整的最后一行单独成行，不影响之后的记录
+
+    @classmethod
+    def for_output(cls, output_path):
+        return cls(os.path.join(output_path, MANIFEST_FILE_NAME))
+
+    # 已完成且输入未改动、输出仍在时返回True。大小和修改时间都没变时不重新计算哈希
+    def is_done(self, file_path):
+        entry = self.entries.get(_file_key(file_path))
+        if entry is None or entry['status'] not in (STATUS_DONE, STATUS_SKIPPED):
+            return False
+        if entry.get('output') and not os.path.exists(os.path.join(self.directory, entry['output'])):
+            return False
+        try:
+            stat = os.stat(file_path)
+            if stat.st_size != entry['size']:
+                return False
+            if stat.st_mtime_ns == entry['mtime_ns']:
+                return True
+            return file_digest(file_path) == entry['sha256']
+        except OSError:
+            return False
+
+    # 逐个返回还需要处理的文件，可以边查找边过滤；跳过的数量累计在resumed中
+    def pending(self, file_paths):
+        for file_path in file_paths:
+            if self.is_done(file_path):
+                self.resumed += 1
+            else:
+                yield file_path
+
+    # sha256为调用方已经算好的内容哈希（如查结果缓存时算的），不传时在这里计算
+    def record(self, file_path, status, output_file=None, error=None, sha256=None):
+        entry = {'file': _file_key(file_path), 'status': status, 'time': round(time.time(), 3)}
+        try:
+            stat = os.stat(file_path)
+            if status != STATUS_ERROR:
+                sha256 = sha256 or file_digest(file_path)
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                         sha256=sha256 if status != STATUS_ERROR else None)
+        except OSError as e:
+            entry.update(status=STATUS_ERROR, error=str(e))
+        if output_file:
+            entry['output'] = os.path.relpath(os.path.abspath(output_file), self.directory)
+        if error:
+            entry['error'] = error
+        # 多进程模式下在进程池取文件的线程和结果线程中都会记录
+        with self._lock:
+            self.entries[entry['file']] = entry
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    # 删除上次中断时留下的临时输出文件
+    def clean_temp_files(self):
+        for name in os.listdir(self.directory):
+            if name.startswith(OUTPUT_TEMP_PREFIX) and name.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def close(self):
+        self._file.close()
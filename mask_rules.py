@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import re
+
+# 脱敏规则引擎：正则规则、词典和单位后缀统一从规则文件加载，加载时一次性编译，
+# 各个版本（本地模型、接口、Gradio）共用同一套规则
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mask_rules.json')
+
+_default_rules = {}
+
+
+class MaskRules:
+    def __init__(self, config, mask=None):
+        self.version = str(config.get('version', '1'))
+        self.mask = config.get('mask', '**') if mask is None else mask
+        self.sensitive_labels = frozenset(config.get('sensitive_labels', ()))
+        self.unit_suffixes = frozenset(config.get('unit_suffixes', ()))
+        # 从长到短检查后缀，与正则“(局|公司|…|社区)$”取最靠左匹配的结果一致
+        self._suffix_lengths = sorted({len(suffix) for suffix in self.unit_suffixes}, reverse=True)
+
+        # 所有正则规则和词典合并成一个带命名分组的模式，每个数据块只扫描一遍
+        alternatives = []
+        self._templates = {}
+        for index, rule in enumerate(config.get('patterns', ())):
+            group = f'_rule{index}'
+            alternatives.append(f'(?P<{group}>{rule["pattern"]})')
+            self._templates[group] = rule.get('replace', '{mask}')
+        terms = sorted(set(config.get('terms', ())), key=len, reverse=True)
+        if terms:
+            alternatives.append('(?P<_terms>' + '|'.join(re.escape(term) for term in terms) + ')')
+            self._templates['_terms'] = '{mask}'
+        self._pattern = re.compile('|'.join(alternatives)) if alternatives else None
+
+        canonical = json.dumps([config, self.mask], ensure_ascii=False, sort_keys=True)
+        self.fingerprint = self.version + '-' + hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+    def _replace(self, match):
+        groups = {name: value or '' for name, value in match.groupdict().items() if not name.startswith('_')}
+        return self._templates[match.lastgroup].format(mask=self.mask, **groups)
+
+    # 正则和词典初步脱敏
+    def pre_mask(self, chunk):
+        if self._pattern is None:
+            return chunk
+        return self._pattern.sub(self._replace, chunk)
+
+    def unit_suffix(self, entity_text):
+        for length in self._suffix_lengths:
+            if len(entity_text) >= length and entity_text[-length:] in self.unit_suffixes:
+                return entity_text[-length:]
+        return ''
+
+    # 实体的替换文本，保留“局、公司、市”等单位后缀；不需要脱敏的实体返回None
+    def replacement(self, entity_text, label):
+        if label not in self.sensitive_labels:
+            return None
+        return self.mask + self.unit_suffix(entity_text)
+
+    # 收集需要替换的区间，重叠或相邻的区间合并为一个，返回按位置排序的[(start, end, replacement, label)]，
+    # 可直接作为机器可读的脱敏位置记录。实体可以带第5项，直接指定替换文本（见desensitize_core._core_entities：
+    # 被数据块边界截断的实体，是否保留后缀要看块外的文字）
+    def mask_spans(self, chunk, entities):
+        spans = []
+        # 最后一个区间末尾保留的原文：指定了替换文本的实体为掩码之后的部分，None表示按单位后缀计算
+        tail = None
+        for entity in sorted(entities, key=lambda entity: (entity[2], entity[3])):
+            entity_text, label, start, end = entity[:4]
+            if len(entity) > 4:
+                replacement = entity[4]
+                entity_tail = replacement[len(self.mask):] if replacement.startswith(self.mask) else replacement
+            else:
+                replacement = self.replacement(entity_text, label)
+                entity_tail = None
+            if replacement is None:
+                continue
+            if spans and start <= spans[-1][1]:
+                last_start, last_end, last_replacement, last_label = spans[-1]
+                labels = last_label if label in last_label.split('+') else last_label + '+' + label
+                if start == last_end:
+                    # 相邻实体：依次保留各自的替换文本
+                    spans[-1] = (last_start, end, last_replacement + replacement, labels)
+                    tail = entity_tail
+                else:
+                    # 重叠实体：整个区间替换一次，末尾保留结束得最晚的实体的后缀
+                    if end > last_end or (end == last_end and entity_tail is not None):
+                        tail = entity_tail
+                    end = max(end, last_end)
+                    suffix = self.unit_suffix(chunk[last_start:end]) if tail is None else tail
+                    spans[-1] = (last_start, end, self.mask + suffix, labels)
+                continue
+            spans.append((start, end, replacement, label))
+            tail = entity_tail
+        return spans
+
+    # 按区间列表一次拼接出脱敏后的文本
+    def apply_spans(self, chunk, spans):
+        parts = []
+        position = 0
+        for start, end, replacement, label in spans:
+            parts.append(chunk[position:start])
+            parts.append(replacement)
+            position = end
+        parts.append(chunk[position:])
+        return ''.join(parts)
+
+    def mask_entities(self, chunk, entities):
+        return self.apply_spans(chunk, self.mask_spans(chunk, entities))
+
+
+def load_rules(path=None, mask=None):
+    with open(path or DEFAULT_RULES_FILE, 'r', encoding='utf-8') as file:
+        return MaskRules(json.load(file), mask=mask)
+
+
+# 默认规则文件只加载、编译一次
+def default_rules(mask=None):
+    if mask not in _default_rules:
+        _default_rules[mask] = load_rules(mask=mask)
+    return _default_rules[mask]
@@ -0,0 +1,78 @@
+import os
+import sys
+import threading
+import time
+
+# 模型在首次使用时才加载，每个进程只加载一次；界面可以先显示，模型在后台线程中加载
+
+PROCESS_START = time.perf_counter()
+LOCAL_MODEL_NAME = 'ner_bert_base_msra_20211227_114712'
+# HanLP预训练模型的名字，加载时再到hanlp.pretrained.ner中解析，避免启动时导入hanlp
+MSRA_NER_BERT_BASE_ZH = 'MSRA_NER_BERT_BASE_ZH'
+
+_lock = threading.Lock()
+_models = {}
+startup_timings = {}
+
+
+def application_path():
+    if getattr(sys, 'frozen', False):
+        return sys._MEIPASS
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def default_model_path():
+    return os.path.join(application_path(), LOCAL_MODEL_NAME)
+
+
+# 记录启动阶段耗时（相对进程启动），同一事件只记录第一次
+def mark_startup(event):
+    if event not in startup_timings:
+        startup_timings[event] = time.perf_counter() - PROCESS_START
+    return startup_timings[event]
+
+
+def _load(model):
+    huggingface_cache_path = os.path.join(application_path(), 'huggingface')
+    if os.path.isdir(huggingface_cache_path):
+        os.environ.setdefault('TRANSFORMERS_CACHE', huggingface_cache_path)
+    import hanlp
+    from hanlp.pretrained import ner
+    from ner_cache import CachedNerModel
+    # 模型外包一层数据块级LRU缓存，重复的数据块不再调用模型
+    return CachedNerModel(hanlp.load(getattr(ner, model, model)))
+
+
+def get_ner_model(model=None):
+    model = model or default_model_path()
+    with _lock:
+        if model not in _models:
+            _models[model] = _load(model)
+            mark_startup('model_loaded')
+        return _models[model]
+
+
+def is_model_loaded(model=None):
+    return (model or default_model_path()) in _models
+
+
+# 在后台线程中预加载模型，加载完成或失败后调用callback(错误信息或None)
+def preload_ner_model(model=None, callback=None):
+    def _run():
+        try:
+            get_ner_model(model)
+            error = None
+        except Exception as e:
+            error = str(e)
+        if callback:
+            callback(error)
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report():
+    names = [('window', '窗口显示'), ('model_loaded', '模型加载完成'), ('first_chunk', '首个数据块完成')]
+    parts = [f'{label} {startup_timings[key]:.2f}s' for key, label in names if key in startup_timings]
+    return '启动耗时：' + '，'.join(parts) if parts else ''
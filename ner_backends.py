@@ -0,0 +1,70 @@
+import json
+import re
+
+from desensitize_core import batch_ner, DEFAULT_BATCH_SIZE
+from model_loader import get_ner_model
+from remote_ner import RemoteNerClient, LtpRestClient, LocalNerFallback
+
+# 可替换的实体识别引擎：统一为recognize(chunks)，返回与chunks一一对应的实体列表
+# [(实体, 类型, start, end)]，偏移量相对各自的数据块。类型保留各引擎自己的标签，
+# 是否脱敏由mask_rules.json中的sensitive_labels决定
+
+BACKEND_NAMES = ['local', 'hanlp-rest', 'ltp-rest', 'rules']
+
+
+class LocalHanlpBackend:
+    # 本地HanLP模型，同一进程内与其他版本共用get_ner_model加载的模型
+    def __init__(self, model=None, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+
+    def recognize(self, chunks):
+        return batch_ner(get_ner_model(self.model), list(chunks), self.batch_size)
+
+
+class RuleBackend:
+    # 只用词典识别实体，不加载模型，速度最快；召回率取决于词典的完整程度。
+    # dictionary为{类型: [词条]}，也可以从同样格式的JSON文件加载
+    def __init__(self, dictionary=None, dictionary_file=None):
+        dictionary = dict(dictionary or {})
+        if dictionary_file:
+            with open(dictionary_file, 'r', encoding='utf-8') as file:
+                for label, terms in json.load(file).items():
+                    dictionary[label] = list(dictionary.get(label, [])) + terms
+        self._labels = {}
+        for label, terms in dictionary.items():
+            for term in terms:
+                if term:
+                    self._labels.setdefault(term, label)
+        # 词条按长度从长到短排列，重叠时优先匹配更长的实体
+        terms = sorted(self._labels, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(term) for term in terms)) if terms else None
+
+    def recognize(self, chunks):
+        if self._pattern is None:
+            return [[] for _ in chunks]
+        return [[(match.group(), self._labels[match.group()], match.start(), match.end())
+                 for match in self._pattern.finditer(chunk)] for chunk in chunks]
+
+
+# 按名字创建引擎，options中与该引擎无关的参数会被忽略：
+# local: model, batch_size；hanlp-rest: url, token；ltp-rest: appid, api_key；rules: dictionary_file。
+# 远程引擎失败或熔断时改用本地模型(model)识别
+def create_backend(name='local', model=None, batch_size=DEFAULT_BATCH_SIZE, url=None, token=None,
+                   appid=None, api_key=None, dictionary_file=None, **client_options):
+    if name == 'local':
+        return LocalHanlpBackend(model, batch_size)
+    if name == 'rules':
+        return RuleBackend(dictionary_file=dictionary_file)
+    fallback = LocalNerFallback(model, batch_size=batch_size)
+    if name == 'hanlp-rest':
+        if not url or not token:
+            raise ValueError('hanlp-rest引擎需要接口地址和token')
+        return RemoteNerClient(url, token, fallback=fallback, **client_options)
+    if name == 'ltp-rest':
+        if not appid or not api_key:
+            raise ValueError('ltp-rest引擎需要appid和api_key')
+        if url:
+            client_options['url'] = url
+        return LtpRestClient(appid, api_key, fallback=fallback, **client_options)
+    raise ValueError(f'未知的NER引擎：{name}，可选：{", ".join(BACKEND_NAMES)}')
@@ -0,0 +1,115 @@
+import argparse
+import json
+import sys
+import time
+
+from desensitize_core import split_text, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH
+from doc_readers import iter_file_context, deal_path, get_file_paths, EmptyDocumentError
+from mask_rules import default_rules
+from model_loader import default_model_path
+from ner_backends import create_backend, BACKEND_NAMES
+
+# 在同一批语料上比较各NER引擎的吞吐量和召回率，用来为每个任务挑选满足召回要求的最便宜的引擎。
+# 召回率以--reference引擎（默认本地模型）识别出的需脱敏实体为准，只比较实体位置
+# 用法：python ner_benchmark.py 语料文件夹 --backends local,rules --dictionary dict.json
+
+
+def load_corpus(input_path, max_length=DEFAULT_MAX_LENGTH, limit=None):
+    chunks = []
+    for file_path in get_file_paths(input_path):
+        try:
+            for paragraph in iter_file_context(deal_path(file_path)):
+                chunks.extend(split_text(paragraph, max_length=max_length))
+        except EmptyDocumentError:
+            continue
+        if limit and len(chunks) >= limit:
+            return chunks[:limit]
+    return chunks
+
+
+# 需要脱敏的实体位置集合：(数据块序号, start, end)
+def sensitive_spans(entities_list, rules):
+    return {(index, start, end)
+            for index, entities in enumerate(entities_list)
+            for entity_text, label, start, end in entities
+            if label in rules.sensitive_labels}
+
+
+def run_backend(backend, chunks):
+    start_time = time.perf_counter()
+    entities_list = backend.recognize(chunks)
+    return entities_list, time.perf_counter() - start_time
+
+
+def benchmark(chunks, backends, reference, rules=None):
+    rules = rules or default_rules()
+    chars = sum(len(chunk) for chunk in chunks)
+    results = {}
+    for name, backend in backends.items():
+        entities_list, elapsed = run_backend(backend, chunks)
+        results[name] = {'spans': sensitive_spans(entities_list, rules), 'seconds': elapsed}
+    gold = results[reference]['spans']
+
+    rows = []
+    for name, result in results.items():
+        found = result['spans']
+        elapsed = max(result['seconds'], 1e-9)
+        rows.append({
+            'backend': name,
+            'seconds': round(result['seconds'], 3),
+            'chunks_per_second': round(len(chunks) / elapsed, 1),
+            'chars_per_second': round(chars / elapsed, 1),
+            'entities': len(found),
+            'recall': round(len(found & gold) / len(gold), 4) if gold else 1.0,
+            'precision': round(len(found & gold) / len(found), 4) if found else 1.0,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ner_benchmark', description='比较各NER引擎的吞吐量和召回率')
+    parser.add_argument('input', help='语料文件或文件夹（docx/doc/pdf）')
+    parser.add_argument('--backends', default='local,rules', help='逗号分隔的引擎列表，可选：' + ','.join(BACKEND_NAMES))
+    parser.add_argument('--reference', default='local', help='作为召回率基准的引擎')
+    parser.add_argument('--model', default=default_model_path())
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH)
+    parser.add_argument('--limit', type=int, help='最多使用的数据块数')
+    parser.add_argument('--api-url')
+    parser.add_argument('--api-token')
+    parser.add_argument('--ltp-appid')
+    parser.add_argument('--ltp-key')
+    parser.add_argument('--dictionary')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.backends.split(',') if name.strip()]
+    if args.reference not in names:
+        names.insert(0, args.reference)
+    backends = {name: create_backend(name, model=args.model, batch_size=args.batch_size, url=args.api_url,
+                                     token=args.api_token, appid=args.ltp_appid, api_key=args.ltp_key,
+                                     dictionary_file=args.dictionary)
+                for name in names}
+    chunks = load_corpus(args.input, args.max_length, args.limit)
+    if not chunks:
+        print('语料为空', file=sys.stderr)
+        return 2
+
+    rows = benchmark(chunks, backends, args.reference)
+    if args.json:
+        print(json.dumps({'chunks': len(chunks), 'reference': args.reference, 'results': rows},
+                         ensure_ascii=False, indent=2))
+    else:
+        print(f'数据块 {len(chunks)} 个，召回率基准：{args.reference}')
+        print(f'{"引擎":<12}{"耗时(s)":>10}{"chunks/s":>12}{"chars/s":>12}{"实体":>8}{"召回率":>8}{"精确率":>8}')
+        for row in rows:
+            print(f'{row["backend"]:<12}{row["seconds"]:>10.3f}{row["chunks_per_second"]:>12.1f}'
+                  f'{row["chars_per_second"]:>12.1f}{row["entities"]:>8}{row["recall"]:>8.2%}{row["precision"]:>8.2%}')
+    for backend in backends.values():
+        if hasattr(backend, 'close'):
+            backend.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
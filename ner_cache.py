@@ -0,0 +1,75 @@
+import sys
+import threading
+
+from cachetools import LRUCache
+
+# 数据块级NER结果缓存：公文中法规引用、页眉页脚、落款等句子大量重复，
+# 相同文本的数据块直接复用上次的实体列表，不再调用模型
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+# 估算一条缓存占用的内存：数据块文本加实体元组
+def _entry_size(value):
+    entities, key_size = value
+    return key_size + sys.getsizeof(entities) + sum(sys.getsizeof(entity) + 64 for entity in entities)
+
+
+class CachedNerModel:
+    # 包装HanLP模型，调用方式与原模型相同：单条字符串，或字符列表组成的批量输入
+    def __init__(self, ner_model, max_bytes=DEFAULT_MAX_BYTES):
+        self.ner_model = ner_model
+        self._cache = LRUCache(maxsize=max_bytes, getsizeof=_entry_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value[0]
+
+    def _put(self, key, entities):
+        entities = list(entities)
+        with self._lock:
+            try:
+                self._cache[key] = (entities, sys.getsizeof(key))
+            except ValueError:
+                pass  # 单条超过缓存上限时不缓存
+        return entities
+
+    def __call__(self, inputs, batch_size=None, **kwargs):
+        if isinstance(inputs, str):
+            entities = self._get(inputs)
+            if entities is None:
+                entities = self._put(inputs, self.ner_model(inputs, **kwargs))
+            return entities
+
+        keys = [item if isinstance(item, str) else ''.join(item) for item in inputs]
+        results = [self._get(key) for key in keys]
+        # 同一批中重复的数据块只送入模型一次
+        missing = {}
+        for key, item, entities in zip(keys, inputs, results):
+            if entities is None and key not in missing:
+                missing[key] = item
+        if missing:
+            if batch_size is None:
+                predicted = self.ner_model(list(missing.values()), **kwargs)
+            else:
+                predicted = self.ner_model(list(missing.values()), batch_size=batch_size, **kwargs)
+            for key, entities in zip(missing, predicted):
+                missing[key] = self._put(key, entities)
+            results = [missing[key] if entities is None else entities for key, entities in zip(keys, results)]
+        return results
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return (f'NER缓存：命中{self.hits}次，未命中{self.misses}次，命中率{self.hit_rate() * 100:.1f}%，'
+                f'缓存{len(self._cache)}条')
@@ -0,0 +1,73 @@
+import argparse
+import json
+import random
+import re
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地NER接口桩服务：返回格式与net_version使用的HanLP接口相同，可设置延迟模拟网络往返，
+# 用于在没有真实接口时测试remote_ner的并发、合并请求和限速
+# 用法：python ner_stub_server.py --port 8765 --delay 0.05 [--fail-rate 0.3]
+
+# 只识别固定词表，足够检验实体偏移量和脱敏结果
+ENTITY_PATTERN = re.compile(r'(?P<PERSON>张三|李四|王五)|(?P<LOCATION>北京市|连云港市|海州区)|(?P<ORGANIZATION>审计局)')
+
+
+def recognize(text):
+    return [[match.group(), match.lastgroup, match.start(), match.end()] for match in ENTITY_PATTERN.finditer(text)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持keep-alive
+    delay = 0.0
+    fail_rate = 0.0
+    requests_served = 0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'), keep_blank_values=True)
+        text = form.get('text', [''])[0]
+        if self.delay:
+            time.sleep(self.delay)
+        StubHandler.requests_served += 1
+        if random.random() < self.fail_rate:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps({'data': {'ner/msra': recognize(text)}}, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端已超时断开
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=0, delay=0.0, fail_rate=0.0):
+    handler = type('Handler', (StubHandler,), {'delay': delay, 'fail_rate': fail_rate})
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地NER接口桩服务')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='每个请求的模拟延迟（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='返回503的请求比例，用于测试重试和熔断')
+    args = parser.parse_args(argv)
+    server = make_server(args.port, args.delay, args.fail_rate)
+    print(f'NER桩服务：http://127.0.0.1:{server.server_address[1]}/ner')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,16 @@
 import sys
-import re
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QProgressBar, QTextEdit, QFileDialog
 from PyQt5.QtCore import QThread, pyqtSignal, QObject
 import os
-import requests
 import random
 import string
+from contextlib import closing
 from docx import Document
-
-
-# 新的脱敏函数，使用API进行实体识别和脱敏
-def desensitize_with_api(text):
-    try:
-        url = API_URL
-        headers = {
-            "token": API_TOKEN  # 直接使用 token 而不是 Bearer 方案
-        }
-        data = {
-            "text": text
-        }
-
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()
-
-        result = response.json()
-        return result
-    except Exception as e:
-        return {"error": str(e)}
+from mask_rules import default_rules
+from model_loader import MSRA_NER_BERT_BASE_ZH
+from remote_ner import RemoteNerClient, LocalNerFallback
+from staged_pipeline import StagedPipeline, Stage, FileTask
+from run_metrics import RunMetrics
 
 
 
@@ -44,28 +28,46 @@ class DesensitizeThread(QThread):
         self.input_file_path = input_file_path
         self.output_file_path = output_file_path
         self._is_running = True
+        self.client = None
+        self.pipeline = None
+        self.metrics = RunMetrics()
 
     def run(self):
+        # 同一任务的所有请求共用一个客户端，复用连接；接口持续失败时改用本地模型识别
+        self.client = RemoteNerClient(API_URL, API_TOKEN, fallback=LocalNerFallback(MSRA_NER_BERT_BASE_ZH))
         try:
             file_paths = self._get_file_paths(self.input_file_path)
             total_files = len(file_paths)
             if total_files == 0:
                 raise FileNotFoundError("没有检测到.docx文件！")
 
-            for file_index, file_path in enumerate(file_paths):
-                if not self._is_running:
-                    break
-
-                desensitized_text = self._process_file(file_path)
-                self._save_desensitized_file(file_path, desensitized_text)
-                self._update_progress(file_index, total_files)
-
-            self.finished.emit("脱敏完成. 结果保存至: " + self.output_file_path)
+            # 读取下一个文件与等待接口返回当前文件的结果同时进行
+            self.pipeline = StagedPipeline([
+                Stage('read', self._read_file, workers=2),
+                Stage('ner', self._desensitize_file),
+                Stage('write', self._save_desensitized_file),
+            ])
+            if not self._is_running:
+                self.pipeline.stop()
+            tasks = (FileTask(file_path, self._new_output_file(file_path)) for file_path in file_paths)
+            with closing(self.pipeline.run(tasks)) as results:
+                for file_index, (task, error, seconds) in enumerate(results):
+                    self.metrics.record_task(task, error, seconds)
+                    if error is not None:
+                        raise error
+                    self._update_progress(file_index, total_files)
+
+            self.finished.emit("脱敏完成. 结果保存至: " + self.output_file_path + "\n" + self.client.summary()
+                               + self._save_metrics())
         except Exception as e:
-            self.finished.emit("Error: " + str(e))
+            self.finished.emit("Error: " + str(e) + self._save_metrics())
+        finally:
+            self.client.close()
 
     def stop(self):
         self._is_running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
 
     def _get_file_paths(self, input_path):
         if os.path.isfile(input_path):
@@ -73,48 +75,55 @@ class DesensitizeThread(QThread):
         else:
             return [os.path.join(input_path, f) for f in os.listdir(input_path) if f.endswith('.docx') and not f.startswith('~$')]
 
-    def _process_file(self, file_path):
-        paragraphs = read_word_document(file_path)
+    def _read_file(self, task):
+        with task.metrics.timer('read'):
+            task.data = read_word_document(task.file_path)
+        return task
+
+    def _desensitize_file(self, task):
+        with task.metrics.timer('ner'):
+            task.data = self._desensitize_paragraphs(task.data)
+        return task
+
+    def _desensitize_paragraphs(self, paragraphs):
+        # 整个文件的段落合并成少量请求并发发送
+        entities_list = self.client.recognize(paragraphs)
+        rules = default_rules()
         desensitized_paragraphs = [
-            desensitize_with_api_and_regex(paragraph, desensitize_with_api(paragraph))
-            for paragraph in paragraphs
+            rules.mask_entities(paragraph, entities)
+            for paragraph, entities in zip(paragraphs, entities_list)
         ]
         return '\n'.join(desensitized_paragraphs)
 
-    def _save_desensitized_file(self, original_file_path, desensitized_text):
+    def _new_output_file(self, original_file_path):
         base_name = os.path.splitext(os.path.basename(original_file_path))[0]
         new_file_name = base_name + '_' + ''.join(random.choices(string.ascii_letters + string.digits, k=8)) + '.txt'
-        output_file = os.path.join(self.output_file_path, new_file_name)
-        write_to_text_file(output_file, desensitized_text)
+        return os.path.join(self.output_file_path, new_file_name)
+
+    def _save_desensitized_file(self, task):
+        with task.metrics.timer('write'):
+            write_to_text_file(task.output_file, task.data)
+        task.chars = len(task.data)
+        task.data = None
+        return task
 
     def _update_progress(self, current_index, total_files):
         progress = int((current_index + 1) / total_files * 100)
         self.progress_updated.emit(progress)
 
+    # 运行指标追加写入~/.tuomin/metrics.jsonl，返回附加在完成消息后的提示
+    def _save_metrics(self):
+        if self.pipeline is not None:
+            self.pipeline.add_counters(self.metrics)
+        self.metrics.add_counters('remote_ner_', self.client,
+                                  ['requests_sent', 'retries_done', 'timeouts', 'failures', 'fallbacks'])
+        try:
+            self.metrics.save()
+        except OSError as e:
+            return "\n运行指标写入失败：" + str(e)
+        return ""
 
 
-def desensitize_with_api_and_regex(text, api_response):
-    desensitized_text = text
-    print(api_response)
-    # API 返回的实体数据
-    entities = api_response.get('data', {}).get('ner/msra', [])
-    
-    for ent in reversed(entities):
-        if len(ent) == 4:
-            entity_text, label, start, end = ent
-            # 只处理特定类型的实体
-            if label in ['PERSON', 'LOCATION']:  # 根据您的需要调整实体类型
-                # 用正则表达式找到单位（如“局”，“公司”等）并保留
-                unit = re.search(r'(局|公司|工程|省|市|县|区|街道|社区|小区|花园|苑)$', entity_text)
-                if unit:
-                    replacement = '**' + unit.group()
-                    desensitized_text = desensitized_text[:start] + replacement + desensitized_text[end:]
-                else:
-                    # 如果没有单位，就替换整个实体
-                    desensitized_text = desensitized_text[:start] + '**' + desensitized_text[end:]
-
-    return desensitized_text
-
 
 # 读取Word文档的函数
 def read_word_document(file_path):
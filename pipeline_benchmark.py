@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from docx import Document
+
+from desensitize_core import split_text, batch_ner, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH
+from doc_readers import read_word_document, read_pdf_document, write_to_text_file, deal_path
+from mask_rules import load_rules
+from model_loader import default_model_path
+from ner_backends import create_backend, BACKEND_NAMES
+from staged_pipeline import desensitize_pipeline, FileTask, DEFAULT_READ_WORKERS
+
+# 脱敏流程基准测试：生成（或读取）一批中文文档，分别统计解析、切块、正则初步脱敏、
+# 模型识别、实体替换和写出各阶段的吞吐量、p50/p99延迟和峰值内存，输出JSON便于跟踪性能回退
+# 用法：python pipeline_benchmark.py --generate 20 --output bench.json
+#       python pipeline_benchmark.py --corpus 语料文件夹 --backend rules
+#       python pipeline_benchmark.py --corpus 网络共享上的文件夹 --pipelined   # 与分阶段流水线的总耗时比较
+
+STAGES = ['read', 'split', 'pre_mask', 'ner', 'mask', 'write']
+
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何林高罗'
+GIVEN_NAMES = ['伟', '芳', '娜', '敏', '静', '丽', '强', '磊', '军', '洋', '勇', '艳', '杰', '涛', '明', '超', '秀英', '建华', '志强', '海燕']
+PLACES = ['北京市', '连云港市', '海州区', '江苏省', '灌云县', '新浦街道', '朝阳社区', '幸福小区', '锦绣花园']
+ORGANIZATIONS = ['审计局', '财政局', '住房和城乡建设局', '城建集团有限公司', '港口工程', '市场监督管理局']
+TEMPLATES = [
+    '根据《中华人民共和国审计法》第十六条的规定，{place}{org}派出审计组，对{name}负责的项目进行了审计。',
+    '{name}于2017年12月6日在{place}签订合同，编号{number}，合同金额为{number}万元。',
+    '经查，{org}未按规定公开招标，涉及资金{number}万元，责任人为{name}。',
+    '{place}{org}应当自收到本报告之日起九十日内整改，并将整改结果报送{name}。',
+    '审计组由{name}、{name}组成，审计期间得到了{place}有关单位的配合。',
+]
+
+
+def synthetic_paragraph(rng):
+    def fill(field):
+        if field == 'name':
+            return rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES)
+        if field == 'place':
+            return rng.choice(PLACES)
+        if field == 'org':
+            return rng.choice(ORGANIZATIONS)
+        return str(rng.randint(100, 999999))
+
+    sentences = []
+    for _ in range(rng.randint(1, 6)):
+        template = rng.choice(TEMPLATES)
+        parts = template.split('{')
+        sentence = parts[0]
+        for part in parts[1:]:
+            field, rest = part.split('}', 1)
+            sentence += fill(field) + rest
+        sentences.append(sentence)
+    return ''.join(sentences)
+
+
+def write_docx(file_path, paragraphs):
+    doc = Document()
+    for paragraph in paragraphs:
+        doc.add_paragraph(paragraph)
+    doc.save(file_path)
+
+
+# 生成只含文本层的PDF：Identity-H编码加ToUnicode映射，PyPDF2可以正确提取文字，
+# 但没有嵌入字体，阅读器中显示的字形不正确，只用于测试解析性能
+def write_pdf(file_path, paragraphs, lines_per_page=60, line_length=50):
+    lines = []
+    for paragraph in paragraphs:
+        lines.extend(paragraph[i:i + line_length] for i in range(0, len(paragraph), line_length))
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    cmap = ['/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+            '/CMapName /UCS2 def /CMapType 2 def',
+            '1 begincodespacerange <0000> <FFFF> endcodespacerange']
+    # 只为文本中出现过的高位字节生成映射区间，映射表过大时PyPDF2解析会很慢
+    highs = sorted({ord(char) >> 8 for line in lines for char in line}) or [0]
+    for start in range(0, len(highs), 100):
+        block = highs[start:start + 100]
+        cmap.append(f'{len(block)} beginbfrange')
+        cmap.extend(f'<{high:02X}00> <{high:02X}FF> <{high:02X}00>' for high in block)
+        cmap.append('endbfrange')
+    cmap.append('endcmap CMapName currentdict /CMap defineresource pop end end')
+    cmap = '\n'.join(cmap).encode('ascii')
+
+    catalog = add(None)
+    pages_id = add(None)
+    to_unicode = add(b'<< /Length %d >>\nstream\n' % len(cmap) + cmap + b'\nendstream')
+    descriptor = add(b'<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [0 -200 1000 900] '
+                     b'/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>')
+    cid_font = add(b'<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light '
+                   b'/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> '
+                   b'/FontDescriptor %d 0 R /DW 1000 >>' % descriptor)
+    font = add(b'<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /Identity-H '
+               b'/DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>' % (cid_font, to_unicode))
+    kids = []
+    for page_lines in pages:
+        operations = ['BT', '/F1 10 Tf', '12 TL', '40 800 Td']
+        operations.extend('<' + line.encode('utf-16-be').hex().upper() + '> Tj T*' for line in page_lines)
+        operations.append('ET')
+        content = '\n'.join(operations).encode('ascii')
+        stream = add(b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+        kids.append(add(b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] '
+                        b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>' % (pages_id, font, stream)))
+    objects[catalog - 1] = b'<< /Type /Catalog /Pages %d 0 R >>' % pages_id
+    objects[pages_id - 1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        ' '.join(f'{kid} 0 R' for kid in kids).encode('ascii'), len(kids))
+
+    data = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(data)
+    data += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    data += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    data += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog, xref)
+    with open(file_path, 'wb') as file:
+        file.write(data)
+
+
+def write_txt(file_path, paragraphs):
+    write_to_text_file(file_path, '\n'.join(paragraphs) + '\n')
+
+
+WRITERS = {'docx': write_docx, 'pdf': write_pdf, 'txt': write_txt}
+
+
+# 用固定随机种子生成语料，同样的参数每次生成的文档相同
+def generate_corpus(directory, documents, paragraphs_per_document=50, formats=('docx', 'pdf', 'txt'), seed=0):
+    rng = random.Random(seed)
+    file_paths = []
+    for index in range(documents):
+        extension = formats[index % len(formats)]
+        paragraphs = [synthetic_paragraph(rng) for _ in range(paragraphs_per_document)]
+        file_path = os.path.join(directory, f'doc{index:04d}.{extension}')
+        WRITERS[extension](file_path, paragraphs)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def find_corpus(input_path):
+    if os.path.isfile(input_path):
+        return [input_path]
+    file_paths = []
+    for root, dirs, files in os.walk(input_path):
+        for file in sorted(files):
+            if file.lower().endswith(('.docx', '.pdf', '.txt')) and not file.startswith(('~$', '.')):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+
+def read_document(file_path):
+    if file_path.endswith('.docx'):
+        return read_word_document(file_path)
+    if file_path.endswith('.pdf'):
+        paragraphs = read_pdf_document(file_path)
+        return [] if paragraphs == 'PDF文件为空' else paragraphs
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.readlines()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+# 进程峰值常驻内存（MB），取不到时返回None
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return round(getattr(memory, 'peak_wset', memory.rss) / 1024 / 1024, 1)
+    except ImportError:
+        return None
+
+
+class StageStats:
+    def __init__(self):
+        self.latencies = []
+        self.items = 0
+        self.chars = 0
+        self.seconds = 0.0
+
+    def add(self, seconds, items=1, chars=0):
+        self.seconds += seconds
+        self.items += items
+        self.chars += chars
+        # 批量阶段按条目平摊，得到每个数据块的延迟
+        self.latencies.extend([seconds / items] * items if items else [])
+
+    def report(self):
+        seconds = max(self.seconds, 1e-9)
+        return {
+            'items': self.items,
+            'chars': self.chars,
+            'seconds': round(self.seconds, 4),
+            'items_per_second': round(self.items / seconds, 1),
+            'chars_per_second': round(self.chars / seconds, 1),
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 3),
+        }
+
+
+def run_benchmark(file_paths, backend, rules, output_dir, max_length=DEFAULT_MAX_LENGTH, batch_size=DEFAULT_BATCH_SIZE):
+    stats = {stage: StageStats() for stage in STAGES}
+    clock = time.perf_counter
+    start_time = clock()
+    for file_path in file_paths:
+        started = clock()
+        paragraphs = read_document(deal_path(file_path))
+        stats['read'].add(clock() - started, chars=sum(len(paragraph) for paragraph in paragraphs))
+
+        chunks = []
+        for paragraph in paragraphs:
+            started = clock()
+            paragraph_chunks = split_text(paragraph, max_length=max_length)
+            stats['split'].add(clock() - started, chars=len(paragraph))
+            chunks.extend(paragraph_chunks)
+
+        masked = []
+        for chunk in chunks:
+            started = clock()
+            masked.append(rules.pre_mask(chunk))
+            stats['pre_mask'].add(clock() - started, chars=len(chunk))
+
+        entities_list = []
+        for i in range(0, len(masked), batch_size):
+            batch = masked[i:i + batch_size]
+            started = clock()
+            entities_list.extend(batch_ner(backend, batch, batch_size))
+            stats['ner'].add(clock() - started, items=len(batch), chars=sum(len(chunk) for chunk in batch))
+
+        output = []
+        for chunk, entities in zip(masked, entities_list):
+            started = clock()
+            output.append(rules.mask_entities(chunk, entities))
+            stats['mask'].add(clock() - started, chars=len(chunk))
+
+        text = ''.join(output)
+        started = clock()
+        write_to_text_file(os.path.join(output_dir, os.path.basename(file_path) + '.txt'), text)
+        stats['write'].add(clock() - started, chars=len(text))
+
+    total = clock() - start_time
+    chars = stats['read'].chars
+    return {
+        'files': len(file_paths),
+        'chunks': stats['ner'].items,
+        'chars': chars,
+        'seconds': round(total, 4),
+        'files_per_second': round(len(file_paths) / max(total, 1e-9), 2),
+        'chars_per_second': round(chars / max(total, 1e-9), 1),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': {stage: stats[stage].report() for stage in STAGES},
+    }
+
+
+# 同一批文件用staged_pipeline分阶段流水执行（同样不带上下文、只脱敏一遍），与逐个文件串行的总耗时比较
+def run_pipelined(file_paths, backend, rules, output_dir, max_length=DEFAULT_MAX_LENGTH, batch_size=DEFAULT_BATCH_SIZE,
+                  read_workers=DEFAULT_READ_WORKERS):
+    pipeline = desensitize_pipeline(backend, max_length, batch_size, rules=rules, overlap=0,
+                                    reader=lambda file_path: read_document(deal_path(file_path)),
+                                    read_workers=read_workers)
+    tasks = (FileTask(file_path, os.path.join(output_dir, os.path.basename(file_path) + '.pipelined.txt'))
+             for file_path in file_paths)
+    started = time.perf_counter()
+    errors = sum(error is not None for task, error, seconds in pipeline.run(tasks))
+    total = time.perf_counter() - started
+    return {
+        'seconds': round(total, 4),
+        'files_per_second': round(len(file_paths) / max(total, 1e-9), 2),
+        'errors': errors,
+        'stages': {stage.name: {'workers': stage.workers, 'busy_seconds': round(stage.busy_seconds, 4),
+                                'mean_depth': stage.mean_depth, 'max_depth': stage.max_depth}
+                   for stage in pipeline.stages},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pipeline_benchmark', description='脱敏流程分阶段基准测试')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--corpus', help='已有语料文件或文件夹（docx/pdf/txt）')
+    source.add_argument('--generate', type=int, metavar='N', help='生成N个合成文档')
+    parser.add_argument('--paragraphs', type=int, default=50, help='每个合成文档的段落数')
+    parser.add_argument('--formats', default='docx,pdf,txt', help='合成文档的格式，逗号分隔')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', choices=BACKEND_NAMES, default='local')
+    parser.add_argument('--model', default=default_model_path())
+    parser.add_argument('--dictionary', help='rules引擎的词典文件')
+    parser.add_argument('--rules', help='脱敏规则文件，默认使用mask_rules.json')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH)
+    parser.add_argument('--pipelined', action='store_true', help='再用分阶段流水线跑一遍，比较总耗时')
+    parser.add_argument('--read-workers', type=int, default=DEFAULT_READ_WORKERS, help='流水线读取阶段的线程数')
+    parser.add_argument('--output', help='结果JSON文件，不指定则输出到stdout')
+    args = parser.parse_args(argv)
+
+    backend = create_backend(args.backend, model=args.model, batch_size=args.batch_size,
+                             dictionary_file=args.dictionary)
+    rules = load_rules(args.rules)
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.generate:
+            formats = tuple(extension.strip() for extension in args.formats.split(',') if extension.strip())
+            corpus_dir = os.path.join(work_dir, 'corpus')
+            os.makedirs(corpus_dir)
+            file_paths = generate_corpus(corpus_dir, args.generate, args.paragraphs, formats, args.seed)
+        else:
+            file_paths = find_corpus(args.corpus)
+        output_dir = os.path.join(work_dir, 'output')
+        os.makedirs(output_dir)
+        result = run_benchmark(file_paths, backend, rules, output_dir, args.max_length, args.batch_size)
+        if args.pipelined:
+            result['pipelined'] = run_pipelined(file_paths, backend, rules, output_dir, args.max_length,
+                                                args.batch_size, args.read_workers)
+            result['pipelined']['speedup'] = round(result['seconds'] / max(result['pipelined']['seconds'], 1e-9), 2)
+
+    result['config'] = {
+        'backend': args.backend,
+        'model': os.path.basename(os.path.normpath(args.model)) if args.backend == 'local' else None,
+        'batch_size': args.batch_size,
+        'max_length': args.max_length,
+        'rules': rules.fingerprint,
+        'corpus': args.corpus or {'generated': args.generate, 'paragraphs': args.paragraphs,
+                                  'formats': args.formats, 'seed': args.seed},
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    report = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        write_to_text_file(args.output, report + '\n')
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
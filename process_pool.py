@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import time
+
+from desensitize_core import iter_desensitized_chunks, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH, DEFAULT_OVERLAP
+from doc_readers import iter_file_context, deal_path, write_chunks_to_text_file, EmptyDocumentError
+from model_loader import get_ner_model
+from run_metrics import RunMetrics
+
+# 工作进程内的模型和脱敏参数，由_init_worker在进程启动时设置一次
+_ner_model = None
+_options = None
+
+
+def _init_worker(model_path, options):
+    global _ner_model, _options
+    if options['backend'] == 'local':
+        _ner_model = get_ner_model(model_path)
+    else:
+        from ner_backends import create_backend
+        _ner_model = create_backend(options['backend'], model=model_path, batch_size=options['batch_size'],
+                                    **options['backend_options'])
+    _options = options
+
+
+# 在工作进程中边读取、边脱敏、边写出单个文件，与单进程流水线一样只在内存中保留一批数据块，
+# 脱敏文本不经过主进程。返回(文件路径, 写入字符数, 错误信息, 各阶段统计)，空文件的字符数为None
+def _desensitize_file(task):
+    file_path, output_file = task
+    metrics = RunMetrics()
+    try:
+        started = time.perf_counter()
+        chunks = iter_desensitized_chunks(_ner_model, iter_file_context(deal_path(file_path)), _options['max_length'],
+                                          _options['batch_size'], rules=_options['rules'], passes=_options['passes'],
+                                          metrics=metrics, overlap=_options['overlap'], length=_options['length'])
+        chars = write_chunks_to_text_file(output_file, chunks)
+        # 读取、切块和识别的耗时已经记在各自的阶段中，其余的是写出耗时
+        metrics.add_time('write', time.perf_counter() - started - sum(metrics.stage_seconds.values()))
+        return file_path, chars, None, metrics.stats()
+    except EmptyDocumentError:
+        return file_path, None, None, metrics.stats()
+    except Exception as e:
+        return file_path, None, str(e), metrics.stats()
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+class DocumentPool:
+    # 多进程文档池：每个进程加载一次模型，从共享任务队列中领取文件路径
+    def __init__(self, model_path, workers=None, passes=1, batch_size=DEFAULT_BATCH_SIZE,
+                 max_length=DEFAULT_MAX_LENGTH, rules=None, backend='local', backend_options=None,
+                 overlap=DEFAULT_OVERLAP, length=len):
+        self.model_path = model_path
+        self.workers = workers or default_workers()
+        self.options = {
+            'passes': passes,
+            'batch_size': batch_size,
+            'max_length': max_length,
+            'overlap': overlap,
+            'length': length,
+            'rules': rules,
+            'backend': backend,
+            'backend_options': backend_options or {},
+        }
+
+    # tasks为(文件路径, 输出文件)，工作进程直接写出输出文件。
+    # 按完成顺序逐个返回结果；提前关闭生成器会终止所有工作进程
+    def imap(self, tasks):
+        # 使用spawn避免fork带入父进程已加载的模型和Qt状态
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(self.workers, initializer=_init_worker, initargs=(self.model_path, self.options)) as pool:
+            for result in pool.imap_unordered(_desensitize_file, tasks, chunksize=1):
+                yield result
@@ -0,0 +1,356 @@
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from desensitize_core import batch_ner, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH
+from model_loader import get_ner_model
+
+# 远程NER接口客户端：复用长连接，限制同时在途的请求数，把多个段落合并成一个请求，
+# 并用令牌桶限制请求速率，使吞吐量只受服务端限制而不受往返延迟限制。
+# 失败的请求按指数退避加随机抖动重试；接口连续失败时熔断，改用本地HanLP模型识别，
+# 不会因为接口异常把未脱敏的段落写出去
+
+LTP_NER_URL = 'http://ltpapi.xfyun.cn/v1/ner'
+LTP_CWS_URL = 'http://ltpapi.xfyun.cn/v1/cws'
+# 讯飞LTP接口单次文本不超过500字节
+LTP_MAX_REQUEST_CHARS = 150
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_REQUEST_CHARS = 2000
+DEFAULT_TIMEOUT = (5, 30)  # (连接超时, 读取超时)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 8
+# 这些状态码说明服务端暂时不可用，值得重试；其他4xx重试也不会成功
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+# 合并请求时段落之间的分隔符，按字符偏移把实体拆回各段落
+JOIN_SEPARATOR = '\n'
+
+
+class RemoteNerError(Exception):
+    pass
+
+
+class TokenBucket:
+    # rate为每秒补充的令牌数，capacity为允许的突发请求数；rate为None时不限速
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate or 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    # 检查和扣减令牌之间没有await，在同一个事件循环中不需要加锁
+    async def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+PROBE = 'probe'
+
+
+class CircuitBreaker:
+    # 连续失败failure_threshold次后熔断，reset_timeout秒后放行一个试探请求，成功则恢复
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    # 放行时返回True，半开状态下放行的试探请求返回PROBE（同样为真），结束后调用end_probe
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probing:
+                self._probing = True
+                return PROBE
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    # 试探请求以RemoteNerError以外的异常结束时，既不算成功也不算失败，下一个请求可以重新试探
+    def end_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._probing:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class LocalNerFallback:
+    # 接口不可用时用本地HanLP模型识别段落，返回与接口相同格式的实体列表。
+    # 段落按固定长度切块，实体偏移量可以直接加上块的起点
+    def __init__(self, model=None, max_length=DEFAULT_MAX_LENGTH, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+    def __call__(self, texts):
+        chunks = []
+        owners = []
+        for index, text in enumerate(texts):
+            for start in range(0, len(text), self.max_length):
+                chunks.append(text[start:start + self.max_length])
+                owners.append((index, start))
+        results = [[] for _ in texts]
+        if not chunks:
+            return results
+        entities_list = batch_ner(get_ner_model(self.model), chunks, self.batch_size)
+        for (index, offset), entities in zip(owners, entities_list):
+            for entity_text, label, start, end in entities:
+                results[index].append((entity_text, label, start + offset, end + offset))
+        return results
+
+
+# 按字符数把段落分组，每组合并为一个请求；max_chars<=0时每个段落单独请求
+def coalesce(texts, max_chars=DEFAULT_MAX_REQUEST_CHARS):
+    groups = []
+    group = []
+    size = 0
+    for index, text in enumerate(texts):
+        if group and (max_chars <= 0 or size + len(JOIN_SEPARATOR) + len(text) > max_chars):
+            groups.append(group)
+            group = []
+            size = 0
+        size += len(text) + (len(JOIN_SEPARATOR) if group else 0)
+        group.append(index)
+    if group:
+        groups.append(group)
+    return groups
+
+
+# 把合并请求返回的实体按偏移量拆回各段落，偏移量改为相对段落开头
+def split_entities(texts, entities):
+    results = [[] for _ in texts]
+    offsets = []
+    position = 0
+    for text in texts:
+        offsets.append(position)
+        position += len(text) + len(JOIN_SEPARATOR)
+    index = 0
+    for entity in sorted(entities, key=lambda entity: entity[2]):
+        entity_text, label, start, end = entity
+        while index + 1 < len(texts) and start >= offsets[index + 1]:
+            index += 1
+        if end <= offsets[index] + len(texts[index]):
+            results[index].append((entity_text, label, start - offsets[index], end - offsets[index]))
+    return results
+
+
+class RemoteNerClient:
+    # fallback为None时，接口失败或熔断会抛出RemoteNerError；传入LocalNerFallback则改用本地模型
+    def __init__(self, url, token, concurrency=DEFAULT_CONCURRENCY, rate=None,
+                 max_request_chars=DEFAULT_MAX_REQUEST_CHARS, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 breaker=None, fallback=None):
+        self.url = url
+        self.token = token
+        self.concurrency = concurrency
+        self.max_request_chars = max_request_chars
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate)
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback = fallback
+        # 连接池大小与并发数一致，所有请求复用keep-alive连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # 本地模型不支持多线程同时调用，回退识别串行执行
+        self._fallback_executor = ThreadPoolExecutor(max_workers=1)
+        self.requests_sent = 0
+        self.retries_done = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.fallbacks = 0
+
+    # 同步发送一个请求，返回接口的原始JSON
+    def post(self, text):
+        response = self.session.post(self.url, headers={'token': self.token}, data={'text': text},
+                                     timeout=self.timeout)
+        self.requests_sent += 1
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def entities_from_response(result):
+        if 'error' in result:
+            raise RemoteNerError(result['error'])
+        entities = (result.get('data') or {}).get('ner/msra', [])
+        return [tuple(entity) for entity in entities if len(entity) == 4]
+
+    # 识别一段文本，返回实体列表；不同接口的子类重写这个方法
+    def fetch(self, text):
+        return self.entities_from_response(self.post(text))
+
+    @staticmethod
+    def _retryable(error):
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in RETRY_STATUS_CODES
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    # 发送一个请求，可重试的错误按指数退避加随机抖动重试，返回实体列表
+    async def _request(self, text):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            try:
+                return await loop.run_in_executor(self._executor, self.fetch, text)
+            except requests.Timeout as e:
+                self.timeouts += 1
+                error = e
+            except (requests.RequestException, ValueError, RemoteNerError) as e:
+                error = e
+            if attempt == self.retries or not self._retryable(error):
+                raise RemoteNerError(str(error)) from error
+            self.retries_done += 1
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    async def _recognize_group(self, semaphore, texts):
+        async with semaphore:
+            allowed = self.breaker.allow()
+            if allowed:
+                try:
+                    entities = await self._request(JOIN_SEPARATOR.join(texts))
+                    self.breaker.record_success()
+                    return split_entities(texts, entities)
+                except RemoteNerError:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    if self.fallback is None:
+                        raise
+                finally:
+                    if allowed == PROBE:
+                        self.breaker.end_probe()
+            elif self.fallback is None:
+                raise RemoteNerError('远程NER接口已熔断')
+            self.fallbacks += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._fallback_executor, self.fallback, texts)
+
+    # 识别一组段落，按输入顺序返回每个段落的实体列表[(实体, 类型, start, end)]
+    async def recognize_async(self, texts):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        groups = coalesce(texts, self.max_request_chars)
+        group_results = await asyncio.gather(
+            *(self._recognize_group(semaphore, [texts[index] for index in group]) for group in groups))
+        results = [None] * len(texts)
+        for group, entities_list in zip(groups, group_results):
+            for index, entities in zip(group, entities_list):
+                results[index] = entities
+        return results
+
+    # 同步接口，与ner_backends中其他引擎的recognize(chunks)相同，供QThread等同步代码调用
+    def recognize(self, texts):
+        if not texts:
+            return []
+        return asyncio.run(self.recognize_async(texts))
+
+    def summary(self):
+        return (f'远程NER：请求{self.requests_sent}次，重试{self.retries_done}次，超时{self.timeouts}次，'
+                f'失败{self.failures}次，回退本地模型{self.fallbacks}次，熔断{self.breaker.trips}次')
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._fallback_executor.shutdown(wait=False)
+        self.session.close()
+
+
+class LtpRestClient(RemoteNerClient):
+    # 讯飞LTP接口：分词接口返回词语，命名实体接口返回与词语一一对应的BIES标签，
+    # 两者对齐后换算成字符偏移。Nh/Ns/Ni分别对应人名、地名、机构名
+    LABELS = {'Nh': 'NR', 'Ns': 'NS', 'Ni': 'NT'}
+
+    def __init__(self, appid, api_key, url=LTP_NER_URL, cws_url=LTP_CWS_URL, **kwargs):
+        kwargs.setdefault('max_request_chars', LTP_MAX_REQUEST_CHARS)
+        super().__init__(url, None, **kwargs)
+        self.cws_url = cws_url
+        self.appid = appid
+        self.api_key = api_key
+
+    def _headers(self):
+        x_param = base64.b64encode(json.dumps({'type': 'dependent'}).replace(' ', '').encode('utf-8'))
+        x_time = str(int(time.time()))
+        x_checksum = hashlib.md5(self.api_key.encode('utf-8') + x_time.encode('utf-8') + x_param).hexdigest()
+        return {'X-Appid': self.appid, 'X-CurTime': x_time, 'X-Param': x_param, 'X-CheckSum': x_checksum}
+
+    def post(self, text, url=None):
+        response = self.session.post(url or self.url, headers=self._headers(), data={'text': text},
+                                     timeout=self.timeout)
+        self.requests_sent += 1
+        response.raise_for_status()
+        result = response.json()
+        if str(result.get('code')) != '0':
+            raise RemoteNerError(result.get('desc') or f'LTP接口错误：{result.get("code")}')
+        return result['data']
+
+    def fetch(self, text):
+        words = self.post(text, self.cws_url)['word']
+        tags = self.post(text)['ner']
+        entities = []
+        position = 0
+        current = None
+        for word, tag in zip(words, tags):
+            start = text.find(word, position)
+            if start < 0:
+                continue
+            position = end = start + len(word)
+            prefix, _, label = tag.rpartition('-')
+            label = self.LABELS.get(label)
+            if label is None or prefix in ('', 'S', 'B'):
+                if current:
+                    entities.append(current)
+                current = None
+            if label is None:
+                continue
+            if current is None:
+                current = [start, end, label]
+            else:
+                current[1] = end
+            if prefix in ('', 'S', 'E'):
+                entities.append(current)
+                current = None
+        if current:
+            entities.append(current)
+        return [(text[start:end], label, start, end) for start, end, label in entities]
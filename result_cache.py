@@ -0,0 +1,115 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+# 按内容寻址的脱敏结果缓存：键由文件内容哈希、模型标识和variant（规则指纹、脱敏参数）组成，
+# 未改动的文件直接复用上次的结果。缓存目录超过大小上限时按最近使用时间淘汰
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.tuomin', 'cache')
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+# 超过上限时淘汰到上限的这个比例以下，避免此后每次写入都要淘汰
+LOW_WATER_RATIO = 0.9
+
+
+def model_id(model):
+    return os.path.basename(os.path.normpath(model))
+
+
+def file_digest(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, model='', variant='', max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 模型、规则和脱敏参数任一变化都会使旧结果失效
+        self.namespace = '|'.join([model_id(model), variant])
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # 最近使用顺序的索引{路径: 大小}，只在启动时遍历一次缓存目录，最久未用的在前
+        self._index = OrderedDict()
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        for mtime, path, size in sorted(entries):
+            self._index[path] = size
+        self._size = sum(self._index.values())
+        # 图形界面版本在取文件的线程中恢复、在结果线程中写入
+        self._lock = threading.Lock()
+
+    def _entries(self):
+        for root, dirs, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.txt'):
+                    yield os.path.join(root, file)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.txt')
+
+    # sha256为调用方已经算好的file_digest(file_path)，避免同一文件重复计算哈希
+    def key_for(self, file_path, sha256=None):
+        digest = hashlib.sha256(self.namespace.encode('utf-8'))
+        digest.update((sha256 or file_digest(file_path)).encode('ascii'))
+        return digest.hexdigest()
+
+    # 命中时把缓存的结果复制到output_file并返回True
+    def restore(self, key, output_file):
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return False
+        shutil.copyfile(path, output_file)
+        os.utime(path)  # 更新最近使用时间，下次启动时按它重建索引
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+            else:  # 其他进程写入的缓存
+                self._index[path] = os.path.getsize(path)
+                self._size += self._index[path]
+            self.hits += 1
+        return True
+
+    def store(self, key, output_file):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，避免并发或中断时留下不完整的缓存
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(output_file, temp_path)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._size += os.path.getsize(path) - self._index.pop(path, 0)
+            self._index[path] = os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    # 从最久未用的开始删除，直到低于上限的LOW_WATER_RATIO
+    def _evict(self):
+        while self._index and self._size > self.max_bytes * LOW_WATER_RATIO:
+            path, size = self._index.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # 已被其他进程淘汰
+            self.evictions += 1
+
+    def summary(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0
+        return (f'结果缓存：命中{self.hits}个，未命中{self.misses}个，命中率{hit_rate:.1f}%，'
+                f'淘汰{self.evictions}个，占用{self._size / 1024 / 1024:.1f}MB')
@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+
+# 运行指标：按文件和阶段累计耗时、数据块数、各类型实体数、缓存命中和错误数，
+# 运行结束时写成JSON lines日志或Prometheus文本格式，代替热循环中的print
+
+DEFAULT_METRICS_FILE = os.path.join(os.path.expanduser('~'), '.tuomin', 'metrics.jsonl')
+# 设置此环境变量后，图形界面版本在每次运行结束时额外写出Prometheus文本格式的指标
+PROMETHEUS_FILE_ENV = 'TUOMIN_PROMETHEUS_FILE'
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stage_seconds = {}
+        self.counters = {}
+        self.entity_labels = {}
+        self.files = []
+        self._file_stage_seconds = None
+
+    def add_time(self, stage, seconds):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        if self._file_stage_seconds is not None:
+            self._file_stage_seconds[stage] = self._file_stage_seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - started)
+
+    # 统计迭代器每次取值的耗时，用于流式读取等惰性阶段
+    def timed_iter(self, stage, iterable):
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - started)
+                return
+            self.add_time(stage, time.perf_counter() - started)
+            yield item
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_entities(self, entities_list):
+        for entities in entities_list:
+            for entity in entities:
+                self.entity_labels[entity[1]] = self.entity_labels.get(entity[1], 0) + 1
+
+    # 收集缓存、远程客户端等对象上的计数属性，如add_counters('result_cache_', cache, ['hits', 'misses'])
+    def add_counters(self, prefix, source, names):
+        for name in names:
+            self.count(prefix + name, getattr(source, name))
+
+    # 记录一个文件的处理过程；文件耗时中没有归入其他阶段的部分计为write（写出及其余开销）
+    @contextmanager
+    def file(self, file_path):
+        record = {'file': file_path, 'status': 'ok'}
+        self._file_stage_seconds = stages = {}
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['status'] = 'error'
+            record.setdefault('error', str(e))
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self._file_stage_seconds = None
+            if record['status'] == 'ok':
+                stages['write'] = max(0.0, seconds - sum(stages.values()))
+                self.stage_seconds['write'] = self.stage_seconds.get('write', 0.0) + stages['write']
+            self.record_file(record, seconds, stages)
+
+    def record_file(self, record, seconds, stages=None):
+        record['seconds'] = round(seconds, 4)
+        if stages:
+            record['stages'] = {stage: round(value, 4) for stage, value in stages.items()}
+        self.count('files_' + record['status'])
+        self.files.append(record)
+
+    # 记录流水线（staged_pipeline）处理完的一个文件，task为FileTask，seconds为各阶段耗时
+    def record_task(self, task, error, seconds):
+        self.merge(task.metrics.stats())
+        record = {'file': task.file_path, 'status': 'ok'}
+        if error is not None:
+            record.update(status='error', error=str(error))
+        elif task.chars is not None:
+            record['chars'] = task.chars
+        self.record_file(record, sum(seconds.values()), task.metrics.stage_seconds)
+
+    # 工作进程返回的统计，合并到主进程
+    def stats(self):
+        return {'stages': dict(self.stage_seconds), 'counters': dict(self.counters),
+                'entity_labels': dict(self.entity_labels)}
+
+    def merge(self, stats):
+        for stage, seconds in stats['stages'].items():
+            self.add_time(stage, seconds)
+        for name, value in stats['counters'].items():
+            self.count(name, value)
+        for label, value in stats['entity_labels'].items():
+            self.entity_labels[label] = self.entity_labels.get(label, 0) + value
+
+    def summary(self):
+        return {
+            'started_at': round(self.started_at, 3),
+            'seconds': round(time.perf_counter() - self._start, 4),
+            'stages': {stage: round(seconds, 4) for stage, seconds in self.stage_seconds.items()},
+            'counters': dict(self.counters),
+            'entity_labels': dict(self.entity_labels),
+        }
+
+    # 追加写入：每个文件一行，最后一行为整次运行的汇总
+    def write_jsonl(self, path):
+        with open(path, 'a', encoding='utf-8') as file:
+            for record in self.files:
+                file.write(json.dumps(dict(record, type='file'), ensure_ascii=False) + '\n')
+            file.write(json.dumps(dict(self.summary(), type='run'), ensure_ascii=False) + '\n')
+
+    def prometheus_text(self):
+        summary = self.summary()
+        lines = [
+            '# HELP tuomin_run_duration_seconds 最近一次脱敏运行的耗时',
+            '# TYPE tuomin_run_duration_seconds gauge',
+            f'tuomin_run_duration_seconds {summary["seconds"]}',
+            '# HELP tuomin_stage_seconds 各阶段累计耗时',
+            '# TYPE tuomin_stage_seconds gauge',
+        ]
+        lines.extend(f'tuomin_stage_seconds{{stage="{stage}"}} {seconds}' for stage, seconds in summary['stages'].items())
+        lines.extend(['# HELP tuomin_entities 各类型实体数', '# TYPE tuomin_entities gauge'])
+        lines.extend(f'tuomin_entities{{label="{label}"}} {value}' for label, value in sorted(self.entity_labels.items()))
+        for name, value in sorted(self.counters.items()):
+            lines.extend([f'# TYPE tuomin_{name} gauge', f'tuomin_{name} {value}'])
+        return '\n'.join(lines) + '\n'
+
+    # 先写临时文件再改名，采集程序不会读到写了一半的文件
+    def write_prometheus(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+    # 写到默认位置：JSON lines追加到~/.tuomin/metrics.jsonl，Prometheus文件由环境变量指定
+    def save(self, jsonl_path=DEFAULT_METRICS_FILE):
+        os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
+        self.write_jsonl(jsonl_path)
+        prometheus_path = os.environ.get(PROMETHEUS_FILE_ENV)
+        if prometheus_path:
+            self.write_prometheus(prometheus_path)
+
+
+# 不需要统计时使用的空实现，调用开销可以忽略
+class NullMetrics:
+    def add_time(self, stage, seconds):
+        pass
+
+    def timer(self, stage):
+        return nullcontext()
+
+    def timed_iter(self, stage, iterable):
+        return iterable
+
+    def count(self, name, value=1):
+        pass
+
+    def count_entities(self, entities_list):
+        pass
+
+
+NULL_METRICS = NullMetrics()
@@ -1,38 +1,19 @@
 import sys
-import re
 import os
 import random
 import string
+from contextlib import closing
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QProgressBar, QTextEdit, QFileDialog
 from PyQt5.QtCore import QThread, pyqtSignal, QObject
-from docx import Document
-import hanlp
-from hanlp.pretrained.ner import MSRA_NER_BERT_BASE_ZH
+from desensitize_core import DEFAULT_BATCH_SIZE
+from doc_readers import iter_word_paragraphs, write_chunks_to_text_file
+from model_loader import get_ner_model, preload_ner_model, mark_startup, startup_report, MSRA_NER_BERT_BASE_ZH
+from stream_crypto import encrypt_chunks_to_file, generate_key
+from staged_pipeline import desensitize_pipeline, FileTask
+from run_metrics import RunMetrics
 
 
-hanlp_ner_model = hanlp.load(MSRA_NER_BERT_BASE_ZH)
-
-def split_text(text, max_length):
-    sentences = re.split(r'(?<=[。，”“！？\?!])', text)
-    current_chunk = ""
-    chunks = []
-
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) <= max_length:
-            current_chunk += sentence
-        else:
-            if current_chunk:
-                chunks.append(current_chunk)
-            if len(sentence) > max_length:
-                sub_chunks = [sentence[i:i+max_length] for i in range(0, len(sentence), max_length)]
-                chunks.extend(sub_chunks)
-            else:
-                current_chunk = sentence  # 用新句子开始新的chunks
-
-    if current_chunk:
-        chunks.append(current_chunk)
-
-    return chunks
+NER_MODEL = MSRA_NER_BERT_BASE_ZH
 
 
 # 更新进度条
@@ -43,10 +24,13 @@ class DesensitizeThread(QThread):
     finished = pyqtSignal(str)
     progress_updated = pyqtSignal(int)
 
-    def __init__(self, input_file_path, output_file_path):
+    def __init__(self, input_file_path, output_file_path, batch_size=DEFAULT_BATCH_SIZE):
         super().__init__()
         self.input_file_path = input_file_path
         self.output_file_path = output_file_path
+        self.batch_size = batch_size
+        self.pipeline = None
+        self.metrics = RunMetrics()
         self._is_running = True
 
     def run(self):
@@ -56,50 +40,31 @@ class DesensitizeThread(QThread):
             if total_files == 0:
                 raise FileNotFoundError("没有检测到.docx文件！")
 
-            for file_index, file_path in enumerate(file_paths):
-                if not self._is_running:
-                    break
-
-                paragraphs = read_word_document(file_path)
-                desensitized_paragraphs = []
-
-                for paragraph in paragraphs:
-                    chunks = split_text(paragraph, max_length=126)
-                    for chunk in chunks:
-                        desensitized_chunk = self._process_chunk(chunk)
-                        desensitized_paragraphs.append(desensitized_chunk)
-
-                desensitized_text = '\n'.join(desensitized_paragraphs)
-                self._save_desensitized_file(file_path, desensitized_text)
-                self._update_progress(file_index, total_files)
-
-            self.finished.emit("脱敏完成. 结果保存至: " + self.output_file_path)
+            # 读取、识别、写出分阶段流水执行，读取下一个文件时模型同时识别当前文件；
+            # 单遍收敛脱敏：第二遍只重新识别第一遍有变化的数据块
+            self.pipeline = desensitize_pipeline(get_ner_model(NER_MODEL), batch_size=self.batch_size, passes=2,
+                                                 reader=lambda file_path: iter_word_paragraphs(file_path, line_end=''),
+                                                 writer=lambda output_file, chunks: write_chunks_to_text_file(
+                                                     output_file, chunks, separator='\n'))
+            if not self._is_running:
+                self.pipeline.stop()
+            tasks = (FileTask(file_path, self._new_output_file(file_path)) for file_path in file_paths)
+            with closing(self.pipeline.run(tasks)) as results:
+                for file_index, (task, error, seconds) in enumerate(results):
+                    self.metrics.record_task(task, error, seconds)
+                    if error is not None:
+                        raise error
+                    self._update_progress(file_index, total_files)
+
+            self.finished.emit("脱敏完成. 结果保存至: " + self.output_file_path + self._save_metrics())
         except Exception as e:
-            self.finished.emit("Error: " + str(e))
-            
-    def _process_chunk(self, chunk):
-        try:
-            chunk = re.sub(r'(编号)\d+|\w*公司', lambda m: '**公司' if '公司' in m.group() else m.group(1) + '**', chunk)
-            entities = hanlp_ner_model(chunk)
-            desensitized_chunk = chunk
-            for entity in reversed(entities):
-                entity_text, label, start, end = entity
-                if label in ['NS', 'NT', 'NR']:  # 
-                    print(entity_text, label, start, end)
-                    desensitized_chunk = desensitized_chunk[:start] + '**' + desensitized_chunk[end:]
-                    unit = re.search(r'(局|公司|工程|省|市|县|区)$', entity_text)
-                    if unit:
-                        replacement = '**' + unit.group()
-                        desensitized_chunk = desensitized_chunk[:start] + replacement + desensitized_chunk[end:]
-                    else:
-                        desensitized_chunk = desensitized_chunk[:start] + '**' + desensitized_chunk[end:]
-            return desensitized_chunk
-        except Exception as e:
-            return chunk
+            self.finished.emit("Error: " + str(e) + self._save_metrics())
 
 
     def stop(self):
         self._is_running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
 
     def _get_file_paths(self, input_path):
         if os.path.isfile(input_path):
@@ -108,57 +73,37 @@ class DesensitizeThread(QThread):
             return [os.path.join(input_path, f) for f in os.listdir(input_path) if f.endswith('.docx') and not f.startswith('~$')]
 
 
-    def _save_desensitized_file(self, original_file_path, desensitized_text):
+    def _new_output_file(self, original_file_path):
         new_file_name = ''.join(random.choices(string.ascii_letters + string.digits, k=8)) + '.txt'
-        output_file = os.path.join(self.output_file_path, new_file_name)
-        write_to_text_file(output_file, desensitized_text)
-        
-        self._secondary_desensitization(output_file)
+        return os.path.join(self.output_file_path, new_file_name)
 
     def _update_progress(self, current_index, total_files):
         progress = int((current_index + 1) / total_files * 100)
         self.progress_updated.emit(progress)
-        
-    def _secondary_desensitization(self, file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-
-        # 将原始的脱敏逻辑应用于整个文档内容
-        paragraphs = content.split('\n')
-        desensitized_paragraphs = []
-
-        for paragraph in paragraphs:
-            chunks = split_text(paragraph, max_length=126)
-            for chunk in chunks:
-                desensitized_chunk = self._process_chunk(chunk)
-                desensitized_paragraphs.append(desensitized_chunk)
-
-        desensitized_text = '\n'.join(desensitized_paragraphs)
-
-        # 重新写入脱敏后的内容
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(desensitized_text)
 
+    # 运行指标追加写入~/.tuomin/metrics.jsonl，返回附加在完成消息后的提示
+    def _save_metrics(self):
+        if self.pipeline is not None:
+            self.pipeline.add_counters(self.metrics)
+        try:
+            self.metrics.save()
+        except OSError as e:
+            return "\n运行指标写入失败：" + str(e)
+        return ""
 
-# 读取Word
-def read_word_document(file_path):
-    doc = Document(file_path)
-    return [para.text for para in doc.paragraphs]
 
-# 写入
-def write_to_text_file(file_path, content):
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
-        
 class EncryptDesensitizeThread(QThread):
     finished = pyqtSignal(str)
     progress_updated = pyqtSignal(int)
 
-    def __init__(self, input_file_path, output_file_path, key):
+    def __init__(self, input_file_path, output_file_path, key, batch_size=DEFAULT_BATCH_SIZE):
         super().__init__()
         self.input_file_path = input_file_path
         self.output_file_path = output_file_path
         self.key = key
+        self.batch_size = batch_size
+        self.pipeline = None
+        self.metrics = RunMetrics()
         self._is_running = True
 
     def run(self):
@@ -168,44 +113,24 @@ class EncryptDesensitizeThread(QThread):
             if total_files == 0:
                 raise FileNotFoundError("没有检测到.docx文件！")
 
-            fernet = Fernet(self.key)
-
-            for file_index, file_path in enumerate(file_paths):
-                if not self._is_running:
-                    break
-
-                # 读取、脱敏、二次脱敏
-                paragraphs = read_word_document(file_path)
-                desensitized_paragraphs = self.desensitize(paragraphs)
-                desensitized_text = self.secondary_desensitization('\n'.join(desensitized_paragraphs))
-                
-                # 加密
-                encrypted_text = fernet.encrypt(desensitized_text.encode()).decode()
-                self._save_encrypted_file(file_path, encrypted_text)
-                self._update_progress(file_index, total_files)
-
-            self.finished.emit("加密脱敏完成. 结果保存至: " + self.output_file_path)
+            # 读取、识别、分段加密写出分阶段流水执行（第二遍只处理有变化的数据块）
+            self.pipeline = desensitize_pipeline(get_ner_model(NER_MODEL), batch_size=self.batch_size, passes=2,
+                                                 reader=lambda file_path: iter_word_paragraphs(file_path, line_end=''),
+                                                 writer=lambda output_file, chunks: encrypt_chunks_to_file(
+                                                     output_file, chunks, self.key, separator='\n'))
+            if not self._is_running:
+                self.pipeline.stop()
+            tasks = (FileTask(file_path, self._new_output_file(file_path)) for file_path in file_paths)
+            with closing(self.pipeline.run(tasks)) as results:
+                for file_index, (task, error, seconds) in enumerate(results):
+                    self.metrics.record_task(task, error, seconds)
+                    if error is not None:
+                        raise error
+                    self._update_progress(file_index, total_files)
+
+            self.finished.emit("加密脱敏完成. 结果保存至: " + self.output_file_path + self._save_metrics())
         except Exception as e:
-            self.finished.emit("Error: " + str(e))
-
-    def desensitize(self, paragraphs):
-        desensitized_paragraphs = []
-        for paragraph in paragraphs:
-            chunks = split_text(paragraph, max_length=126)
-            for chunk in chunks:
-                desensitized_chunk = self._process_chunk(chunk)
-                desensitized_paragraphs.append(desensitized_chunk)
-        return desensitized_paragraphs
-
-    def secondary_desensitization(self, content):
-        paragraphs = content.split('\n')
-        desensitized_paragraphs = []
-        for paragraph in paragraphs:
-            chunks = split_text(paragraph, max_length=126)
-            for chunk in chunks:
-                desensitized_chunk = self._process_chunk(chunk)
-                desensitized_paragraphs.append(desensitized_chunk)
-        return '\n'.join(desensitized_paragraphs)
+            self.finished.emit("Error: " + str(e) + self._save_metrics())
 
     def _get_file_paths(self, input_path):
         if os.path.isfile(input_path):
@@ -213,50 +138,30 @@ class EncryptDesensitizeThread(QThread):
         else:
             return [os.path.join(input_path, f) for f in os.listdir(input_path) if f.endswith('.docx') and not f.startswith('~$')]
 
-    def _process_chunk(self, chunk):
-        try:
-            # 使用正则表达式进行初步脱敏
-            chunk = re.sub(r'(编号)\d+|\w*公司', lambda m: '**公司' if '公司' in m.group() else m.group(1) + '**', chunk)
-
-            # 使用HanLP进行实体识别
-            entities = hanlp_ner_model(chunk)
-            desensitized_chunk = chunk
-
-            # 遍历识别到的实体进行脱敏
-            for entity in reversed(entities):
-                entity_text, label, start, end = entity
-
-                if label in ['NS', 'NT', 'NR']:
-                    # 对于地名、机构名、人名进行脱敏
-                    desensitized_chunk = desensitized_chunk[:start] + '**' + desensitized_chunk[end:]
-                    unit = re.search(r'(局|公司|工程|省|市|县|区)$', entity_text)
-                    if unit:
-                        replacement = '**' + unit.group()
-                        desensitized_chunk = desensitized_chunk[:start] + replacement + desensitized_chunk[end:]
-                    else:
-                        desensitized_chunk = desensitized_chunk[:start] + '**' + desensitized_chunk[end:]
-
-            return desensitized_chunk
-
-        except Exception as e:
-            # 出现异常时返回原始数据块
-            print("Error processing chunk:", e)
-            return chunk
-
-    def _save_encrypted_file(self, original_file_path, encrypted_text):
+    def _new_output_file(self, original_file_path):
         new_file_name = ''.join(random.choices(string.ascii_letters + string.digits, k=8)) + '.enc'
-        output_file = os.path.join(self.output_file_path, new_file_name)
-        write_to_text_file(output_file, encrypted_text)
+        return os.path.join(self.output_file_path, new_file_name)
 
     def _update_progress(self, current_index, total_files):
         progress = int((current_index + 1) / total_files * 100)
         self.progress_updated.emit(progress)
 
+    # 运行指标追加写入~/.tuomin/metrics.jsonl，返回附加在完成消息后的提示
+    def _save_metrics(self):
+        if self.pipeline is not None:
+            self.pipeline.add_counters(self.metrics)
+        try:
+            self.metrics.save()
+        except OSError as e:
+            return "\n运行指标写入失败：" + str(e)
+        return ""
+
 
 class MyApp(QWidget):
     
     trigger_select_input_file = pyqtSignal(str)
     trigger_select_output_file = pyqtSignal(str)
+    model_loaded = pyqtSignal(str)
     
     def __init__(self):
         super().__init__()
@@ -303,6 +208,10 @@ class MyApp(QWidget):
     
         self.setLayout(layout)
 
+        # 窗口先显示，模型在后台线程中加载
+        self.model_loaded.connect(self.on_model_loaded)
+        preload_ner_model(NER_MODEL, lambda error: self.model_loaded.emit(error or ''))
+
         btn_upload.clicked.connect(self.upload)
         btn_select_output.clicked.connect(self.select_output)
         btn_start.clicked.connect(self.start_process)
@@ -361,7 +270,7 @@ class MyApp(QWidget):
             self.log_text.append("开始脱敏处理。")
             
     def start_encrypt_process(self):
-        self.key = Fernet.generate_key()  # 生成密钥
+        self.key = generate_key()  # 生成密钥
         key_file_path, _ = QFileDialog.getSaveFileName(self, '请选择密钥文件保存路径', '', 'Key File (*.key)')
         if key_file_path:
             with open(key_file_path, 'wb') as key_file:
@@ -406,10 +315,19 @@ class MyApp(QWidget):
 
     def process_finished(self, message):
         self.log_text.setText(message)
+        self.log_text.append(startup_report())
+
+    def on_model_loaded(self, error):
+        if error:
+            self.log_text.append("模型加载失败：" + error)
+        else:
+            self.log_text.append("模型加载完成。" + startup_report())
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = MyApp()
     ex.show()
+    mark_startup('window')
+    ex.log_text.append(startup_report() + '，模型正在后台加载。')
     sys.exit(app.exec_())
     
\ No newline at end of file
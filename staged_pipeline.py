@@ -0,0 +1,312 @@
+import queue
+import threading
+import time
+
+from desensitize_core import iter_desensitized_chunks, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH, DEFAULT_OVERLAP
+from doc_readers import iter_file_context, write_chunks_to_text_file
+from run_metrics import RunMetrics
+
+# 分阶段流水线：读取、切块、识别、写出各阶段有自己的工作线程，阶段之间用有界队列连接，
+# 读取下一个文件（磁盘或网络共享）、识别当前文件和写出上一个文件同时进行。
+# 队列满时上游阶段等待（背压），同时在途的文件数不超过各队列容量与线程数之和。
+# 某个文件在一个阶段出错时带着异常跳过后续阶段，不影响其他文件；stop()后各阶段尽快退出。
+# 流式阶段一开始处理文件就把它交给下一阶段，文件内容经有界的Channel逐段传递，
+# 一个文件在相邻阶段同时处理，内存占用与文件大小无关
+
+DEFAULT_QUEUE_SIZE = 2
+# 流式阶段之间每个文件最多缓存的段落数或数据块数
+DEFAULT_CHANNEL_SIZE = 64
+DEFAULT_READ_WORKERS = 2
+DEFAULT_NER_WORKERS = 1
+DEFAULT_WRITE_WORKERS = 1
+# 等待队列时每隔多久检查一次是否已停止（秒）
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+# Channel的结束标记，带着生产方的异常
+class _End:
+    def __init__(self, error=None):
+        self.error = error
+
+
+# 文件内容在两个流式阶段之间逐段传递的有界通道：生产方feed()写入，消费方迭代读取。
+# 生产方出错时异常经通道交给消费方抛出；消费方提前退出（with块结束）后生产方停止写入
+class Channel:
+    def __init__(self, pipeline, size=DEFAULT_CHANNEL_SIZE):
+        self._pipeline = pipeline
+        self._queue = queue.Queue(max(1, size))
+        self._abandoned = False
+        # 消费方等待生产方的时间，用于从阶段耗时中扣除
+        self.wait_seconds = 0.0
+
+    def _put(self, item):
+        while not self._abandoned and not self._pipeline.stopped:
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed(self, items):
+        error = None
+        try:
+            for item in items:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            error = e
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+        self._put(_End(error))
+
+    def __iter__(self):
+        while True:
+            self._pipeline.check_stopped()
+            started = time.perf_counter()
+            try:
+                item = self._queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            finally:
+                self.wait_seconds += time.perf_counter() - started
+            if isinstance(item, _End):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._abandoned = True
+
+
+class Stage:
+    # function(value)返回交给下一阶段的值；queue_size为本阶段输入队列的容量。
+    # streaming为True时function是生成器：先yield交给下一阶段的值，之后在本线程继续处理（经Channel输出）
+    def __init__(self, name, function, workers=1, queue_size=DEFAULT_QUEUE_SIZE, streaming=False):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.streaming = streaming
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        # 每次放入输入队列后的队列长度：长期接近容量说明本阶段是瓶颈，长期为0说明上游是瓶颈
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    @property
+    def mean_depth(self):
+        return round(self._depth_total / self._depth_samples, 2) if self._depth_samples else 0
+
+    def _record_depth(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+
+class _Job:
+    def __init__(self, value):
+        self.value = value
+        self.error = None
+        self.seconds = {}
+
+
+class StagedPipeline:
+    def __init__(self, stages):
+        self.stages = stages
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._feed_error = None
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def stop(self):
+        self._stopped.set()
+
+    # 供阶段函数在长时间处理中检查，停止后抛出PipelineStopped
+    def check_stopped(self):
+        if self._stopped.is_set():
+            raise PipelineStopped('任务已停止')
+
+    def _put(self, target, item, stage=None):
+        while not self._stopped.is_set():
+            try:
+                target.put(item, timeout=POLL_INTERVAL)
+            except queue.Full:
+                continue
+            if stage is not None:
+                with self._lock:
+                    stage._record_depth(target.qsize())
+            return True
+        return False
+
+    def _get(self, source):
+        while not self._stopped.is_set():
+            try:
+                return source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
+
+    def _feed(self, items, target, stage):
+        try:
+            for value in items:
+                if not self._put(target, _Job(value), stage):
+                    return
+        except Exception as e:
+            self._feed_error = e
+        self._put(target, _DONE)
+
+    def _work(self, stage, source, target, next_stage, remaining):
+        while True:
+            job = self._get(source)
+            if job is None:
+                return
+            if job is _DONE:
+                # 最后一个退出的线程通知下一阶段，其余线程把结束标记放回去给同阶段的其他线程
+                with self._lock:
+                    remaining[stage.name] -= 1
+                    last = remaining[stage.name] == 0
+                self._put(target if last else source, _DONE)
+                return
+            if job.error is not None:
+                if not self._put(target, job, next_stage):
+                    return
+                continue
+            started = time.perf_counter()
+            steps = None
+            try:
+                if stage.streaming:
+                    steps = stage.function(job.value)
+                    job.value = next(steps)
+                else:
+                    job.value = stage.function(job.value)
+            except Exception as e:
+                job.error = e
+                steps = None
+            # 流式阶段交出文件前的耗时记入该文件，之后的处理与下游阶段重叠，只计入阶段忙碌时间
+            job.seconds[stage.name] = time.perf_counter() - started
+            handed_over = self._put(target, job, next_stage)
+            error = job.error
+            if steps is not None:
+                try:
+                    if handed_over:
+                        for _ in steps:
+                            pass
+                except Exception as e:
+                    error = e
+                finally:
+                    steps.close()
+            seconds = time.perf_counter() - started
+            with self._lock:
+                stage.items += 1
+                stage.busy_seconds += seconds
+                stage.errors += error is not None
+            if not handed_over:
+                return
+
+    # 按完成顺序返回(值, 异常, 各阶段耗时)，出错的文件值停留在出错阶段的输入；
+    # 流式阶段中途出错时，异常由读取其输出的下游阶段抛出。
+    # 提前关闭生成器时停止流水线并等待各线程退出
+    def run(self, items):
+        queues = [queue.Queue(stage.queue_size) for stage in self.stages]
+        queues.append(queue.Queue(self.stages[-1].queue_size))
+        remaining = {stage.name: stage.workers for stage in self.stages}
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], self.stages[0]),
+                                    name='pipeline-feed', daemon=True)]
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            threads.extend(threading.Thread(target=self._work,
+                                            args=(stage, queues[index], queues[index + 1], next_stage, remaining),
+                                            name=f'pipeline-{stage.name}', daemon=True)
+                           for _ in range(stage.workers))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                job = self._get(queues[-1])
+                if job is None or job is _DONE:
+                    break
+                yield job.value, job.error, job.seconds
+            if self._feed_error is not None:
+                raise self._feed_error
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def summary(self):
+        parts = [f'{stage.name}（{stage.workers}线程）处理{stage.items}个，忙{stage.busy_seconds:.1f}s，'
+                 f'队列平均{stage.mean_depth}/最大{stage.max_depth}' for stage in self.stages]
+        return '流水线：' + '；'.join(parts)
+
+    # 把各阶段的计数记入run_metrics.RunMetrics，名称如pipeline_read_max_depth
+    def add_counters(self, metrics):
+        for stage in self.stages:
+            metrics.add_counters(f'pipeline_{stage.name}_', stage,
+                                 ['items', 'errors', 'busy_seconds', 'mean_depth', 'max_depth'])
+
+
+class FileTask:
+    # 一个文件在各阶段之间传递的数据。metrics由识别和写出阶段的线程分别记录不同的阶段，结束后由调用方合并
+    def __init__(self, file_path, output_file):
+        self.file_path = file_path
+        self.output_file = output_file
+        self.metrics = RunMetrics()
+        self.data = None
+        self.chars = None
+
+
+# 脱敏流水线：输入FileTask，读取、切块识别并写出到task.output_file，写出的字符数记在task.chars中。
+# 段落和脱敏后的数据块经Channel在阶段之间逐段传递，识别阶段用iter_desensitized_chunks按批流式脱敏，
+# 每个在途文件最多缓存channel_size个段落或数据块，内存占用与文件大小和文件总数无关。
+# 识别阶段记录的read耗时是等待读取阶段的时间，write耗时不含等待识别的时间。
+# reader(文件路径)返回段落，writer(输出文件, 数据块)写出并返回字符数，可替换为只读Word或加密写出等版本。
+# ner_workers大于1时ner_model应为batch_scheduler.BatchScheduler，多个线程提交的数据块合并成批
+def desensitize_pipeline(ner_model, max_length=DEFAULT_MAX_LENGTH, batch_size=DEFAULT_BATCH_SIZE, rules=None,
+                         passes=1, overlap=DEFAULT_OVERLAP, reader=iter_file_context, writer=write_chunks_to_text_file,
+                         read_workers=DEFAULT_READ_WORKERS, ner_workers=DEFAULT_NER_WORKERS,
+                         write_workers=DEFAULT_WRITE_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, length=len,
+                         channel_size=DEFAULT_CHANNEL_SIZE):
+    def read(task):
+        paragraphs = task.data = Channel(pipeline, channel_size)
+        yield task
+        paragraphs.feed(reader(task.file_path))
+
+    def ner(task):
+        chunks = Channel(pipeline, channel_size)
+        paragraphs, task.data = task.data, chunks
+        yield task
+        with paragraphs:
+            chunks.feed(iter_desensitized_chunks(ner_model, paragraphs, max_length, batch_size, rules, passes,
+                                                 task.metrics, overlap, length))
+
+    def write(task):
+        started = time.perf_counter()
+        with task.data as chunks:
+            task.chars = writer(task.output_file, chunks)
+        task.metrics.add_time('write', time.perf_counter() - started - chunks.wait_seconds)
+        task.data = None
+        return task
+
+    pipeline = StagedPipeline([
+        Stage('read', read, read_workers, queue_size, streaming=True),
+        Stage('ner', ner, ner_workers, queue_size, streaming=True),
+        Stage('write', write, write_workers, queue_size),
+    ])
+    return pipeline
@@ -0,0 +1,245 @@
+import base64
+import hashlib
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# 分段加密格式：文件头（格式标识、版本、密钥ID、分段大小）之后是若干定长分段，
+# 每段单独用AES-256-GCM加密，有自己的随机nonce和校验tag，加解密都只需要一个分段的内存。
+# 分段序号和是否为最后一段放在附加认证数据中，删除、调换或截断分段都会校验失败。
+# 密钥文件沿用Fernet密钥的格式（32字节的urlsafe base64），AES密钥由其经HKDF派生；
+# 旧版本整体Fernet加密的.enc文件仍可解密
+
+MAGIC = b'TUOMIN'
+FORMAT_VERSION = 1
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+# 解密时拒绝分段大小异常的文件，避免按损坏的长度分配内存
+MAX_SEGMENT_SIZE = 16 * 1024 * 1024
+# 格式标识、版本、密钥ID、分段大小
+HEADER = struct.Struct('>6sB8sI')
+# 是否最后一段、密文长度（含tag）、nonce
+SEGMENT = struct.Struct('>BI12s')
+TAG_SIZE = 16
+KEY_INFO = b'tuomin stream encryption v1'
+KEY_ID_INFO = b'tuomin key id'
+ENCRYPTED_SUFFIX = '.enc'
+DECRYPTED_SUFFIX = '_decrypted.txt'
+# 批量解密的线程数：AES-GCM解密很快，多线程主要是让读写文件和解密互相重叠
+DEFAULT_DECRYPT_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+
+
+class DecryptionError(Exception):
+    pass
+
+
+def generate_key():
+    return Fernet.generate_key()
+
+
+def load_key(key_file_path):
+    with open(key_file_path, 'rb') as key_file:
+        return key_file.read().strip()
+
+
+# 密钥ID写在文件头中，解密前即可判断密钥是否匹配
+def key_id(key):
+    return hashlib.sha256(KEY_ID_INFO + key).digest()[:8]
+
+
+def _aead(key):
+    try:
+        raw_key = base64.urlsafe_b64decode(key)
+    except ValueError:
+        raise ValueError('密钥文件格式不正确')
+    if len(raw_key) != 32:
+        raise ValueError('密钥文件格式不正确')
+    return AESGCM(HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=KEY_INFO).derive(raw_key))
+
+
+def _associated_data(header, index, last):
+    return header + struct.pack('>QB', index, last)
+
+
+class EncryptedWriter:
+    # 写入文本或字节，攒够一个分段就加密写出；close()写出最后一段（可能为空）
+    def __init__(self, file, key, segment_size=DEFAULT_SEGMENT_SIZE):
+        self._file = file
+        self._aead = _aead(key)
+        self.segment_size = segment_size
+        self._header = HEADER.pack(MAGIC, FORMAT_VERSION, key_id(key), segment_size)
+        self._buffer = bytearray()
+        self._index = 0
+        file.write(self._header)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._buffer += data
+        # 保留不满一段的部分，最后一段在close()时写出
+        while len(self._buffer) > self.segment_size:
+            self._write_segment(bytes(self._buffer[:self.segment_size]), False)
+            del self._buffer[:self.segment_size]
+
+    def _write_segment(self, plaintext, last):
+        nonce = os.urandom(12)
+        ciphertext = self._aead.encrypt(nonce, plaintext, _associated_data(self._header, self._index, last))
+        self._file.write(SEGMENT.pack(last, len(ciphertext), nonce))
+        self._file.write(ciphertext)
+        self._index += 1
+
+    def close(self):
+        self._write_segment(bytes(self._buffer), True)
+        self._buffer.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+
+
+class Decryptor:
+    # 解密一批文件时只解析一次密钥、派生一次AES密钥
+    def __init__(self, key):
+        self.key_id = key_id(key)
+        self._aead = _aead(key)
+        self._fernet = Fernet(key)
+
+    # 逐段返回解密后的字节，每段校验通过后才返回
+    def iter_decrypted(self, file):
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size or not header.startswith(MAGIC):
+            raise DecryptionError('不是分段加密格式的文件')
+        magic, version, file_key_id, segment_size = HEADER.unpack(header)
+        if version != FORMAT_VERSION:
+            raise DecryptionError(f'不支持的加密格式版本：{version}')
+        if file_key_id != self.key_id:
+            raise DecryptionError('密钥与文件不匹配')
+        if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise DecryptionError('文件头已损坏')
+        index = 0
+        while True:
+            frame = file.read(SEGMENT.size)
+            if len(frame) < SEGMENT.size:
+                raise DecryptionError('文件不完整')
+            last, length, nonce = SEGMENT.unpack(frame)
+            if last > 1 or not TAG_SIZE <= length <= segment_size + TAG_SIZE:
+                raise DecryptionError(f'第{index + 1}段已损坏')
+            ciphertext = file.read(length)
+            if len(ciphertext) < length:
+                raise DecryptionError('文件不完整')
+            try:
+                plaintext = self._aead.decrypt(nonce, ciphertext, _associated_data(header, index, last))
+            except InvalidTag:
+                raise DecryptionError(f'第{index + 1}段校验失败，文件已损坏、被篡改或密钥错误')
+            yield plaintext
+            if last:
+                if file.read(1):
+                    raise DecryptionError('文件末尾有多余数据')
+                return
+            index += 1
+
+    # 解密一个.enc文件，返回明文字节数；旧版本的Fernet加密文件整体解密。出错时不保留输出文件
+    def decrypt_file(self, input_path, output_path):
+        written = 0
+        try:
+            with open(input_path, 'rb') as source, open(output_path, 'wb') as target:
+                if source.read(len(MAGIC)) == MAGIC:
+                    source.seek(0)
+                    for plaintext in self.iter_decrypted(source):
+                        target.write(plaintext)
+                        written += len(plaintext)
+                else:
+                    source.seek(0)
+                    try:
+                        plaintext = self._fernet.decrypt(source.read())
+                    except InvalidToken:
+                        raise DecryptionError('解密失败，文件已损坏或密钥错误')
+                    target.write(plaintext)
+                    written = len(plaintext)
+        except BaseException:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        return written
+
+
+def iter_decrypted(file, key):
+    return Decryptor(key).iter_decrypted(file)
+
+
+def is_stream_encrypted(file_path):
+    with open(file_path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+# 边脱敏边加密写入，返回明文字符数；中途出错时删除不完整的输出文件
+def encrypt_chunks_to_file(file_path, chunks, key, separator='', segment_size=DEFAULT_SEGMENT_SIZE):
+    written = 0
+    try:
+        with open(file_path, 'wb') as file, EncryptedWriter(file, key, segment_size) as writer:
+            for index, chunk in enumerate(chunks):
+                if index and separator:
+                    writer.write(separator)
+                writer.write(chunk)
+                written += len(chunk)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return written
+
+
+def decrypt_file(input_path, output_path, key):
+    return Decryptor(key).decrypt_file(input_path, output_path)
+
+
+# 查找要解密的.enc文件，recursive为True时包括子文件夹
+def find_encrypted_files(input_path, recursive=True):
+    if os.path.isfile(input_path):
+        return [input_path]
+    if not recursive:
+        return sorted(os.path.join(input_path, name) for name in os.listdir(input_path)
+                      if name.endswith(ENCRYPTED_SUFFIX) and os.path.isfile(os.path.join(input_path, name)))
+    file_paths = []
+    for root, dirs, files in os.walk(input_path):
+        file_paths.extend(os.path.join(root, name) for name in files if name.endswith(ENCRYPTED_SUFFIX))
+    return sorted(file_paths)
+
+
+# 解密结果的路径：默认写在加密文件旁边；指定output_root时按相对input_root的目录结构写到output_root下
+def decrypted_path(file_path, input_root, output_root=None):
+    output_path = os.path.splitext(file_path)[0] + DECRYPTED_SUFFIX
+    if output_root is None:
+        return output_path
+    if os.path.isfile(input_root):
+        input_root = os.path.dirname(input_root)
+    return os.path.join(output_root, os.path.relpath(output_path, input_root))
+
+
+# 多线程批量解密，按完成顺序返回(加密文件, 解密文件, 明文字节数, 错误信息)，单个文件失败不影响其他文件。
+# 提前关闭生成器时取消还没开始的文件
+def iter_decrypt_files(file_paths, decryptor, output_path_for, workers=DEFAULT_DECRYPT_WORKERS):
+    def decrypt_one(file_path):
+        output_path = output_path_for(file_path)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            return file_path, output_path, decryptor.decrypt_file(file_path, output_path), None
+        except Exception as e:
+            return file_path, None, None, str(e)
+
+    with ThreadPoolExecutor(max(1, workers)) as executor:
+        futures = [executor.submit(decrypt_one, file_path) for file_path in file_paths]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
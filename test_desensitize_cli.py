@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+from docx import Document
+
+import desensitize_cli
+from mask_rules import DEFAULT_RULES_FILE
+
+TEXT = '审计组由张伟、李强组成。'
+
+
+@pytest.fixture
+def cli_paths(tmp_path):
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    document = Document()
+    document.add_paragraph(TEXT)
+    document.save(input_dir / 'report.docx')
+    dictionary = tmp_path / 'dictionary.json'
+    dictionary.write_text(json.dumps({'NR': ['张伟', '李强']}, ensure_ascii=False), encoding='utf-8')
+    with open(DEFAULT_RULES_FILE, encoding='utf-8') as file:
+        config = json.load(file)
+    config['mask'] = '#'
+    rules = tmp_path / 'rules.json'
+    rules.write_text(json.dumps(config, ensure_ascii=False), encoding='utf-8')
+    return input_dir, tmp_path / 'out', dictionary, rules
+
+
+def run_cli(cli_paths, *options):
+    input_dir, output_dir, dictionary, rules = cli_paths
+    code = desensitize_cli.main([str(input_dir), str(output_dir), '--backend', 'rules', '--dictionary', str(dictionary),
+                                 '--rules', str(rules), '--quiet', '--restart', *options])
+    assert code == desensitize_cli.EXIT_OK
+    [output] = [name for name in os.listdir(output_dir) if name.endswith('_report.docx.txt')]
+    with open(output_dir / output, encoding='utf-8') as file:
+        text = file.read()
+    os.remove(output_dir / output)
+    return text
+
+
+def test_mask_from_rules_file_is_kept_unless_overridden(cli_paths):
+    assert run_cli(cli_paths).strip() == '审计组由#、#组成。'
+    assert run_cli(cli_paths, '--mask', '*').strip() == '审计组由*、*组成。'
+
+
+def test_process_pool_writes_the_same_output_as_the_pipeline(cli_paths):
+    input_dir = cli_paths[0]
+    document = Document()
+    for index in range(200):
+        document.add_paragraph(f'第{index}段：' + TEXT * 5)
+    document.save(input_dir / 'long.docx')
+    outputs = []
+    for workers in ('1', '2'):
+        input_dir, output_dir, dictionary, rules = cli_paths
+        code = desensitize_cli.main([str(input_dir), str(output_dir), '--backend', 'rules', '--dictionary',
+                                     str(dictionary), '--rules', str(rules), '--quiet', '--restart',
+                                     '--workers', workers])
+        assert code == desensitize_cli.EXIT_OK
+        texts = {}
+        for name in os.listdir(output_dir):
+            if name.endswith('.docx.txt'):
+                with open(output_dir / name, encoding='utf-8') as file:
+                    texts[name.split('_', 1)[1]] = file.read()
+                os.remove(output_dir / name)
+        outputs.append(texts)
+    assert outputs[0] == outputs[1] and len(outputs[1]) == 2
+    assert '张伟' not in outputs[1]['long.docx.txt']
@@ -0,0 +1,120 @@
+import random
+import re
+
+from desensitize_core import (desensitize_chunks, desensitize_until_stable, iter_desensitized_split_chunks,
+                               split_paragraphs, token_length, LENGTH_UNITS)
+from mask_rules import default_rules
+from run_metrics import RunMetrics
+
+# 桩模型：只识别紧跟在“由”或掩码之后的姓名，前一个姓名被替换后，后面的姓名要到下一遍才能识别，
+# 用来检验多遍脱敏的行为，不需要加载HanLP
+
+SURNAMES = '张李王赵刘'
+GIVEN_NAMES = '伟芳娜敏静强磊军'
+FILLERS = ['审计组由', '经查，', '合同编号12345由', '港口工程有限公司', '同意。', '于2017年签订，']
+
+
+class ChainedNameModel:
+    PATTERN = re.compile(rf'(?<=[由*])[{SURNAMES}][{GIVEN_NAMES}]')
+
+    def recognize(self, chunks):
+        return [[(match.group(), 'NR', match.start(), match.end()) for match in self.PATTERN.finditer(chunk)]
+                for chunk in chunks]
+
+
+def fixture_documents(seed, count=20):
+    rng = random.Random(seed)
+    documents = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(1, 8)):
+            parts = []
+            for _ in range(rng.randint(1, 30)):
+                parts.append(rng.choice(FILLERS))
+                parts.extend(rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES) for _ in range(rng.randint(0, 4)))
+            paragraphs.append(''.join(parts))
+        documents.append(paragraphs)
+    return documents
+
+
+# 旧的做法：每一遍都对全部数据块重新识别
+def every_chunk_every_pass(ner_model, chunks, passes, rules, overlap=0):
+    for _ in range(passes):
+        contexts = None
+        if overlap:
+            contexts = [((chunks[i - 1] if i else '')[-overlap:], (chunks[i + 1] if i + 1 < len(chunks) else '')[:overlap])
+                        for i in range(len(chunks))]
+        chunks = desensitize_chunks(ner_model, chunks, rules=rules, contexts=contexts)
+    return chunks
+
+
+def test_until_stable_matches_every_chunk_every_pass():
+    model = ChainedNameModel()
+    rules = default_rules()
+    second_pass_changes = 0
+    for seed in range(5):
+        for paragraphs in fixture_documents(seed):
+            for overlap in (0, 6):
+                chunks = split_paragraphs(paragraphs, max_length=40, overlap=overlap)
+                expected = every_chunk_every_pass(model, chunks, 2, rules, overlap)
+                assert desensitize_until_stable(model, chunks, 2, rules=rules, overlap=overlap) == expected
+                second_pass_changes += expected != every_chunk_every_pass(model, chunks, 1, rules, overlap)
+    # 语料中确实有第二遍才能识别的姓名，否则这个测试没有意义
+    assert second_pass_changes
+
+
+def ner_calls(chunks, passes, overlap):
+    metrics = RunMetrics()
+    desensitize_until_stable(ChainedNameModel(), chunks, passes, rules=default_rules(), metrics=metrics,
+                             overlap=overlap)
+    return metrics.counters.get('ner_chunks', 0)
+
+
+def test_pre_mask_is_stable_across_passes():
+    chunks = ['合同编号12345，由港口工程有限公司签订。']
+    assert desensitize_until_stable(ChainedNameModel(), chunks, 5) == ['合同编号**，**公司签订。']
+    # 只有正则初步脱敏改动的数据块不再重新识别
+    assert ner_calls(chunks, 5, 0) == 1
+
+
+def test_until_stable_only_reruns_chunks_changed_by_the_model():
+    # 单数块只有公司、编号之类正则规则处理的内容；双数块每一遍识别出一个姓名，又露出下一个，共需识别4遍。
+    # 姓名离两端都超过overlap个字，替换后相邻块的上下文不变
+    chunks = ['港口工程有限公司于2017年签订，合同编号12345。' if index % 2 else
+              '经查，本次审计组由张伟李芳王娜组成，审计期间得到了配合。' for index in range(40)]
+    for overlap in (0, 6):
+        # 旧做法每一遍都识别全部40块，即200次
+        assert ner_calls(chunks, 5, overlap) == 40 + 20 * 3
+        assert ner_calls(chunks, 2, overlap) == 40 + 20
+
+
+def test_until_stable_keeps_first_pass_chunk_boundaries():
+    # 旧代码第二遍之前把输出重新拼接、重新切块；现在沿用第一遍的切块，输出与输入一一对应
+    model = ChainedNameModel()
+    paragraphs = fixture_documents(0)[0]
+    chunks = split_paragraphs(paragraphs, max_length=40, overlap=0)
+    results = desensitize_until_stable(model, chunks, 3)
+    assert len(results) == len(chunks)
+    # 没有重叠上下文时，每个输出块只由对应的输入块决定，与相邻块如何被替换无关
+    for chunk, result in zip(chunks, results):
+        assert result == desensitize_until_stable(model, [chunk], 3)[0]
+
+
+def test_entity_straddling_batch_boundary_is_masked_on_both_sides():
+    from ner_backends import RuleBackend
+    model = RuleBackend(dictionary={'NR': ['张伟']})
+    # 姓名被切在第2、3块之间，batch_size=2时正好也是批次边界
+    chunks = ['审计组组长为', '李强和张', '伟两人。', '同意。']
+    expected = desensitize_until_stable(model, chunks, 1, overlap=6)
+    results = list(iter_desensitized_split_chunks(model, iter(chunks), batch_size=2, overlap=6))
+    assert results == expected
+    assert '张' not in ''.join(results) and '伟' not in ''.join(results)
+
+
+def test_token_length_packs_more_text_per_chunk():
+    paragraph = '经查， ' * 40
+    by_chars = split_paragraphs([paragraph], max_length=40, overlap=0)
+    by_tokens = split_paragraphs([paragraph], max_length=40, overlap=0, length=LENGTH_UNITS['tokens'])
+    assert ''.join(by_tokens) == paragraph
+    assert len(by_tokens) < len(by_chars)
+    assert max(token_length(chunk) for chunk in by_tokens) <= 40
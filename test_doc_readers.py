@@ -0,0 +1,106 @@
+import struct
+import sys
+
+import pytest
+
+import doc_readers
+from doc_readers import read_doc_document, LegacyDocFormatError
+
+# 构造最小的Word 97 .doc：复合文档（[MS-CFB]）中只有WordDocument和1Table两个流，
+# WordDocument开头是FIB，1Table中是片段表；正文由单字节（cp1252）和UTF-16两种片段组成
+
+END_OF_CHAIN = 0xFFFFFFFE
+FREE_SECTOR = 0xFFFFFFFF
+FAT_SECTOR = 0xFFFFFFFD
+NO_STREAM = 0xFFFFFFFF
+SECTOR_SIZE = 512
+# 小于4096字节的流存放在迷你流中，补齐到4096字节以上，只需要普通扇区
+MINI_STREAM_CUTOFF = 4096
+
+
+def directory_entry(name, entry_type, left=NO_STREAM, child=NO_STREAM, start=END_OF_CHAIN, size=0):
+    encoded = (name + '\0').encode('utf-16-le')
+    return (encoded.ljust(64, b'\0') + struct.pack('<HBB3I', len(encoded), entry_type, 1, left, NO_STREAM, child)
+            + b'\0' * 36 + struct.pack('<IQ', start, size))
+
+
+def compound_file(streams):
+    fat = [FAT_SECTOR, END_OF_CHAIN]  # 第0扇区是FAT，第1扇区是目录
+    directory = directory_entry('Root Entry', 5, child=1)
+    sectors = []
+    for index, (name, data) in enumerate(streams, 1):
+        data = data.ljust(max(MINI_STREAM_CUTOFF, -(-len(data) // SECTOR_SIZE) * SECTOR_SIZE), b'\0')
+        start = len(fat)
+        count = len(data) // SECTOR_SIZE
+        fat += list(range(start + 1, start + count)) + [END_OF_CHAIN]
+        left = index + 1 if index < len(streams) else NO_STREAM
+        directory += directory_entry(name, 2, left=left, start=start, size=len(data))
+        sectors.append(data)
+    fat += [FREE_SECTOR] * (SECTOR_SIZE // 4 - len(fat))
+    header = (bytes.fromhex('D0CF11E0A1B11AE1') + b'\0' * 16 + struct.pack('<5H', 0x3E, 3, 0xFFFE, 9, 6) + b'\0' * 6
+              + struct.pack('<9I', 0, 1, 1, 0, MINI_STREAM_CUTOFF, END_OF_CHAIN, 0, END_OF_CHAIN, 0)
+              + struct.pack('<I', 0) + struct.pack('<I', FREE_SECTOR) * 108)
+    return header + struct.pack(f'<{SECTOR_SIZE // 4}I', *fat) + directory.ljust(SECTOR_SIZE, b'\0') + b''.join(sectors)
+
+
+# pieces为[(文本, 是否单字节)]，other_story是正文之后的脚注等其他部分，不应读出
+# piece_table_type不是0x02时片段表损坏
+def make_doc(path, pieces, other_story='', nfib=doc_readers.WORD97_MIN_NFIB, flags=0, piece_table_type=0x02):
+    word = bytearray(0x800)
+    positions = [0]
+    descriptors = []
+    for text, compressed in pieces + [(other_story, False)]:
+        offset = len(word)
+        word += text.encode('cp1252' if compressed else 'utf-16-le')
+        fc = offset * 2 | doc_readers.PCD_COMPRESSED if compressed else offset
+        positions.append(positions[-1] + len(text))
+        descriptors.append(struct.pack('<HIH', 0, fc, 0))
+    plc = struct.pack(f'<{len(positions)}I', *positions) + b''.join(descriptors)
+    # 片段表前放一条Prc，检验跳过格式修改记录
+    clx = b'\x01' + struct.pack('<h', 2) + b'\0\0' + bytes([piece_table_type]) + struct.pack('<I', len(plc)) + plc
+    struct.pack_into('<HH', word, 0, doc_readers.WORD_FIB_IDENT, nfib)
+    struct.pack_into('<H', word, doc_readers.FIB_FLAGS_OFFSET, doc_readers.FIB_WHICH_TABLE_STREAM | flags)
+    struct.pack_into('<i', word, doc_readers.FIB_CCP_TEXT_OFFSET, positions[-1] - len(other_story))
+    struct.pack_into('<II', word, doc_readers.FIB_CLX_OFFSET, 16, len(clx))
+    path.write_bytes(compound_file([('WordDocument', bytes(word)), ('1Table', b'\0' * 16 + clx)]))
+    return str(path)
+
+
+PIECES = [
+    ('Report of 2023\r', True),
+    ('张三去了\x13 HYPERLINK "http://example.com" \x14北京市\x15的审计局。\r表格\x07单元\x07\x07第三段\x1e测试\r', False),
+]
+
+
+def test_reads_word97_paragraphs(tmp_path):
+    path = make_doc(tmp_path / 'sample.doc', PIECES, other_story='脚注\r')
+    # 域代码去掉、只留域结果，单元格结束符分段，不间断连字符换成连字符，脚注不在正文中
+    assert read_doc_document(path) == ['Report of 2023\n', '张三去了北京市的审计局。\n', '表格\n', '单元\n', '\n',
+                                       '第三段-测试\n']
+
+
+@pytest.fixture
+def word_com(monkeypatch):
+    opened = []
+    monkeypatch.setattr(sys, 'platform', 'win32')
+    monkeypatch.setattr(doc_readers, 'read_doc_document_with_word', lambda file_path: opened.append(file_path) or [])
+    return opened
+
+
+def test_only_pre_word97_files_fall_back_to_word(tmp_path, word_com):
+    legacy = make_doc(tmp_path / 'legacy.doc', PIECES, nfib=0x0065)
+    assert read_doc_document(legacy) == [] and word_com == [legacy]
+    # 加密文件交给Word会弹出密码对话框，直接报错
+    encrypted = make_doc(tmp_path / 'encrypted.doc', PIECES, flags=doc_readers.FIB_ENCRYPTED)
+    with pytest.raises(ValueError, match='已加密'):
+        read_doc_document(encrypted)
+    corrupt = make_doc(tmp_path / 'corrupt.doc', PIECES, piece_table_type=0x03)
+    with pytest.raises(ValueError, match='损坏'):
+        read_doc_document(corrupt)
+    assert word_com == [legacy]
+
+
+def test_legacy_format_is_reported_off_windows(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'platform', 'linux')
+    with pytest.raises(LegacyDocFormatError):
+        read_doc_document(make_doc(tmp_path / 'legacy.doc', PIECES, nfib=0x0065))
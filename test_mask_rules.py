@@ -0,0 +1,43 @@
+from mask_rules import default_rules
+
+RULES = default_rules()
+
+
+def test_adjacent_spans_keep_each_replacement():
+    chunk = '张三李四连云港市审计局'
+    entities = [('李四', 'NR', 2, 4), ('张三', 'NR', 0, 2), ('连云港市', 'NS', 4, 8), ('审计局', 'NT', 8, 11)]
+    assert RULES.mask_spans(chunk, entities) == [(0, 11, '******市**局', 'NR+NS+NT')]
+    assert RULES.mask_entities(chunk, entities) == '******市**局'
+
+
+def test_overlapping_spans_collapse_to_one_mask_and_unit_suffix():
+    chunk = '经查连云港市审计局派出'
+    entities = [('连云港市', 'NS', 2, 6), ('港市审计局', 'NT', 4, 9), ('审计', 'NT', 6, 8)]
+    assert RULES.mask_spans(chunk, entities) == [(2, 9, '**局', 'NS+NT')]
+    assert RULES.mask_entities(chunk, entities) == '经查**局派出'
+
+
+def test_non_sensitive_labels_are_kept():
+    assert RULES.mask_spans('2017年', [('2017年', 'DATE', 0, 5)]) == []
+
+
+def test_explicit_replacement_is_used():
+    # 数据块开头是上一块“海州区审计局”的“计局”，单位后缀在块内，保留“局”
+    assert RULES.mask_spans('计局派出', [('计局', 'NT', 0, 2, '**局')]) == [(0, 2, '**局', 'NT')]
+    # 数据块开头只剩后缀“局”，不再加掩码
+    assert RULES.mask_entities('局派出', [('局', 'NT', 0, 1, '局')]) == '局派出'
+
+
+def test_explicit_replacement_survives_overlap():
+    # 实体“连云港市区”被数据块末尾截断，后缀“区”在下一块，块内的“连云港市”不保留“市”；
+    # 模型在块内又识别出“连云港市”，两者重叠
+    chunk = '位于连云港市'
+    entities = [('连云港市', 'NS', 2, 6), ('连云港市', 'NS', 2, 6, '**')]
+    assert RULES.mask_spans(chunk, entities) == [(2, 6, '**', 'NS')]
+    assert RULES.mask_spans(chunk, entities[::-1]) == [(2, 6, '**', 'NS')]
+    # 截断的实体结束得更早时，按结束得最晚的实体计算后缀
+    chunk = '计局长张三'
+    entities = [('计局', 'NT', 0, 2, '**局'), ('局长张三', 'NR', 1, 5)]
+    assert RULES.mask_spans(chunk, entities) == [(0, 5, '**', 'NT+NR')]
+    entities = [('计局', 'NT', 0, 2, '**局'), ('计', 'NT', 0, 1)]
+    assert RULES.mask_spans('计局长', entities) == [(0, 2, '**局', 'NT')]
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+import pytest
+from docx import Document
+
+import desensitize_cli
+import remote_ner
+from desensitize_core import desensitize_chunks, NerError
+import ner_stub_server
+from ner_stub_server import make_server
+from remote_ner import RemoteNerClient, RemoteNerError, CircuitBreaker, coalesce
+
+# 用本地桩服务（ner_stub_server）检验远程NER客户端，桩服务只识别张三、北京市、审计局等固定词表
+
+TEXT = '审计组由张三、李四组成，北京市审计局派出。'
+
+
+@pytest.fixture
+def stub_url():
+    servers = []
+
+    def start(**options):
+        server = make_server(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_address[1]}/ner'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+# 实体在段落开头、结尾、中间，以及没有实体和空段落，合并请求后偏移量要拆回各自段落
+PARAGRAPHS = [
+    '张三',
+    '',
+    '经查，连云港市海州区审计局于2017年派出审计组。',
+    '没有敏感信息的段落。',
+    '审计组由李四、王五组成，组长为张三',
+    '北京市',
+] * 4
+
+
+def test_coalesced_requests_return_offsets_relative_to_each_paragraph(stub_url):
+    served = ner_stub_server.StubHandler.requests_served
+    client = RemoteNerClient(stub_url(), 'token', max_request_chars=60)
+    results = client.recognize(PARAGRAPHS)
+    assert results == [[tuple(entity) for entity in ner_stub_server.recognize(text)] for text in PARAGRAPHS]
+    for text, entities in zip(PARAGRAPHS, results):
+        assert all(text[start:end] == entity for entity, label, start, end in entities)
+    # 24个段落合并成若干请求，每组一个请求
+    groups = coalesce(PARAGRAPHS, 60)
+    assert 1 < len(groups) < len(PARAGRAPHS)
+    assert client.requests_sent == len(groups) == ner_stub_server.StubHandler.requests_served - served
+    client.close()
+
+
+def test_every_paragraph_is_one_request_when_coalescing_is_off(stub_url):
+    client = RemoteNerClient(stub_url(), 'token', max_request_chars=0)
+    assert client.recognize(PARAGRAPHS) == [[tuple(entity) for entity in ner_stub_server.recognize(text)]
+                                           for text in PARAGRAPHS]
+    assert client.requests_sent == len(PARAGRAPHS)
+    client.close()
+
+
+def test_rate_limits_requests_per_second(stub_url):
+    url = stub_url()
+    started = time.perf_counter()
+    client = RemoteNerClient(url, 'token', concurrency=8, rate=20, max_request_chars=0)
+    client.recognize([TEXT] * 30)
+    elapsed = time.perf_counter() - started
+    assert client.requests_sent == 30
+    # 令牌桶容量为20，其余10个请求每秒最多20个，至少需要0.5秒
+    assert elapsed >= 0.45
+    client.close()
+
+
+def failing_fallback(texts):
+    raise RuntimeError('本地模型不可用')
+
+
+def test_retries_then_raises_without_fallback(stub_url):
+    client = RemoteNerClient(stub_url(fail_rate=1.0), 'token', retries=2, backoff=0.01,
+                             breaker=CircuitBreaker(failure_threshold=100))
+    with pytest.raises(RemoteNerError):
+        client.recognize([TEXT])
+    assert client.requests_sent == 3 and client.retries_done == 2 and client.failures == 1
+    client.close()
+
+
+def test_breaker_trips_and_falls_back(stub_url):
+    calls = []
+
+    def fallback(texts):
+        calls.append(texts)
+        return [[] for _ in texts]
+
+    client = RemoteNerClient(stub_url(fail_rate=1.0), 'token', retries=0, max_request_chars=0,
+                             concurrency=1, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+                             fallback=fallback)
+    assert client.recognize([TEXT] * 5) == [[]] * 5
+    # 前两个请求失败后熔断，之后的段落不再请求接口，直接用本地模型
+    assert client.requests_sent == 2 and client.breaker.trips == 1 and client.breaker.state == 'open'
+    assert client.fallbacks == 5 and sum(map(len, calls)) == 5
+    client.close()
+
+
+def test_half_open_probe_closes_breaker_on_success(stub_url):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == 'half-open'
+    client = RemoteNerClient(stub_url(), 'token', breaker=breaker)
+    [entities] = client.recognize([TEXT])
+    assert ('张三', 'PERSON', 4, 6) in entities
+    assert breaker.state == 'closed' and breaker.failures == 0
+    client.close()
+
+
+def test_half_open_probe_failure_reopens_breaker(stub_url):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    client = RemoteNerClient(stub_url(fail_rate=1.0), 'token', retries=0, breaker=breaker,
+                             fallback=lambda texts: [[] for _ in texts])
+    client.recognize([TEXT])
+    assert breaker.trips == 2 and breaker.opened_at is not None and not breaker._probing
+    client.close()
+
+
+def test_probe_ending_with_unexpected_error_does_not_wedge_breaker(stub_url):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    client = RemoteNerClient(stub_url(), 'token', breaker=breaker)
+    fetch = client.fetch
+    client.fetch = lambda text: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        client.recognize([TEXT])
+    # 试探结束后可以再次试探，成功后恢复
+    client.fetch = fetch
+    client.recognize([TEXT])
+    assert breaker.state == 'closed'
+    client.close()
+
+
+def test_ner_failure_is_raised_instead_of_writing_pre_masked_text(stub_url):
+    client = RemoteNerClient(stub_url(fail_rate=1.0), 'token', retries=0, fallback=failing_fallback)
+    with pytest.raises(NerError):
+        desensitize_chunks(client, [TEXT])
+    client.close()
+
+
+def test_cli_reports_failure_when_remote_and_fallback_fail(stub_url, tmp_path, monkeypatch):
+    def unavailable(model):
+        raise ImportError('没有安装HanLP')
+
+    monkeypatch.setattr(remote_ner, 'get_ner_model', unavailable)
+    input_dir = tmp_path / 'in'
+    output_dir = tmp_path / 'out'
+    input_dir.mkdir()
+    document = Document()
+    document.add_paragraph(TEXT)
+    document.save(input_dir / 'report.docx')
+    code = desensitize_cli.main([str(input_dir), str(output_dir), '--backend', 'hanlp-rest', '--quiet',
+                                 '--api-url', stub_url(fail_rate=1.0), '--api-token', 'token'])
+    assert code == desensitize_cli.EXIT_PARTIAL_FAILURE
+    assert [name for name in os.listdir(output_dir) if not name.startswith('.')] == []
@@ -0,0 +1,43 @@
+import os
+
+import result_cache
+from result_cache import ResultCache
+
+
+def write_output(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_text('*' * size, encoding='utf-8')
+    return str(path)
+
+
+def test_store_evicts_least_recently_used_down_to_low_water_mark(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=1000)
+    for index in range(10):
+        cache.store(f'{index:064x}', write_output(tmp_path, f'{index}.txt', 100))
+    # 恢复过的结果最近使用，不被淘汰
+    assert cache.restore(f'{0:064x}', str(tmp_path / 'restored.txt'))
+    cache.store(f'{10:064x}', write_output(tmp_path, '10.txt', 100))
+    # 超过上限后一次淘汰到900字节以下，而不是刚好回到上限
+    assert cache.evictions == 2 and cache._size == 900
+    assert not cache.restore(f'{1:064x}', str(tmp_path / 'restored.txt'))
+    assert not cache.restore(f'{2:064x}', str(tmp_path / 'restored.txt'))
+    assert cache.restore(f'{0:064x}', str(tmp_path / 'restored.txt'))
+    # 接下来的一次写入仍在上限以内，不再淘汰
+    cache.store(f'{11:064x}', write_output(tmp_path, '11.txt', 100))
+    assert cache.evictions == 2
+
+
+def test_store_does_not_walk_the_cache_directory(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=500)
+    for index in range(5):
+        cache.store(f'{index:064x}', write_output(tmp_path, f'{index}.txt', 100))
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(result_cache.os, 'walk', lambda *args: walks.append(args) or walk(*args))
+    for index in range(5, 50):
+        cache.store(f'{index:064x}', write_output(tmp_path, f'{index}.txt', 100))
+    assert walks == []
+    # 重新打开时从目录重建索引
+    monkeypatch.undo()
+    reopened = ResultCache(str(tmp_path / 'cache'), max_bytes=500)
+    assert reopened._size == cache._size <= 500
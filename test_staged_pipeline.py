@@ -0,0 +1,96 @@
+import os
+
+from desensitize_core import desensitize_paragraphs
+from doc_readers import EmptyDocumentError
+from ner_backends import RuleBackend
+from run_metrics import RunMetrics
+from staged_pipeline import desensitize_pipeline, FileTask
+
+MODEL = RuleBackend(dictionary={'NR': ['张伟', '李强'], 'NS': ['连云港市']})
+PARAGRAPH = '经查，连云港市审计组由张伟、李强两人组成，于2017年签订合同。'
+
+
+def documents():
+    return {f'doc{index}': [PARAGRAPH * (index % 5 + 1)] * (index * 7 % 40 + 1) for index in range(12)}
+
+
+def test_pipeline_output_matches_whole_document_desensitization(tmp_path):
+    docs = documents()
+    docs['empty'] = []
+
+    def reader(file_path):
+        if not docs[file_path]:
+            raise EmptyDocumentError(file_path)
+        yield from docs[file_path]
+
+    pipeline = desensitize_pipeline(MODEL, batch_size=4, passes=2, reader=reader, read_workers=2, channel_size=3)
+    tasks = [FileTask(name, os.path.join(tmp_path, name + '.txt')) for name in docs]
+    results = {task.file_path: (task, error) for task, error, seconds in pipeline.run(tasks)}
+    assert isinstance(results.pop('empty')[1], EmptyDocumentError)
+    assert len(results) == len(docs) - 1
+    for name, (task, error) in results.items():
+        assert error is None
+        with open(task.output_file, encoding='utf-8') as file:
+            output = file.read()
+        assert output == ''.join(desensitize_paragraphs(MODEL, docs[name], batch_size=4, passes=2))
+        assert task.chars == len(output)
+        assert '张伟' not in output
+
+
+def test_pipeline_reads_ahead_a_bounded_number_of_paragraphs(tmp_path):
+    read = []
+
+    def reader(file_path):
+        for index in range(2000):
+            read.append(index)
+            yield PARAGRAPH
+
+    masked_length = len(''.join(desensitize_paragraphs(MODEL, [PARAGRAPH])))
+    read_ahead = []
+
+    def writer(output_file, chunks):
+        chars = 0
+        for chunk in chunks:
+            chars += len(chunk)
+            read_ahead.append(len(read) - chars // masked_length)
+        return chars
+
+    pipeline = desensitize_pipeline(MODEL, batch_size=4, reader=reader, writer=writer, channel_size=8)
+    [(task, error, seconds)] = list(pipeline.run([FileTask('big', os.path.join(tmp_path, 'big.txt'))]))
+    assert error is None and task.chars == 2000 * masked_length
+    # 读取阶段最多领先写出阶段两个通道容量加一批数据块，而不是整篇文档
+    assert max(read_ahead) < 40
+
+
+def test_stop_interrupts_a_file_in_progress(tmp_path):
+    read = []
+
+    def reader(file_path):
+        for index in range(100000):
+            read.append(index)
+            if index == 100:
+                pipeline.stop()
+            yield PARAGRAPH
+
+    pipeline = desensitize_pipeline(MODEL, reader=reader, writer=lambda output_file, chunks: sum(map(len, chunks)))
+    tasks = (FileTask(str(index), os.path.join(tmp_path, f'{index}.txt')) for index in range(3))
+    assert [task.chars for task, error, seconds in pipeline.run(tasks) if error is None] == []
+    assert len(read) < 1000
+
+
+def test_record_task_adds_per_file_metrics(tmp_path):
+    def reader(file_path):
+        if file_path == 'broken':
+            raise OSError('无法读取')
+        yield PARAGRAPH
+
+    pipeline = desensitize_pipeline(MODEL, reader=reader)
+    metrics = RunMetrics()
+    tasks = [FileTask(name, os.path.join(tmp_path, name + '.txt')) for name in ('ok', 'broken')]
+    for task, error, seconds in pipeline.run(tasks):
+        metrics.record_task(task, error, seconds)
+    records = {record['file']: record for record in metrics.files}
+    assert records['ok']['status'] == 'ok' and records['ok']['chars'] > 0 and 'ner' in records['ok']['stages']
+    assert records['broken']['status'] == 'error' and records['broken']['error'] == '无法读取'
+    assert metrics.counters['files_ok'] == 1 and metrics.counters['files_error'] == 1
+    assert metrics.counters['ner_chunks'] >= 1
@@ -1,16 +1,24 @@
 import sys
-import re
 import os
 import random
 import string
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QProgressBar, QTextEdit, QFileDialog
+import threading
+import time
+from itertools import chain
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QProgressBar, QTextEdit, QFileDialog, QSpinBox
 from PyQt5.QtCore import QThread, pyqtSignal, QObject
-from pathlib import Path
-from PyPDF2 import PdfReader
-import pythoncom
-from win32com import client
-from docx import Document
-import hanlp
+import multiprocessing
+from desensitize_core import DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH, DEFAULT_OVERLAP
+from doc_readers import deal_path, EmptyDocumentError
+from file_discovery import FileDiscovery
+from process_pool import DocumentPool
+from result_cache import ResultCache, file_digest
+from mask_rules import default_rules
+from model_loader import get_ner_model, is_model_loaded, preload_ner_model, mark_startup, startup_report
+from run_metrics import RunMetrics
+from batch_scheduler import BatchScheduler, WINDOW_BATCHES
+from job_manifest import JobManifest, STATUS_DONE, STATUS_SKIPPED, STATUS_ERROR
+from staged_pipeline import desensitize_pipeline, FileTask
 
 if getattr(sys, 'frozen', False):
     application_path = sys._MEIPASS
@@ -21,75 +29,12 @@ huggingface_cache_path = os.path.join(application_path, 'huggingface')
 os.environ['TRANSFORMERS_CACHE'] = huggingface_cache_path
 
 model_path = os.path.join(application_path, 'ner_bert_base_msra_20211227_114712')
-hanlp_ner_model = hanlp.load(model_path)
 
-def split_text(text, max_length):
-    sentences = re.split(r'(?<=[。，”“！？\?!])', text)
-    current_chunk = ""
-    chunks = []
-
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) <= max_length:
-            current_chunk += sentence
-        else:
-            if current_chunk:
-                chunks.append(current_chunk)
-            if len(sentence) > max_length:
-                sub_chunks = [sentence[i:i+max_length] for i in range(0, len(sentence), max_length)]
-                chunks.extend(sub_chunks)
-            else:
-                current_chunk = sentence
-
-    if current_chunk:
-        chunks.append(current_chunk)
-
-    return chunks
-
-def read_pdf_document(file_path):
-    with open(file_path, 'rb') as file:
-        reader = PdfReader(file)
-        num_pages = len(reader.pages)
-        paras = [reader.pages[page].extract_text() + '\n' for page in range(num_pages)]
-        if all(para.isspace() for para in paras):
-            return 'PDF文件为空'
-        else:
-            return paras
-        
-def deal_path(path):
-    path = path.replace('\\', '/')
-    return path 
-
-def read_doc_document(file_path):
-    word = client.Dispatch("Word.Application")
-    word.Visible = False  # Word应用程序在后台运行，不显示界面
-    file_path = file_path.replace('/', '\\')
-    doc = word.Documents.Open(file_path)
-    paragraphs = []
-    temp_para = ''
-    for para in doc.Paragraphs:
-        if para.Range.Text.strip().isspace():
-            continue
-        temp_para += para.Range.Text.strip() + '\n'  # 使用'\n'来分隔每个段落
-        if len(temp_para) > 126:
-            paragraphs.append(temp_para)
-            temp_para = ''
-    if temp_para:  # 如果最后还有剩余的段落，也添加到列表中
-        paragraphs.append(temp_para)
-    doc.Close(False)
-    word.Quit()
-    return paragraphs
-
-
-#检查文件格式并且返回段落文本
-def read_file_context(file_path):
-    if file_path.endswith('.docx'):
-        paragraphs = read_word_document(file_path)
-    elif file_path.endswith('.pdf'):
-        paragraphs = read_pdf_document(file_path)
-    elif file_path.endswith('.doc'):
-        print('正在处理doc文件')
-        paragraphs = read_doc_document(file_path)
-    return paragraphs
+RULES = default_rules()
+# 最多脱敏遍数，第二遍只处理第一遍有变化的数据块
+PASSES = 2
+# 查找文件时，界面上的已找到数量的刷新间隔（秒）
+SCAN_REPORT_INTERVAL = 0.2
 
 class ProgressSignal(QObject):
     progress_updated = pyqtSignal(int)
@@ -97,76 +42,207 @@ class ProgressSignal(QObject):
 class DesensitizeThread(QThread):
     finished = pyqtSignal(str)
     progress_updated = pyqtSignal(int)
+    scan_updated = pyqtSignal(int, bool)  # 已找到的文件数、是否查找完毕
 
-    def __init__(self, input_file_path, output_file_path):
+    def __init__(self, input_file_path, output_file_path, batch_size=DEFAULT_BATCH_SIZE, workers=1):
         super().__init__()
         self.input_file_path = input_file_path
         self.output_file_path = output_file_path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.cache = None
+        self.discovery = None
+        self.metrics = RunMetrics()
+        self.scheduler = None
+        self.pipeline = None
+        self.manifest = None
+        # 每个文件的内容哈希只算一次，缓存键和任务清单共用
+        self.digests = {}
+        self.files_done = 0
+        self._progress = 0
+        self._progress_lock = threading.Lock()
         self._is_running = True
 
     def run(self):
         try:
-            file_paths = self._get_file_paths(self.input_file_path)
-            total_files = len(file_paths)
-            if total_files == 0:
-                raise FileNotFoundError("没有检测到可以于脱敏的文件！")
-
-            for file_index, file_path in enumerate(file_paths):
-                file_path = deal_path(file_path)
-                if not self._is_running:
-                    self._clean_up_and_exit()  # 清理并退出线程
-                    return
-                try:
-                    paragraphs = read_file_context(file_path)
-                    if paragraphs == 'PDF文件为空':
-                        continue
-                except Exception as e:
-                    continue
-                desensitized_paragraphs = []
-                print(f'正在脱敏文件：{file_path}')
-                for paragraph in paragraphs:
-                    if not self._is_running:
-                        self._clean_up_and_exit()  # 清理并退出线程
-                        return
-                    chunks = split_text(paragraph, max_length=126)
-                    for chunk in chunks:
-                        desensitized_chunk = self._process_chunk(chunk)
-                        #执行2次脱敏
-                        desensitized_chunk = self._process_chunk(desensitized_chunk)
-                        desensitized_paragraphs.append(desensitized_chunk)
-
-                desensitized_text = ''.join(desensitized_paragraphs)
-                self._save_desensitized_file(file_path, desensitized_text)
-                self._update_progress(file_index, total_files)
-                
-                if not self._is_running:
-                    self._clean_up_and_exit()  # 清理并退出线程
-                    return
-
-            self.finished.emit("脱敏完成. 结果保存至: " + self.output_file_path)
+            # 边查找边处理，文件夹只遍历一次，不等遍历完；进度的总数随查找增加
+            self.discovery = FileDiscovery(self.input_file_path)
+            # 未改动的文件直接复用上次的脱敏结果。缓存目录可能很大，在本线程中建立，不阻塞界面
+            self.cache = ResultCache(model=model_path,
+                                     variant=f'{RULES.fingerprint}|{PASSES}|{DEFAULT_MAX_LENGTH}|{DEFAULT_OVERLAP}|chars')
+            # 任务清单记录每个文件的处理结果，中途停止或崩溃后再次运行时跳过已完成的文件
+            self.manifest = JobManifest.for_output(self.output_file_path)
+            self.manifest.clean_temp_files()
+
+            if self.workers > 1:
+                self._run_with_pool()
+            else:
+                self._run_with_pipeline()
         except Exception as e:
             self.finished.emit("Error: " + str(e))
-
-    def _process_chunk(self, chunk):
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.close()
+            if self.manifest is not None:
+                self.manifest.close()
+
+    # 单线程批量处理只有一个提交方，不需要等待凑批
+    def _get_scheduler(self):
+        if self.scheduler is None:
+            self.scheduler = BatchScheduler(get_ner_model(model_path), self.batch_size, max_wait=0)
+        return self.scheduler
+
+    # 边查找边跳过任务清单中已完成的文件、直接复制命中缓存的结果，其余的交给流水线或进程池。
+    # 两者都在后台线程中逐个取文件，所以这里的清单记录和进度更新都要能在其他线程中调用
+    def _pending_inputs(self, cache_keys):
+        last_report = 0
+        for file_path in self.discovery:
+            if not self._is_running:
+                return
+            now = time.monotonic()
+            if now - last_report >= SCAN_REPORT_INTERVAL:
+                last_report = now
+                self.scan_updated.emit(self.discovery.found, False)
+            file_path = deal_path(file_path)
+            if self.manifest.is_done(file_path):
+                self.metrics.count('files_resumed')
+                self._file_done()
+                continue
+            output_file = self._new_output_file(file_path)
+            try:
+                self.digests[file_path] = file_digest(file_path)
+                cache_keys[file_path] = self.cache.key_for(file_path, self.digests[file_path])
+                restored = self.cache.restore(cache_keys[file_path], output_file)
+            except OSError:
+                restored = False  # 读取失败的文件交给进程池，由其报告错误
+            if restored:
+                self.manifest.record(file_path, STATUS_DONE, output_file, sha256=self.digests[file_path])
+                self._file_done()
+            else:
+                yield file_path
+        self.scan_updated.emit(self.discovery.found, True)
+        self._file_done(0)  # 查找结束后总数确定，最后的文件已经处理完时进度到100%
+
+    # 找到第一个需要脱敏的文件后才返回，全部已完成或命中缓存时不加载模型、不启动流水线或进程池
+    def _first_pending(self, inputs):
+        first = next(inputs, None)
+        if first is None:
+            if self.discovery.found == 0:
+                raise FileNotFoundError("没有检测到可以于脱敏的文件！")
+            if not self._is_running:
+                self._clean_up_and_exit()
+            else:
+                self.finished.emit(self._finished_message())
+        return first
+
+    # 单进程模式：读取、切块、识别、写出分成流水线的几个阶段，读下一个文件时模型同时识别当前文件。
+    # 最多执行2次脱敏，第二次只处理第一次有变化的数据块；每次提交几批数据块，由调度器按长度分桶后送入模型
+    def _run_with_pipeline(self):
+        cache_keys = {}
+        inputs = self._pending_inputs(cache_keys)
+        first = self._first_pending(inputs)
+        if first is None:
+            return
+        self.pipeline = desensitize_pipeline(self._get_scheduler(), max_length=DEFAULT_MAX_LENGTH,
+                                             batch_size=self.batch_size * WINDOW_BATCHES, rules=RULES, passes=PASSES,
+                                             overlap=DEFAULT_OVERLAP)
+        if not self._is_running:
+            self.pipeline.stop()
+        tasks = (FileTask(file_path, self._new_output_file(file_path)) for file_path in chain([first], inputs))
+        results = self.pipeline.run(tasks)
+        for task, error, seconds in results:
+            if not self._is_running:
+                break
+            self.metrics.merge(task.metrics.stats())
+            record = {'file': task.file_path, 'status': 'ok'}
+            if isinstance(error, EmptyDocumentError):
+                record['status'] = 'skipped'
+                self.manifest.record(task.file_path, STATUS_SKIPPED, sha256=self.digests.get(task.file_path))
+            elif error is not None:
+                record.update(status='error', error=str(error))
+                self.manifest.record(task.file_path, STATUS_ERROR, error=str(error))
+            else:
+                record['chars'] = task.chars
+                self.manifest.record(task.file_path, STATUS_DONE, task.output_file,
+                                     sha256=self.digests.get(task.file_path))
+                if task.file_path in cache_keys:
+                    self.cache.store(cache_keys[task.file_path], task.output_file)
+            self.metrics.record_file(record, sum(seconds.values()), task.metrics.stage_seconds)
+            self._file_done()
+        # 停止时等待各阶段退出；已经写出但还没记录的文件下次运行时重新处理
+        results.close()
+        if not self._is_running:
+            self._clean_up_and_exit()
+            return
+        self.finished.emit(self._finished_message())
+
+    # 多进程模式：文件分发给进程池，工作进程直接写出结果，本线程记录结果并更新进度
+    def _run_with_pool(self):
+        cache_keys = {}
+        inputs = self._pending_inputs(cache_keys)
+        first = self._first_pending(inputs)
+        if first is None:
+            return
+        pool = DocumentPool(model_path, self.workers, passes=PASSES, batch_size=self.batch_size,
+                            max_length=DEFAULT_MAX_LENGTH, rules=RULES, overlap=DEFAULT_OVERLAP)
+        output_files = {}
+
+        def tasks():
+            for file_path in chain([first], inputs):
+                output_files[file_path] = self._new_output_file(file_path)
+                yield file_path, output_files[file_path]
+
+        results = pool.imap(tasks())
+        for file_path, chars, error, stats in results:
+            if not self._is_running:
+                results.close()  # 终止所有工作进程，未写完的临时文件下次运行时清理
+                self._clean_up_and_exit()
+                return
+            output_file = output_files.pop(file_path)
+            self.metrics.merge(stats)
+            record = {'file': file_path, 'status': 'ok'}
+            if error:
+                record.update(status='error', error=error)
+                self.manifest.record(file_path, STATUS_ERROR, error=error)
+            elif chars is not None:
+                record['chars'] = chars
+                self.manifest.record(file_path, STATUS_DONE, output_file, sha256=self.digests.get(file_path))
+                if file_path in cache_keys:
+                    self.cache.store(cache_keys[file_path], output_file)
+            else:
+                self.manifest.record(file_path, STATUS_SKIPPED, sha256=self.digests.get(file_path))
+            self.metrics.record_file(record, sum(stats['stages'].values()), stats['stages'])
+            self._file_done()
+        self.finished.emit(self._finished_message())
+
+    def _finished_message(self):
+        message = "脱敏完成. 结果保存至: " + self.output_file_path + "\n" + self.cache.summary()
+        message += f"\n共找到{self.discovery.found}个文件（扫描{self.discovery.directories}个文件夹，跳过重复文件{self.discovery.duplicates}个）"
+        self.metrics.add_counters('discovery_', self.discovery, ['found', 'duplicates', 'directories', 'errors'])
+        self.metrics.add_counters('result_cache_', self.cache, ['hits', 'misses', 'evictions'])
+        if is_model_loaded(model_path):
+            message += "\n" + get_ner_model(model_path).summary()
+            self.metrics.add_counters('ner_cache_', get_ner_model(model_path), ['hits', 'misses'])
+        if self.pipeline is not None:
+            message += "\n" + self.pipeline.summary()
+            self.pipeline.add_counters(self.metrics)
+        if self.scheduler is not None:
+            message += "\n" + self.scheduler.summary()
+            self.metrics.add_counters('scheduler_', self.scheduler, ['batches', 'chunks', 'padding_chars', 'full_batches'])
+        failed = self.metrics.counters.get('files_error', 0)
+        if failed:
+            message += f"\n脱敏失败{failed}个文件：" + "，".join(
+                record['file'] for record in self.metrics.files if record['status'] == 'error')
         try:
-            chunk = re.sub(r'(编号)\d+|\w*公司', lambda m: '*公司' if '公司' in m.group() else m.group(1) + '*', chunk)
-            entities = hanlp_ner_model(chunk)
-            desensitized_chunk = chunk
-            for entity in reversed(entities):
-                entity_text, label, start, end = entity
-                if label in ['NS', 'NT', 'NR']:
-                    unit = re.search(r'(局|公司|工程|省|市|县|区|社区)$', entity_text)
-                    if unit:
-                        replacement = '*' + unit.group()
-                        desensitized_chunk = desensitized_chunk[:start] + replacement + desensitized_chunk[end:]
-                    else:
-                        desensitized_chunk = desensitized_chunk[:start] + '*' + desensitized_chunk[end:]
-            return desensitized_chunk
-        except Exception as e:
-            return chunk
+            self.metrics.save()
+        except OSError as e:
+            message += "\n运行指标写入失败：" + str(e)
+        return message
 
     def stop(self):
         self._is_running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
 
     def _clean_up_and_exit(self):
         if hasattr(self, 'file'):
@@ -174,38 +250,25 @@ class DesensitizeThread(QThread):
             del self.file
         self.finished.emit("任务已停止。")
 
-    def _get_file_paths(self, input_path):
-        file_paths = []
-        for root, dirs, files in os.walk(input_path):
-            for file in files:
-                if file.lower().endswith(('doc', 'docx', 'pdf')) and not file.startswith('~$') and not file.startswith('.'):
-                    file_path = os.path.join(root, file)
-                    file_paths.append(file_path)
-        return file_paths
-
 
-
-    def _save_desensitized_file(self, original_file_path, desensitized_text):
+    def _new_output_file(self, original_file_path):
         new_file_name = ''.join(random.choices(string.ascii_letters + string.digits, k=8)) + '_' + os.path.basename(original_file_path) + '.txt'
-        output_file = os.path.join(self.output_file_path, new_file_name)
-        write_to_text_file(output_file, desensitized_text)
-
-    def _update_progress(self, current_index, total_files):
-        progress = int((current_index + 1) / total_files * 100)
-        self.progress_updated.emit(progress)
+        return os.path.join(self.output_file_path, new_file_name)
 
-def read_word_document(file_path):
-    doc = Document(file_path)
-    return [para.text + '\n' for para in doc.paragraphs]
+    # 查找还没结束时按已找到的文件数计算进度，不显示100%；找到更多文件时进度条不后退
+    def _file_done(self, count=1):
+        with self._progress_lock:
+            self.files_done += count
+            total_files = max(self.discovery.found, self.files_done) + (not self.discovery.done)
+            self._progress = max(self._progress, int(self.files_done / total_files * 100))
+            self.progress_updated.emit(self._progress)
 
-def write_to_text_file(file_path, content):
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
 
 class MyApp(QWidget):
     
     trigger_select_input_file = pyqtSignal(str)
     trigger_select_output_file = pyqtSignal(str)
+    model_loaded = pyqtSignal(str)
     
     def __init__(self):
         super().__init__()
@@ -225,6 +288,9 @@ class MyApp(QWidget):
         btn_upload = QPushButton('上传包含docx文件的文件夹')
         layout.addWidget(btn_upload)
 
+        self.scan_status = QLabel()
+        layout.addWidget(self.scan_status)
+
         self.input2 = QLineEdit()
         self.input2.setPlaceholderText('请选择脱敏文件的输出位置')
         layout.addWidget(self.input2)
@@ -235,6 +301,12 @@ class MyApp(QWidget):
         self.progress = QProgressBar()
         layout.addWidget(self.progress)
 
+        layout.addWidget(QLabel('并行进程数（1为单进程）'))
+        self.workers_input = QSpinBox()
+        self.workers_input.setRange(1, os.cpu_count() or 1)
+        self.workers_input.setValue(1)
+        layout.addWidget(self.workers_input)
+
         btn_start = QPushButton('开始脱敏')
         btn_stop = QPushButton('停止')
         layout.addWidget(btn_start)
@@ -245,6 +317,10 @@ class MyApp(QWidget):
     
         self.setLayout(layout)
 
+        # 窗口先显示，模型在后台线程中加载
+        self.model_loaded.connect(self.on_model_loaded)
+        preload_ner_model(model_path, lambda error: self.model_loaded.emit(error or ''))
+
         btn_upload.clicked.connect(self.upload)
         btn_select_output.clicked.connect(self.select_output)
         btn_start.clicked.connect(self.start_process)
@@ -257,19 +333,20 @@ class MyApp(QWidget):
         file_path = QFileDialog.getExistingDirectory(self, '选择文件夹', '')
 
         if file_path:
+            # 不在这里遍历文件夹：开始脱敏后边查找边处理，找到的数量显示在下方
+            self.input_file_path = file_path
+            self.input1.setText(file_path)
+            self.scan_status.setText("")
             self.log_text.append(f"已选择文件夹：{file_path}")
-            docx_files = [os.path.join(root, f) 
-                        for root, dirs, files in os.walk(file_path) 
-                        for f in files if f.lower().endswith(('.docx', '.pdf', '.doc')) and not f.startswith('~$') and not f.startswith('.')]
-            if docx_files:
-                self.input_file_path = file_path
-                self.input1.setText(file_path)
-                self.log_text.append("文件夹内可以脱敏的文件有：" + str(len(docx_files)) + "个 \n" + "\n".join(docx_files))
-            else:
-                self.log_text.append("选择的文件夹内没有docx文件。")
         else:
             self.log_text.append("未选择文件夹。")
 
+    def scan_updated(self, count, done):
+        if done:
+            self.scan_status.setText(f"共找到{count}个可以脱敏的文件")
+        else:
+            self.scan_status.setText(f"正在查找可以脱敏的文件，已找到{count}个……")
+
 
     def select_output(self):
         file_path = QFileDialog.getExistingDirectory(self, '选择输出文件夹')
@@ -283,9 +360,11 @@ class MyApp(QWidget):
     
     def start_process(self):
         if self.input_file_path and self.output_file_path:
-            self.desensitize_thread = DesensitizeThread(self.input_file_path, self.output_file_path)
+            self.desensitize_thread = DesensitizeThread(self.input_file_path, self.output_file_path,
+                                                        workers=self.workers_input.value())
             
             self.desensitize_thread.progress_updated.connect(self.update_progress)
+            self.desensitize_thread.scan_updated.connect(self.scan_updated)
             self.desensitize_thread.finished.connect(self.process_finished)
 
             self.desensitize_thread.start()
@@ -309,10 +388,20 @@ class MyApp(QWidget):
 
     def process_finished(self, message):
         self.log_text.setText(message)
+        self.log_text.append(startup_report())
+
+    def on_model_loaded(self, error):
+        if error:
+            self.log_text.append("模型加载失败：" + error)
+        else:
+            self.log_text.append("模型加载完成。" + startup_report())
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # PyInstaller打包后子进程需要
     app = QApplication(sys.argv)
     ex = MyApp()
     ex.show()
+    mark_startup('window')
+    ex.log_text.append(startup_report() + '，模型正在后台加载。')
     sys.exit(app.exec_())
 
@@ -1,11 +1,15 @@
 import gradio as gr
-from docx import Document
-import hanlp
-from hanlp.pretrained.ner import MSRA_NER_BERT_BASE_ZH
-import re
 import io
+from doc_readers import read_word_document
+from model_loader import preload_ner_model, MSRA_NER_BERT_BASE_ZH
+from desensitize_core import desensitize_documents
+from ner_backends import LocalHanlpBackend
+from batch_scheduler import BatchScheduler
 
-hanlp_ner_model = hanlp.load(MSRA_NER_BERT_BASE_ZH)
+NER_MODEL = MSRA_NER_BERT_BASE_ZH
+# 同时处理的请求数，这些请求的数据块由调度器按长度分桶后合并成批送入模型
+CONCURRENCY = 4
+SCHEDULER = BatchScheduler(LocalHanlpBackend(NER_MODEL))
 
 
 def desensitize_docx(uploaded_files):
@@ -13,31 +17,19 @@ def desensitize_docx(uploaded_files):
 
     for uploaded_file in uploaded_files:
         # 读取上传的 .docx 文件
-        doc = Document(io.BytesIO(uploaded_file))
-        paragraphs = [para.text for para in doc.paragraphs]
+        paragraphs = read_word_document(io.BytesIO(uploaded_file), line_end='')
         # 脱敏处理
-        desensitized_paragraphs = [desensitize_with_hanlp(paragraph) for paragraph in paragraphs]
-        desensitized_text = '\n'.join(desensitized_paragraphs)
+        desensitized_text = '\n'.join(desensitize_with_hanlp(paragraphs))
         desensitized_texts.append(desensitized_text)
 
     return "\n\n---\n\n".join(desensitized_texts)  # 将多个文件的结果分隔开
 
-def desensitize_with_hanlp(text):
+# 每个段落作为一个文档切块，整篇一起提交给调度器，结果按段落拆回；实体类型和单位后缀见mask_rules.json
+def desensitize_with_hanlp(paragraphs):
     try:
-        entities = hanlp_ner_model(text)
-        desensitized_text = text
-        for entity in reversed(entities):
-            entity_text, label, start, end = entity
-            if label in ['PERSON', 'LOCATION']:  # 根据需要调整实体类型
-                unit = re.search(r'(局|公司|工程|省|市|县|区|街道|社区|小区|花园|苑)$', entity_text)
-                if unit:
-                    replacement = '**' + unit.group()
-                    desensitized_text = desensitized_text[:start] + replacement + desensitized_text[end:]
-                else:
-                    desensitized_text = desensitized_text[:start] + '**' + desensitized_text[end:]
-        return desensitized_text
+        return [''.join(chunks) for chunks in desensitize_documents(SCHEDULER, [[paragraph] for paragraph in paragraphs])]
     except Exception as e:
-        return "Error in desensitizing: " + str(e)
+        return ["Error in desensitizing: " + str(e)]
 
 # 创建 Gradio 应用
 gr_interface = gr.Interface(
@@ -47,5 +39,7 @@ gr_interface = gr.Interface(
     outputs="text"
 )
 
-# 运行应用
+# 运行应用，模型在后台加载，页面可以先打开
+preload_ner_model(NER_MODEL)
+gr_interface.queue(default_concurrency_limit=CONCURRENCY)
 gr_interface.launch()
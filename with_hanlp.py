@@ -1,38 +1,19 @@
 import sys
-import re
 import os
 import random
 import string
+from contextlib import closing
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QProgressBar, QTextEdit, QFileDialog
 from PyQt5.QtCore import QThread, pyqtSignal, QObject
 from docx import Document
-import hanlp
-from hanlp.pretrained.ner import MSRA_NER_BERT_BASE_ZH
+from desensitize_core import DEFAULT_BATCH_SIZE
+from doc_readers import write_chunks_to_text_file
+from staged_pipeline import desensitize_pipeline, FileTask
+from run_metrics import RunMetrics
+from model_loader import get_ner_model, preload_ner_model, mark_startup, startup_report, MSRA_NER_BERT_BASE_ZH
 
-hanlp_ner_model = hanlp.load(MSRA_NER_BERT_BASE_ZH)
-# hanlp_ner_model = hanlp.load(r'ner\ner_bert_base_msra_20211227_114712')
-
-def split_text(text, max_length):
-    sentences = re.split(r'(?<=[。，”“！？\?!])', text)
-    current_chunk = ""
-    chunks = []
-
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) <= max_length:
-            current_chunk += sentence
-        else:
-            if current_chunk:
-                chunks.append(current_chunk)
-            if len(sentence) > max_length:
-                sub_chunks = [sentence[i:i+max_length] for i in range(0, len(sentence), max_length)]
-                chunks.extend(sub_chunks)
-            else:
-                current_chunk = sentence  # 用新句子开始新的chunks
-
-    if current_chunk:
-        chunks.append(current_chunk)
-
-    return chunks
+NER_MODEL = MSRA_NER_BERT_BASE_ZH
+# NER_MODEL = r'ner\ner_bert_base_msra_20211227_114712'
 
 
 # 更新进度条
@@ -43,10 +24,13 @@ class DesensitizeThread(QThread):
     finished = pyqtSignal(str)
     progress_updated = pyqtSignal(int)
 
-    def __init__(self, input_file_path, output_file_path):
+    def __init__(self, input_file_path, output_file_path, batch_size=DEFAULT_BATCH_SIZE):
         super().__init__()
         self.input_file_path = input_file_path
         self.output_file_path = output_file_path
+        self.batch_size = batch_size
+        self.pipeline = None
+        self.metrics = RunMetrics()
         self._is_running = True
 
     def run(self):
@@ -56,51 +40,23 @@ class DesensitizeThread(QThread):
             if total_files == 0:
                 raise FileNotFoundError("没有检测到.docx文件！")
 
-            for file_index, file_path in enumerate(file_paths):
-                if not self._is_running:
-                    break
-
-                paragraphs = read_word_document(file_path)
-                desensitized_paragraphs = []
-
-                for paragraph in paragraphs:
-                    chunks = split_text(paragraph, max_length=126)
-                    for chunk in chunks:
-                        desensitized_chunk = self._process_chunk(chunk)
-                        desensitized_paragraphs.append(desensitized_chunk)
-
-                desensitized_text = '\n'.join(desensitized_paragraphs)
-                self._save_desensitized_file(file_path, desensitized_text)
-                self._update_progress(file_index, total_files)
-
-            self.finished.emit("脱敏完成. 结果保存至: " + self.output_file_path)
-        except Exception as e:
-            self.finished.emit("Error: " + str(e))
-            
-    def _process_chunk(self, chunk):
-        try:
-            chunk = re.sub(r'(编号)\d+|\w*公司', lambda m: '**公司' if '公司' in m.group() else m.group(1) + '**', chunk)
-            entities = hanlp_ner_model(chunk)
-            desensitized_chunk = chunk
-            for entity in reversed(entities):
-                # print(entity)
-                entity_text, label, start, end = entity
-                if label in ['NS', 'NT', 'NR']:
-                    
-                    # print(entity_text, label, start, end)
-                    desensitized_chunk = desensitized_chunk[:start] + '**' + desensitized_chunk[end:]
-                    unit = re.search(r'(局|公司|工程|省|市|县|区)$', entity_text)
-                    if unit:
-                        replacement = '**' + unit.group()
-                        desensitized_chunk = desensitized_chunk[:start] + replacement + desensitized_chunk[end:]
-                        # if "社会主义" in desensitized_chunk:
-                        #     print(desensitized_chunk)
-                    else:
-                        desensitized_chunk = desensitized_chunk[:start] + '**' + desensitized_chunk[end:]
-            return desensitized_chunk
+            # 读取、识别、写出分阶段流水执行，读取下一个文件时模型同时识别当前文件
+            self.pipeline = desensitize_pipeline(get_ner_model(NER_MODEL), batch_size=self.batch_size,
+                                                 reader=read_word_document, writer=self._write_desensitized_file)
+            if not self._is_running:
+                self.pipeline.stop()
+            tasks = (FileTask(file_path, self._new_output_file(file_path)) for file_path in file_paths)
+            with closing(self.pipeline.run(tasks)) as results:
+                for file_index, (task, error, seconds) in enumerate(results):
+                    self.metrics.record_task(task, error, seconds)
+                    if error is not None:
+                        raise error
+                    self._update_progress(file_index, total_files)
+
+            self.finished.emit("脱敏完成. 结果保存至: " + self.output_file_path + self._save_metrics())
         except Exception as e:
-            return chunk
-    
+            self.finished.emit("Error: " + str(e) + self._save_metrics())
+
     # def _process_chunk(self, chunk):
     #     try:
             # 识别并标记签发单位
@@ -143,6 +99,8 @@ class DesensitizeThread(QThread):
 
     def stop(self):
         self._is_running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
 
     def _get_file_paths(self, input_path):
         if os.path.isfile(input_path):
@@ -151,31 +109,40 @@ class DesensitizeThread(QThread):
             return [os.path.join(input_path, f) for f in os.listdir(input_path) if f.endswith('.docx') and not f.startswith('~$')]
 
 
-    def _save_desensitized_file(self, original_file_path, desensitized_text):
+    def _new_output_file(self, original_file_path):
         new_file_name = ''.join(random.choices(string.ascii_letters + string.digits, k=8)) + '.txt'
-        output_file = os.path.join(self.output_file_path, new_file_name)
-        write_to_text_file(output_file, desensitized_text)
+        return os.path.join(self.output_file_path, new_file_name)
+
+    # 数据块逐个写出，不在内存中拼接整篇结果
+    def _write_desensitized_file(self, output_file, chunks):
+        return write_chunks_to_text_file(output_file, chunks, separator='\n')
 
     def _update_progress(self, current_index, total_files):
         progress = int((current_index + 1) / total_files * 100)
         self.progress_updated.emit(progress)
 
+    # 运行指标追加写入~/.tuomin/metrics.jsonl，返回附加在完成消息后的提示
+    def _save_metrics(self):
+        if self.pipeline is not None:
+            self.pipeline.add_counters(self.metrics)
+        try:
+            self.metrics.save()
+        except OSError as e:
+            return "\n运行指标写入失败：" + str(e)
+        return ""
+
 
 # 读取Word
 def read_word_document(file_path):
     doc = Document(file_path)
     return [para.text for para in doc.paragraphs]
 
-# 写入
-def write_to_text_file(file_path, content):
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
-
 
 class MyApp(QWidget):
     
     trigger_select_input_file = pyqtSignal(str)
     trigger_select_output_file = pyqtSignal(str)
+    model_loaded = pyqtSignal(str)
     
     def __init__(self):
         super().__init__()
@@ -216,6 +183,10 @@ class MyApp(QWidget):
     
         self.setLayout(layout)
 
+        # 窗口先显示，模型在后台线程中加载
+        self.model_loaded.connect(self.on_model_loaded)
+        preload_ner_model(NER_MODEL, lambda error: self.model_loaded.emit(error or ''))
+
         btn_upload.clicked.connect(self.upload)
         btn_select_output.clicked.connect(self.select_output)
         btn_start.clicked.connect(self.start_process)
@@ -290,10 +261,19 @@ class MyApp(QWidget):
 
     def process_finished(self, message):
         self.log_text.setText(message)
+        self.log_text.append(startup_report())
+
+    def on_model_loaded(self, error):
+        if error:
+            self.log_text.append("模型加载失败：" + error)
+        else:
+            self.log_text.append("模型加载完成。" + startup_report())
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     ex = MyApp()
     ex.show()
+    mark_startup('window')
+    ex.log_text.append(startup_report() + '，模型正在后台加载。')
     sys.exit(app.exec_())
     
\ No newline at end of file